@@ -0,0 +1,116 @@
+"""
+Address clustering on synthetic chains: runtime and peak memory of
+`cluster_addresses` for growing chains (checked against a plain dict
+union-find on the smallest one), and of the array union-find alone on
+tens of millions of elements.
+
+    python benchmarks/bench_address_clustering.py --blocks 10 40 --txs 2000 --elements 20000000
+"""
+import argparse
+import os
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from common import PIPELINE_DIR, timer, working_directory
+from synthetic import SyntheticChain
+
+import block_cache
+
+with working_directory(PIPELINE_DIR):
+    # ingest.py loads the numbered pipeline scripts relative to their folder
+    import address_clustering
+
+
+def reference_clusters(blocks, change_heuristic):
+    """
+    Straightforward dict-based version of both heuristics, one transaction at a time.
+    """
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    outputs, seen = {}, set()
+    for block in blocks:
+        block_seen = set()
+        for tx in block["tx"]:
+            inputs = [outputs.pop((vin["txid"], vin["vout"])) for vin in tx["vin"] if "txid" in vin]
+            paid = [vout["scriptPubKey"]["address"] for vout in tx["vout"] if vout["scriptPubKey"]["type"] != "nulldata"]
+            for address in inputs + paid:
+                find(address)
+            for address in inputs[1:]:
+                parent[find(address)] = find(inputs[0])
+            if change_heuristic and inputs and len(paid) >= 2 and not set(paid) & set(inputs):
+                new = [address for address in paid
+                       if address not in seen and address not in block_seen and paid.count(address) == 1]
+                if len(new) == 1:
+                    parent[find(new[0])] = find(inputs[0])
+            block_seen.update(inputs + paid)
+            for vout in tx["vout"]:
+                if vout["scriptPubKey"]["type"] != "nulldata":
+                    outputs[(tx["txid"], vout["n"])] = vout["scriptPubKey"]["address"]
+        seen |= block_seen
+    groups = {}
+    for address in parent:
+        groups.setdefault(find(address), set()).add(address)
+    return sorted(sorted(group) for group in groups.values())
+
+
+def traced(function, *args, **kwargs):
+    tracemalloc.start()
+    result = function(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, nargs="+", default=[10, 40])
+    parser.add_argument("--txs", type=int, default=2000, help="transactions per block")
+    parser.add_argument("--elements", type=int, default=20_000_000, help="union-find size for the array benchmark")
+    args = parser.parse_args()
+
+    for n_blocks in args.blocks:
+        blocks = SyntheticChain(txs_per_block=args.txs, address_reuse=0.5, max_inputs=4).blocks(n_blocks)
+        with tempfile.TemporaryDirectory() as folder:
+            cache = block_cache.get_cache(folder, "compact")
+            for block in blocks:
+                cache.save(block, block["height"])
+            for change in (False, True):
+                times = {}
+                with timer(times, "cluster"):
+                    (hashes, clusters, _), peak = traced(address_clustering.cluster_addresses, folder,
+                                                         change_heuristic=change)
+                if n_blocks == min(args.blocks):
+                    save_folder = os.path.join(folder, "clusters")
+                    address_clustering.save_clusters(hashes, clusters, save_folder)
+                    index = address_clustering.load_clusters(save_folder)
+                    expected = reference_clusters(blocks, change)
+                    addresses = [address for group in expected for address in group]
+                    groups = {}
+                    for address, cluster in zip(addresses, index.lookup_many(addresses).tolist()):
+                        groups.setdefault(cluster, set()).add(address)
+                    assert sorted(sorted(group) for group in groups.values()) == expected, "clusters differ"
+                print(f"{n_blocks} blocks, change={change}: {len(hashes)} addresses, "
+                      f"{clusters.max(initial=-1) + 1} clusters, {times['cluster']:.2f}s, peak {peak / 2**20:.1f} MiB")
+
+    rng = np.random.default_rng(0)
+    a = rng.integers(0, args.elements, args.elements // 2)
+    b = rng.integers(0, args.elements, args.elements // 2)
+    times = {}
+    with timer(times, "union"):
+        union_find, peak = traced(address_clustering.UnionFind, args.elements)
+        _, union_peak = traced(union_find.union, a, b)
+        union_find.roots()
+    print(f"union-find: {args.elements} elements, {len(a)} random unions in {times['union']:.2f}s, "
+          f"parent array {union_find.parent.nbytes / 2**20:.0f} MiB, peak during unions {union_peak / 2**20:.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Per-address queries on a synthetic million-address graph: the memory-mapped
+address table (`address_store.AddressTable`) against scanning the edge list,
+which is what a per-address analysis without it amounts to. Also measures
+keeping the aggregates up to date block by block and checks them against a
+recomputation from all edges.
+
+    python benchmarks/bench_address_store.py --addresses 1000000 --txs 1000000
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from common import timer
+
+import address_store
+import revmap_index
+
+
+def synthetic_graph(n_addresses, n_txs, blocks, seed=0):
+    """
+    Transactions with 1-3 inputs and 1-3 outputs over `n_addresses` addresses
+    with skewed reuse. Tx vertices come first, then addresses.
+    """
+    rng = np.random.default_rng(seed)
+    ins, outs = rng.integers(1, 4, n_txs), rng.integers(1, 4, n_txs)
+    per_tx = ins + outs
+    tx = np.repeat(np.arange(n_txs), per_tx)
+    is_input = np.arange(len(tx)) - np.repeat(np.cumsum(per_tx) - per_tx, per_tx) < np.repeat(ins, per_tx)
+    # a few heavily used addresses and a long tail, like real address reuse
+    address = n_txs + np.minimum((rng.pareto(1.2, len(tx)) * n_addresses / 50).astype(np.int64), n_addresses - 1)
+    address = np.where(rng.random(len(tx)) < 0.5, n_txs + rng.integers(0, n_addresses, len(tx)), address)
+    height = 850000 + tx * blocks // n_txs
+    edges = {"address": address, "tx": tx, "value": rng.integers(1000, 10**8, len(tx)), "is_input": is_input,
+             "height": height, "time": 1724000000 + 600 * (height - 850000)}
+    reverse_map = {
+        "transaction_dict": {hashlib.sha256(str(i).encode()).hexdigest(): i for i in range(n_txs)},
+        # only addresses with edges are vertices of a real graph
+        "account_dict": {"bc1q" + hashlib.sha256(b"a" + str(vertex).encode()).hexdigest()[:38]: vertex
+                         for vertex in np.unique(address).tolist()},
+        "block_dict": {},
+    }
+    return edges, reverse_map
+
+
+def scan_stats(edges, vertex):
+    """
+    Baseline: filters the full edge list for one address.
+    """
+    mine = edges["address"] == vertex
+    received = ~edges["is_input"] & mine
+    sent = edges["is_input"] & mine
+    return {"received": int(edges["value"][received].sum()), "sent": int(edges["value"][sent].sum()),
+            "tx_count": len(np.unique(edges["tx"][mine])),
+            "first_height": int(edges["height"][mine].min()), "last_height": int(edges["height"][mine].max())}
+
+
+def latencies(function, queries):
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        function(query)
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1e6
+    return f"p50 {np.percentile(times, 50):8.1f} us  p99 {np.percentile(times, 99):8.1f} us"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--addresses", type=int, default=1000000, help="address pool; unused ones are left out")
+    parser.add_argument("--txs", type=int, default=1000000)
+    parser.add_argument("--blocks", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=10000)
+    args = parser.parse_args()
+
+    edges, reverse_map = synthetic_graph(args.addresses, args.txs, args.blocks)
+    n_vertices = args.txs + args.addresses
+    print(f"{len(reverse_map['account_dict'])} addresses, {args.txs} transactions, {len(edges['tx'])} edges")
+
+    times = {}
+    with timer(times, "all"):
+        stats = address_store.AddressStats(n_vertices)
+        stats.add_edges(edges)
+    boundaries = np.searchsorted(edges["height"], np.unique(edges["height"]))
+    with timer(times, "blocks"):
+        incremental = address_store.AddressStats()
+        for start, end in zip(boundaries, list(boundaries[1:]) + [len(edges["tx"])]):
+            incremental.add_edges({key: column[start:end] for key, column in edges.items()})
+    for name in address_store.STAT_COLUMNS:
+        assert np.array_equal(incremental.columns[name][:n_vertices], stats.columns[name]), name
+    print(f"aggregates: {times['all']:.2f}s in one pass, {times['blocks']:.2f}s block by block "
+          f"({times['blocks'] / args.blocks * 1000:.1f} ms/block)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder, revmap_folder = os.path.join(tmp, "address_table"), os.path.join(tmp, "revmap_index")
+        with timer(times, "save"):
+            address_store.save_address_table(stats, edges, reverse_map, folder, n_vertices)
+            revmap_index.save_index(reverse_map, revmap_folder)
+        with timer(times, "open"):
+            table = address_store.AddressTable(folder, revmap_folder)
+        size = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+        print(f"table: saved in {times['save']:.2f}s, {size / 2**20:.0f} MiB, opened in {times['open'] * 1000:.1f} ms")
+
+        addresses = list(reverse_map["account_dict"])
+        rng = np.random.default_rng(1)
+        queries = [addresses[i] for i in rng.integers(0, len(addresses), args.queries).tolist()]
+        for address in queries[:50]:
+            expected, actual = scan_stats(edges, reverse_map["account_dict"][address]), table.stats(address)
+            assert round(actual["received"] * 1e8) == expected["received"], address
+            assert round(actual["sent"] * 1e8) == expected["sent"], address
+            for name in ("tx_count", "first_height", "last_height"):
+                assert actual[name] == expected[name], (address, name)
+
+        print(f"stats          {latencies(table.stats, queries)}")
+        print(f"transactions   {latencies(table.transactions, queries)}")
+        print(f"neighbours     {latencies(table.neighbours, queries)}")
+        scan_queries = queries[:20]
+        print(f"edge list scan {latencies(lambda address: scan_stats(edges, reverse_map['account_dict'][address]), scan_queries)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Compares the original pretty-printed JSON block cache with the compact
+`.blk` format on a synthetic block set: disk footprint and load time per block.
+
+    python benchmarks/bench_block_cache.py --blocks 10 --txs 3000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import working_directory
+from synthetic import generate_blocks
+
+import block_cache
+
+
+def measure(cache, heights, loader):
+    sizes = sum(os.path.getsize(cache.path(height)) for height in heights)
+    start = time.perf_counter()
+    for height in heights:
+        loader(cache.path(height))
+    return sizes, (time.perf_counter() - start) / len(heights)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=10)
+    parser.add_argument("--txs", type=int, default=3000, help="transactions per block")
+    args = parser.parse_args()
+
+    blocks = generate_blocks(args.blocks, txs_per_block=args.txs)
+    heights = [block["height"] for block in blocks]
+    print(f"codecs: {'msgpack' if block_cache.msgpack else 'json'} + {'zstd' if block_cache.zstandard else 'zlib'}")
+
+    with tempfile.TemporaryDirectory() as tmp, working_directory(tmp):
+        results = {}
+        # json files loaded with json.load; compact files loaded as columns and as rebuilt nested dicts
+        for name, cache_format, loader in (("json", "json", block_cache.load_block_file),
+                                           ("compact", "compact", block_cache.load_block_columns),
+                                           ("compact (nested)", "compact", block_cache.load_block_file)):
+            cache = block_cache.get_cache(cache_format, cache_format)
+            write = "-"
+            if not os.path.exists(cache.path(heights[-1])):
+                start = time.perf_counter()
+                for block in blocks:
+                    cache.save(block, block["height"])
+                write = f"{(time.perf_counter() - start) / len(blocks) * 1000:.1f}"
+            size, load_time = measure(cache, heights, loader)
+            results[name] = (size, load_time)
+            print(f"{name:17s} {size / len(blocks) / 1e6:8.2f} MB/block  "
+                  f"write {write:>8s} ms/block  load {load_time * 1000:8.1f} ms/block")
+
+    (json_size, json_load), (compact_size, compact_load) = results["json"], results["compact"]
+    print(f"footprint reduced {json_size / compact_size:.1f}x, load time reduced {json_load / compact_load:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Compares reading large pretty-printed JSON block files with `json.load`
+against the record reader (`block_cache.load_block_records`): parse time per
+block, allocations while parsing and memory held by the decoded block.
+Also checks that both produce the same transaction-level fields.
+
+    python benchmarks/bench_block_reader.py --blocks 5 --txs 5000
+"""
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from common import load_script
+from synthetic import generate_blocks
+
+import block_cache
+import block_reader
+
+
+def load_json(file_path):
+    with open(file_path) as f:
+        return json.load(f)
+
+
+def measure(loader, paths, repeat):
+    """
+    Best time over `repeat` passes, then one traced pass for the allocation
+    peak and the memory still held by the last decoded block.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            loader(path)
+        best = min(best, time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    peak, block = 0, None
+    for path in paths:
+        block = None
+        tracemalloc.reset_peak()
+        block = loader(path)
+        held, block_peak = tracemalloc.get_traced_memory()
+        peak = max(peak, block_peak)
+    tracemalloc.stop()
+    return best / len(paths), peak, held
+
+
+def fields(block):
+    """
+    The fields the pipeline reads, for the equality check.
+    """
+    rows = []
+    for tx in block["tx"]:
+        vins = [(vin.get("txid"), vin.get("vout"), "coinbase" in vin,
+                 vin["prevout"]["value"] if vin.get("prevout") else None,
+                 vin["prevout"]["scriptPubKey"].get("address") if vin.get("prevout") else None)
+                for vin in tx["vin"]]
+        vouts = [(vout["value"], vout["n"], vout["scriptPubKey"].get("address"), vout["scriptPubKey"].get("type"))
+                 for vout in tx["vout"]]
+        rows.append((tx["txid"], tx.get("size"), tx.get("fee"), vins, vouts))
+    return block["height"], block["time"], block.get("hash"), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=5)
+    parser.add_argument("--txs", type=int, default=5000, help="transactions per block")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    transact = load_script("raw_bitcoin_data_and_graph_creation/3_transact_and_address_matching.py")
+    with tempfile.TemporaryDirectory() as folder:
+        cache = block_cache.get_cache(folder, "json")
+        for block in generate_blocks(args.blocks, txs_per_block=args.txs, verbosity=3):
+            cache.save(block, block["height"])
+        paths = [path for _, path in block_cache.iter_block_files(folder)]
+        size = sum(os.path.getsize(path) for path in paths) / len(paths)
+
+        for path in paths:
+            expected, records = load_json(path), block_cache.load_block_records(path)
+            assert fields(expected) == fields(records), f"fields differ in {path}"
+            assert transact.extract_txid_addresses(expected) == transact.extract_txid_addresses(records)
+
+        print(f"{args.blocks} blocks of {args.txs} transactions, {size / 1e6:.1f} MB of JSON per block, "
+              f"record decoder: {block_reader.DECODER}")
+        results = {}
+        for name, loader in (("json.load", load_json), ("records", block_cache.load_block_records)):
+            results[name] = measure(loader, paths, args.repeat)
+            seconds, peak, held = results[name]
+            print(f"{name:10s} {seconds * 1000:8.1f} ms/block  {size / seconds / 1e6:7.1f} MB/s  "
+                  f"peak {peak / 2**20:7.1f} MiB  held {held / 2**20:7.1f} MiB")
+
+    (json_time, json_peak, json_held), (records_time, records_peak, records_held) = results.values()
+    print(f"parse time reduced {json_time / records_time:.1f}x, peak allocations {json_peak / records_peak:.1f}x, "
+          f"held memory {json_held / records_held:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
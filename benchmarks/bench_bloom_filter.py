@@ -0,0 +1,100 @@
+"""
+Measures the per-label Bloom prefilter of `bloom_filter.py` in front of the
+exact labelling lookups: throughput of `map_transactions_to_labels` with the
+address sets and with the memory-mapped label index, each with and without
+the filters, the filters' size against the traced size of the sets, and
+their measured false positive rate. All paths must return the same labels.
+
+    python benchmarks/bench_bloom_filter.py --rows 5000000 --labelled 2000000 --fp-rate 0.01 0.001
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from bench_labelling import LABELS, write_synthetic_data
+
+import bloom_filter
+import label_index
+import transaction_labelling
+
+
+def timed_labelling(transactions_csv, labeled_addresses, filters=None):
+    start = time.perf_counter()
+    labelled = transaction_labelling.map_transactions_to_labels(transactions_csv, labeled_addresses, filters=filters)
+    return labelled, time.perf_counter() - start
+
+
+def lookup_seconds(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def filtered_lookup(lookup, filters, addresses):
+    return lookup(addresses[bloom_filter.might_be_labelled(filters, addresses)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000000, help="rows in txid_addresses.csv")
+    parser.add_argument("--labelled", type=int, default=500000, help="number of labelled addresses")
+    parser.add_argument("--fp-rate", type=float, nargs="+", default=[0.01, 0.001],
+                        help="false positive rates of the filters to compare")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        # about 10% of the rows hold a labelled address
+        transactions_csv = write_synthetic_data(folder, args.rows, args.labelled)
+
+        tracemalloc.start()
+        sets = transaction_labelling.load_labeled_addresses(folder, LABELS)
+        sets_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        scraped = {label: [(label, pd.read_csv(os.path.join(folder, f"{label}_addresses.csv"), dtype=str)['address']
+                                   .to_numpy(dtype='S'))] for label in LABELS}
+        label_index.save_label_index(label_index.build_label_index(scraped), os.path.join(folder, "label_index"))
+        index = label_index.load_label_index(os.path.join(folder, "label_index"))
+
+        expected, sets_seconds = timed_labelling(transactions_csv, sets)
+        _, index_seconds = timed_labelling(transactions_csv, index)
+        print(f"{args.rows} rows, {args.labelled} labelled addresses, {len(expected)} labelled rows")
+        print(f"exact sets:  {args.rows / sets_seconds:12.0f} rows/s, sets {sets_bytes / 1e6:.1f} MB traced")
+        print(f"exact index: {args.rows / index_seconds:12.0f} rows/s, memory-mapped")
+
+        # the lookups alone, without reading the CSV
+        addresses = pd.read_csv(transactions_csv, usecols=['Address'], dtype=str)['Address']
+        unlabelled = ~addresses.isin(set().union(*sets.values())).to_numpy()
+        label_table = transaction_labelling.build_address_label_table(sets)
+        sets_lookup = lookup_seconds(addresses.map, label_table)
+        index_lookup = lookup_seconds(index.labels, addresses)
+        print(f"lookup only: sets {args.rows / sets_lookup:12.0f} rows/s, index {args.rows / index_lookup:12.0f} rows/s")
+        for fp_rate in args.fp_rate:
+            start = time.perf_counter()
+            filters = {label: bloom_filter.build_label_filter(folder, label, fp_rate) for label in LABELS}
+            build_seconds = time.perf_counter() - start
+            # the index path uses filters built from the index itself, like transaction_labelling.py
+            index_filters = bloom_filter.load_index_filters(os.path.join(folder, "label_index"), fp_rate)
+            filter_bytes = sum(bloom.bits.nbytes for bloom in filters.values())
+            candidates = bloom_filter.might_be_labelled(filters, addresses.to_numpy())
+            measured_fp = candidates[unlabelled].mean() if unlabelled.any() else 0.0
+
+            with_sets, sets_filtered = timed_labelling(transactions_csv, sets, filters)
+            with_index, index_filtered = timed_labelling(transactions_csv, index, index_filters)
+            assert with_sets.equals(expected) and with_index.equals(expected), "labels differ with the prefilter"
+            print(f"fp_rate {fp_rate}: filters {filter_bytes / 1e6:.1f} MB built in {build_seconds:.2f}s, "
+                  f"{np.count_nonzero(candidates)} candidate rows, measured false positive rate {measured_fp:.4f}")
+            sets_filtered_lookup = lookup_seconds(filtered_lookup, lambda rows: rows.map(label_table), filters, addresses)
+            index_filtered_lookup = lookup_seconds(filtered_lookup, index.labels, index_filters, addresses)
+            print(f"  lookup only: sets + filter {args.rows / sets_filtered_lookup:12.0f} rows/s, "
+                  f"index + filter {args.rows / index_filtered_lookup:12.0f} rows/s")
+            print(f"  sets + filter:  {args.rows / sets_filtered:12.0f} rows/s ({sets_seconds / sets_filtered:.2f}x)")
+            print(f"  index + filter: {args.rows / index_filtered:12.0f} rows/s ({index_seconds / index_filtered:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Runs `ChainFollower` against the mock node while the node's chain grows,
+and checks that a reorg replaces the orphaned cached blocks. Reports the
+backfill rate and the tip lag: time from a new block appearing on the node
+until it is cached and announced to the listeners.
+
+    python benchmarks/bench_chain_follower.py --backfill 200 --new 20 --interval 0.2 --latency 0.02
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from common import working_directory
+from mock_rpc import MockBitcoinNode
+from synthetic import SyntheticChain
+
+import block_cache
+import chain_follower
+from rpc_client import BatchRpcClient
+
+
+class LagListener(chain_follower.BlockListener):
+    """
+    Records when each height is announced and which heights were dropped.
+    """
+
+    def __init__(self):
+        self.announced = {}
+        self.dropped = []
+
+    def on_block(self, height, block):
+        self.announced[height] = time.perf_counter()
+
+    def on_reorg(self, heights):
+        self.dropped.extend(heights)
+
+
+def fork(chain_blocks, fork_height, n_blocks, seed):
+    """
+    Returns `n_blocks` blocks of a competing branch starting at `fork_height`.
+    """
+    branch = SyntheticChain(start_height=fork_height, txs_per_block=chain_blocks[0]["nTx"], seed=seed)
+    branch.prev_hash = next(block["hash"] for block in chain_blocks if block["height"] == fork_height - 1)
+    return branch.blocks(n_blocks)
+
+
+async def follow(node, follower, listener, blocks, args):
+    """
+    Backfills, then appends `args.new` blocks one at a time, then reorgs the
+    last `args.reorg` blocks.
+    """
+    visible = args.backfill
+    node.set_blocks(blocks[:visible])
+    task = asyncio.create_task(follower.run())
+
+    start = time.perf_counter()
+    while blocks[visible - 1]["height"] not in listener.announced:
+        await asyncio.sleep(0.005)
+    backfill_seconds = time.perf_counter() - start
+
+    lags = []
+    for block in blocks[visible:visible + args.new]:
+        visible += 1
+        node.set_blocks(blocks[:visible])
+        appeared = time.perf_counter()
+        while block["height"] not in listener.announced:
+            await asyncio.sleep(0.001)
+        lags.append(listener.announced[block["height"]] - appeared)
+
+    fork_height = blocks[visible - args.reorg]["height"]
+    branch = fork(blocks[:visible], fork_height, args.reorg + 1, seed=args.seed + 1)
+    node.set_blocks(blocks[:visible - args.reorg] + branch)
+    while follower.hashes.get(branch[-1]["height"]) != branch[-1]["hash"]:
+        await asyncio.sleep(0.005)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return backfill_seconds, lags, branch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backfill", type=int, default=200, help="blocks on the node when the follower starts")
+    parser.add_argument("--new", type=int, default=20, help="blocks appended one at a time afterwards")
+    parser.add_argument("--reorg", type=int, default=3, help="depth of the simulated reorg")
+    parser.add_argument("--txs", type=int, default=200, help="transactions per block")
+    parser.add_argument("--interval", type=float, default=0.2, help="follower poll interval in seconds")
+    parser.add_argument("--latency", type=float, default=0.02, help="mock node latency per request in seconds")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    blocks = SyntheticChain(txs_per_block=args.txs, seed=args.seed).blocks(args.backfill + args.new)
+    node = MockBitcoinNode(blocks[:args.backfill], latency=args.latency)
+    server = node.serve()
+    client = BatchRpcClient(server.url, batch_size=10, max_workers=args.concurrency)
+
+    with tempfile.TemporaryDirectory() as tmp, working_directory(tmp):
+        listener = LagListener()
+        cache = block_cache.get_cache("blocks", "compact")
+        follower = chain_follower.ChainFollower(client, cache, [listener], poll_interval=args.interval,
+                                                concurrency=args.concurrency, backfill=args.backfill)
+        backfill_seconds, lags, branch = asyncio.run(follow(node, follower, listener, blocks, args))
+
+        cached = dict(block_cache.iter_block_files("blocks"))
+        assert len(cached) == args.backfill + args.new + 1, f"{len(cached)} cached blocks"
+        for block in branch:
+            assert block_cache.load_block_columns(cached[block["height"]])["hash"] == block["hash"]
+        assert sorted(listener.dropped) == [block["height"] for block in branch[:args.reorg]]
+    server.shutdown()
+
+    print(f"backfill: {args.backfill} blocks in {backfill_seconds:.2f}s ({args.backfill / backfill_seconds:.0f} blocks/s)")
+    print(f"tip lag over {len(lags)} new blocks (poll every {args.interval}s): "
+          f"median {statistics.median(lags) * 1000:.0f} ms, max {max(lags) * 1000:.0f} ms")
+    print(f"reorg of {args.reorg} blocks: dropped {sorted(listener.dropped)}, new branch cached")
+
+
+if __name__ == "__main__":
+    main()
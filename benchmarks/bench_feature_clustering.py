@@ -0,0 +1,116 @@
+"""
+Streaming (chunked IncrementalPCA + MiniBatchKMeans) against in-memory
+(StandardScaler + PCA + KMeans on the whole table) clustering of a synthetic
+transaction feature matrix: runtime, peak memory and agreement with the
+generating blobs.
+
+    python benchmarks/bench_feature_clustering.py --rows 200000 2000000 --workers 4
+"""
+import argparse
+import os
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.decomposition import PCA
+from sklearn.metrics import adjusted_rand_score
+from sklearn.preprocessing import StandardScaler
+
+from common import timer
+
+import feature_clustering
+
+
+def write_blobs(path, rows, n_features=24, n_blobs=6, chunksize=100_000, seed=0):
+    """
+    Writes `rows` transactions drawn from `n_blobs` Gaussian blobs, a chunk (and
+    Parquet row group) at a time, and returns the blob of each row.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 5, (n_blobs, n_features))
+    scales = rng.uniform(0.1, 100, n_features)
+    columns = [f"feature_{i}" for i in range(n_features)]
+    truth = rng.integers(0, n_blobs, rows)
+    for start in range(0, rows, chunksize):
+        blob = truth[start:start + chunksize]
+        values = (centers[blob] + rng.normal(0, 1, (len(blob), n_features))) * scales
+        chunk = pd.DataFrame(values, columns=columns)
+        chunk.insert(0, "tx_hash", [f"{i:064x}" for i in range(start, start + len(blob))])
+        if path.endswith(".csv"):
+            chunk.to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+        else:
+            table = feature_clustering.pa.Table.from_pandas(chunk, preserve_index=False)
+            if start == 0:
+                writer = feature_clustering.pq.ParquetWriter(path, table.schema)
+            writer.write_table(table)
+    if not path.endswith(".csv"):
+        writer.close()
+    return truth
+
+
+def in_memory(path, n_components, n_clusters):
+    """
+    What the notebook does: load everything, then fit.
+    """
+    features = pd.read_csv(path, dtype={"tx_hash": str}) if path.endswith(".csv") else pd.read_parquet(path)
+    values = StandardScaler().fit_transform(features.drop(columns="tx_hash").to_numpy(dtype=np.float64))
+    components = PCA(n_components=n_components).fit_transform(values)
+    clusters = KMeans(n_clusters=n_clusters, n_init=3, random_state=0).fit_predict(components)
+    return pd.DataFrame({"tx_hash": features["tx_hash"], "Cluster": clusters})
+
+
+def streaming(path, output_file, n_components, n_clusters, chunksize, workers):
+    clusterer = feature_clustering.StreamingClusterer(n_components, n_clusters, chunksize, workers, exclude=[])
+    clusterer.fit(path)
+    feature_clustering.save_assignments(clusterer.iter_assignments(path), output_file)
+
+
+def traced(function, *args):
+    tracemalloc.start()
+    result = function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[200_000, 1_000_000])
+    parser.add_argument("--components", type=int, default=8)
+    parser.add_argument("--clusters", type=int, default=6)
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=4, help="reader processes for the timed streaming run")
+    parser.add_argument("--format", choices=["parquet", "csv"], default="parquet" if feature_clustering.pq else "csv")
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, f"features.{args.format}")
+            truth = write_blobs(path, rows, n_blobs=args.clusters)
+            print(f"{rows} rows, {os.path.getsize(path) / 2**20:.0f} MiB {args.format}")
+
+            times = {}
+            output_file = os.path.join(folder, "clusters.csv")
+            with timer(times, "in-memory"):
+                expected = in_memory(path, args.components, args.clusters)
+            with timer(times, "streaming"):
+                streaming(path, output_file, args.components, args.clusters, args.chunksize, 0)
+            with timer(times, "parallel"):
+                streaming(path, output_file, args.components, args.clusters, args.chunksize, args.workers)
+            result = pd.read_csv(output_file, usecols=["tx_hash", "Cluster"], dtype={"tx_hash": str})
+            # tracing slows both down, so memory is measured in separate runs; pool workers are not traced
+            _, expected_peak = traced(in_memory, path, args.components, args.clusters)
+            _, peak = traced(streaming, path, output_file, args.components, args.clusters, args.chunksize, 0)
+
+            assert (result["tx_hash"] == expected["tx_hash"]).all(), "rows out of order"
+            for name, assignments, memory in (("in-memory", expected, expected_peak), ("streaming", result, peak)):
+                agreement = adjusted_rand_score(truth, assignments["Cluster"])
+                print(f"  {name:10s} {times[name]:7.2f}s, peak {memory / 2**20:7.1f} MiB, ARI {agreement:.3f}")
+            print(f"  {'streaming':10s} {times['parallel']:7.2f}s with {args.workers} workers, "
+                  f"ARI between the two fits {adjusted_rand_score(expected['Cluster'], result['Cluster']):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Times the serial graph builder (`traverse_folder`) against the process-pool
+parser with bulk graph assembly, and checks that both produce the same graph
+and reverse map.
+
+    python benchmarks/bench_graph_build.py --blocks 50 --txs 2000 --workers 4
+"""
+import argparse
+import tempfile
+import time
+from collections import defaultdict
+
+import graph_tool.all as gt
+
+from common import load_script
+from synthetic import generate_blocks
+
+import block_cache
+import graph_builder
+
+
+def graph_fingerprint(graph):
+    vertex_props = {name: [prop[v] for v in graph.vertices()] for name, prop in graph.vp.items()}
+    edges = sorted((graph.edge_index[e], int(e.source()), int(e.target())) + tuple(prop[e] for prop in graph.ep.values())
+                   for e in graph.edges())
+    return vertex_props, edges
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=50)
+    parser.add_argument("--txs", type=int, default=2000, help="transactions per block")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    graph_creation = load_script("raw_bitcoin_data_and_graph_creation/2_graph_creation.py")
+
+    with tempfile.TemporaryDirectory() as folder:
+        cache = block_cache.get_cache(folder, "compact")
+        for block in generate_blocks(args.blocks, txs_per_block=args.txs):
+            cache.save(block, block["height"])
+
+        serial_graph = gt.Graph(directed=True)
+        graph_creation.add_graph_properties(serial_graph)
+        start = time.perf_counter()
+        graph_creation.traverse_folder(serial_graph, folder)
+        serial = time.perf_counter() - start
+
+        bulk_graph = gt.Graph(directed=True)
+        graph_creation.add_graph_properties(bulk_graph)
+        bulk_map = defaultdict(dict)
+        start = time.perf_counter()
+        graph_builder.build_graph_parallel(bulk_graph, folder, bulk_map, workers=args.workers)
+        bulk = time.perf_counter() - start
+
+    assert dict(graph_creation.reverse_map) == dict(bulk_map), "reverse maps differ"
+    assert graph_fingerprint(serial_graph) == graph_fingerprint(bulk_graph), "graphs differ"
+    print(f"{serial_graph.num_vertices()} vertices, {serial_graph.num_edges()} edges (identical)")
+    print(f"serial:   {serial:8.2f}s")
+    print(f"parallel: {bulk:8.2f}s ({args.workers} workers), speedup {serial / bulk:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Compares `BitcoinGraph.gt` in the original schema with the compact one of
+`graph_schema.py`: file size, save time, and load time and peak resident
+memory, each load measured in a fresh process. Also checks that the converted
+graph and a graph built directly in the compact schema hold the same values.
+
+    python benchmarks/bench_graph_schema.py --blocks 50 --txs 2000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import graph_tool.all as gt
+import numpy as np
+
+from common import load_script
+
+import block_cache
+import graph_builder
+import graph_schema
+from synthetic import generate_blocks
+
+
+def measure_load(path):
+    """
+    Loads `path` in a new interpreter and returns its load seconds and peak RSS.
+    """
+    code = ("import json, sys, time; sys.path.insert(0, sys.argv[2]); from instrumentation import peak_rss; "
+            "import graph_tool.all as gt; baseline = peak_rss(); start = time.perf_counter(); "
+            "graph = gt.load_graph(sys.argv[1]); seconds = time.perf_counter() - start; "
+            "print(json.dumps({'seconds': seconds, 'rss': peak_rss(), 'baseline': baseline}))")
+    output = subprocess.run([sys.executable, "-c", code, path, os.path.dirname(graph_builder.__file__)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def timed_save(graph, path):
+    start = time.perf_counter()
+    graph.save(path)
+    return time.perf_counter() - start
+
+
+def property_arrays(graph):
+    arrays = {name: np.asarray(prop.a) for name, prop in graph.vp.items() if prop.value_type() != "string"}
+    arrays.update({f"edge_{name}": np.asarray(prop.a) for name, prop in graph.ep.items() if prop.value_type() != "string"})
+    return arrays
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=50)
+    parser.add_argument("--txs", type=int, default=2000, help="transactions per block")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    graph_creation = load_script("raw_bitcoin_data_and_graph_creation/2_graph_creation.py")
+
+    with tempfile.TemporaryDirectory() as folder:
+        blocks = os.path.join(folder, "blocks")
+        cache = block_cache.get_cache(blocks, "compact")
+        for block in generate_blocks(args.blocks, txs_per_block=args.txs):
+            cache.save(block, block["height"])
+
+        graphs, reverse_maps = {}, {}
+        for schema in ("legacy", "compact"):
+            graphs[schema] = gt.Graph(directed=True)
+            graph_creation.add_graph_properties(graphs[schema], schema)
+            reverse_maps[schema] = defaultdict(dict)
+            graph_builder.build_graph_parallel(graphs[schema], blocks, reverse_maps[schema], workers=args.workers)
+        assert dict(reverse_maps["legacy"]) == dict(reverse_maps["compact"]), "reverse maps differ"
+
+        paths = {schema: os.path.join(folder, f"{schema}.gt") for schema in graphs}
+        results = {}
+        for schema, graph in graphs.items():
+            results[schema] = {"save": timed_save(graph, paths[schema]), "size": os.path.getsize(paths[schema])}
+            if schema == "compact":
+                start = time.perf_counter()
+                graph_schema.save_vertex_strings(reverse_maps[schema], graph.num_vertices(),
+                                                 graph_schema.strings_path(paths[schema]))
+                results[schema]["save_strings"] = time.perf_counter() - start
+            results[schema].update(measure_load(paths[schema]))
+
+        converted = graph_schema.convert_graph(gt.load_graph(paths["legacy"]))
+        expected, actual = property_arrays(graphs["compact"]), property_arrays(converted)
+        assert expected.keys() == actual.keys(), f"{sorted(expected)} != {sorted(actual)}"
+        for name in expected:
+            assert np.array_equal(expected[name], actual[name]), f"{name} differs after conversion"
+
+        strings = graph_schema.VertexStrings(graph_schema.strings_path(paths["compact"]))
+        legacy = graphs["legacy"]
+        for tx_hash, vertex in list(reverse_maps["legacy"]["transaction_dict"].items())[:1000]:
+            assert strings[vertex] == tx_hash == legacy.vp["tx_hash"][legacy.vertex(vertex)]
+        for address, vertex in list(reverse_maps["legacy"]["account_dict"].items())[:1000]:
+            assert strings[vertex] == address == legacy.vp["address"][legacy.vertex(vertex)]
+
+    graph = graphs["legacy"]
+    print(f"{graph.num_vertices()} vertices, {graph.num_edges()} edges; conversion matches the compact build")
+    for schema, result in results.items():
+        extra = f" (+{result['save_strings']:.2f}s side strings)" if "save_strings" in result else ""
+        print(f"{schema:8s} file {result['size'] / 1e6:7.1f} MB  save {result['save']:6.2f}s{extra}  "
+              f"load {result['seconds']:6.2f}s  peak RSS {(result['rss'] - result['baseline']) / 1e6:7.1f} MB for the load")
+    legacy, compact = results["legacy"], results["compact"]
+    print(f"compact / legacy: size {compact['size'] / legacy['size']:.2f}x, "
+          f"load {compact['seconds'] / legacy['seconds']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Sliding-window metrics updated block by block against recomputing every
+window from scratch on a `GraphView`, plus the cost of a window view and of
+a saved window partition.
+
+    python benchmarks/bench_graph_windows.py --blocks 300 --txs 500 --window 144
+"""
+import argparse
+import tempfile
+from collections import defaultdict
+
+import graph_tool.all as gt
+import numpy as np
+
+from common import load_script, timer
+from synthetic import generate_blocks
+
+import block_cache
+import graph_builder
+import graph_windows
+
+
+def recomputed_metrics(windows, window, step):
+    """
+    Baseline: filters the graph to each window and counts degrees on the view.
+    """
+    heights = windows.heights()
+    start, last = int(heights[0]), int(heights[-1])
+    rows = []
+    while True:
+        view = windows.view(start, start + window)
+        vertices = view.get_vertices()
+        addresses = vertices[~windows.is_tx[vertices] & ~windows.is_placeholder[vertices]]
+        degrees = view.get_total_degrees(addresses)
+        active = int((degrees > 0).sum())
+        # every edge has one address end, so these are the edges of real addresses
+        rows.append({"start_height": start, "active_addresses": active, "edges": int(degrees.sum()),
+                     "max_degree": int(degrees.max(initial=0))})
+        if start + window > last:
+            return rows
+        start += step
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=300)
+    parser.add_argument("--txs", type=int, default=500, help="transactions per block")
+    parser.add_argument("--window", type=int, default=graph_windows.BLOCKS_PER_DAY)
+    parser.add_argument("--step", type=int, default=1)
+    args = parser.parse_args()
+
+    graph_creation = load_script("raw_bitcoin_data_and_graph_creation/2_graph_creation.py")
+    with tempfile.TemporaryDirectory() as folder:
+        cache = block_cache.get_cache(folder, "compact")
+        for block in generate_blocks(args.blocks, txs_per_block=args.txs, address_reuse=0.5):
+            cache.save(block, block["height"])
+        graph = gt.Graph(directed=True)
+        graph_creation.add_graph_properties(graph)
+        reverse_map = defaultdict(dict)
+        graph_builder.build_graph_parallel(graph, folder, reverse_map, workers=0)
+
+    times = {}
+    with timer(times, "index"):
+        windows = graph_windows.GraphWindows(graph, reverse_map)
+    with timer(times, "incremental"):
+        records = list(graph_windows.SlidingWindowMetrics(windows, args.window, args.step))
+    with timer(times, "recomputed"):
+        expected = recomputed_metrics(windows, args.window, args.step)
+
+    assert len(records) == len(expected), "different number of windows"
+    for record, row in zip(records, expected):
+        assert record["start_height"] == row["start_height"]
+        assert record["active_addresses"] == row["active_addresses"], f"active addresses differ at {row['start_height']}"
+        assert record["max_degree"] == row["max_degree"], f"max degree differs at {row['start_height']}"
+        assert np.isclose(record["mean_degree"] * record["active_addresses"], row["edges"])
+    print(f"{graph.num_vertices()} vertices, {graph.num_edges()} edges, {len(records)} windows of {args.window} blocks")
+    print(f"window index:  {times['index']:8.2f}s")
+    print(f"recomputed:    {times['recomputed']:8.2f}s")
+    print(f"incremental:   {times['incremental']:8.2f}s, speedup {times['recomputed'] / times['incremental']:.0f}x")
+
+    start = int(windows.heights()[0])
+    with timer(times, "view"):
+        view = windows.view(start, start + args.window)
+    with timer(times, "partition"):
+        partition = windows.partition(start, start + args.window)
+    print(f"one window: view {times['view'] * 1000:.1f} ms, standalone copy {times['partition'] * 1000:.1f} ms "
+          f"({partition.num_vertices()} vertices, same as the view: {view.num_vertices() == partition.num_vertices()})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Checks that input resolution reproduces the satoshi-exact input, output and
+fee totals of a synthetic chain, both from the outpoint map (verbosity 2,
+no `fee` field) and from `prevout` data (verbosity 3), and times the value
+conversion and the resolution stage of the bulk graph builder.
+
+    python benchmarks/bench_input_resolution.py --blocks 20 --txs 2000
+"""
+import argparse
+from decimal import Decimal
+
+import numpy as np
+
+from common import timer
+from synthetic import SyntheticChain
+
+import block_cache
+import graph_builder
+from input_resolution import OutpointResolver, btc_to_satoshi
+
+
+def decimal_satoshi_to_btc(value):
+    # the per-value conversion `process_transaction` used before
+    return float(Decimal(value) / Decimal(100000000))
+
+
+def resolved_totals(parsed_blocks):
+    resolver = OutpointResolver()
+    totals = {"inputs": 0, "outputs": 0, "fees": 0, "unknown_inputs": 0}
+    for parsed in parsed_blocks:
+        graph_builder.resolve_parsed(parsed, resolver)
+        inputs = parsed["edge_direction"] == graph_builder.INPUT
+        totals["inputs"] += int(parsed["edge_value"][inputs].sum())
+        totals["outputs"] += int(parsed["tx_outputs"].sum())
+        totals["fees"] += int(btc_to_satoshi(parsed["tx_props"][:, 6]).sum())
+        totals["unknown_inputs"] += sum(address == "unknown" for address, is_input
+                                        in zip(parsed["edge_address"], inputs.tolist()) if is_input)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=20)
+    parser.add_argument("--txs", type=int, default=2000, help="transactions per block")
+    args = parser.parse_args()
+
+    for verbosity in (2, 3):
+        chain = SyntheticChain(txs_per_block=args.txs, verbosity=verbosity, with_fee=False)
+        columns = [block_cache.block_to_columns(block) for block in chain.blocks(args.blocks)]
+
+        times = {}
+        with timer(times, "parse"):
+            parsed_blocks = [graph_builder.parse_block_columns(block) for block in columns]
+        with timer(times, "resolve"):
+            totals = resolved_totals(parsed_blocks)
+
+        expected = dict(chain.totals, unknown_inputs=0)
+        assert totals == expected, f"verbosity {verbosity}: {totals} != {expected}"
+        print(f"verbosity {verbosity}: totals match to the satoshi "
+              f"(in {totals['inputs']}, out {totals['outputs']}, fees {totals['fees']})")
+        print(f"  parse {times['parse']:6.2f}s (process pool stage), resolve {times['resolve']:6.2f}s (sequential stage)")
+
+    values = np.concatenate([block["vout_value"] for block in columns]).tolist()
+    times = {}
+    with timer(times, "decimal"):
+        [decimal_satoshi_to_btc(value) for value in values]
+    with timer(times, "bulk"):
+        btc_to_satoshi(values)
+    print(f"{len(values)} output values: Decimal {times['decimal']:6.3f}s, "
+          f"bulk satoshis {times['bulk']:6.3f}s ({times['decimal'] / times['bulk']:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Compares the original label ingestion (serial `pd.read_csv` of every scraped
+wallet CSV with all columns, then one address set per category loaded from
+the `*_addresses.csv` files) with `label_index.py`: parallel address-only
+reads into one sorted, memory-mapped address -> (category, wallet) index.
+Reports ingestion time, load time and traced memory, and labelling time
+over a transaction-address CSV, and checks that both label the same rows.
+
+    python benchmarks/bench_label_index.py --wallets 200 --addresses 5000 --rows 2000000 --workers 4
+"""
+import argparse
+import csv
+import hashlib
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from common import working_directory
+from suite import CATEGORIES, write_scraped_csvs
+
+import label_index
+import transaction_labelling
+
+
+def original_ingestion(scraper_folder):
+    """
+    The original aggregation: every CSV read serially with all columns, one
+    deduplicated, sorted `{category}_addresses.csv` per category.
+    """
+    for category in sorted(os.listdir(scraper_folder)):
+        frames = []
+        for file_name in os.listdir(os.path.join(scraper_folder, category)):
+            df = pd.read_csv(os.path.join(scraper_folder, category, file_name), skiprows=1)
+            frames.append(df[['address']].copy())
+        addresses = pd.concat(frames, ignore_index=True)['address'].dropna().astype(str).drop_duplicates().sort_values()
+        addresses.to_frame('address').to_csv(f"{category}_addresses.csv", index=False)
+
+
+def measured(function, *args):
+    """
+    Times `function`, then runs it again under tracemalloc for its peak traced
+    bytes, so tracing does not slow the timed run.
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def write_transactions(path, addresses, n_rows, seed):
+    """
+    Writes a `txid_addresses.csv` whose addresses are drawn from `addresses`
+    (about half of them labelled) and from as many unlabelled ones.
+    """
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Transaction ID", "Address"])
+        for i in range(n_rows):
+            txid = hashlib.sha256(b"tx" + str(i // 3).encode()).hexdigest()
+            if rng.random() < 0.5:
+                address = rng.choice(addresses)
+            else:
+                address = "bc1q" + hashlib.sha256(str(rng.randrange(10 ** 9)).encode()).hexdigest()[:38]
+            writer.writerow([txid, address])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wallets", type=int, default=100, help="wallets per category")
+    parser.add_argument("--addresses", type=int, default=2000, help="addresses per wallet")
+    parser.add_argument("--rows", type=int, default=1000000, help="rows in txid_addresses.csv")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder, working_directory(folder):
+        scraper_folder = os.path.join(folder, "scraper")
+        # a share of the addresses is listed under several categories to exercise the tie-break order
+        shared = ["1" + hashlib.sha256(f"shared{i}".encode()).hexdigest()[:33] for i in range(args.addresses * 4)]
+        write_scraped_csvs(scraper_folder, shared, args.wallets, args.addresses, 0.05, args.seed)
+
+        start = time.perf_counter()
+        original_ingestion(scraper_folder)
+        original_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        index = label_index.build_label_index(label_index.read_scraped_folder(scraper_folder, args.workers))
+        label_index.save_label_index(index, "label_index")
+        index_seconds = time.perf_counter() - start
+
+        sets, sets_seconds, sets_peak = measured(transaction_labelling.load_labeled_addresses, folder, CATEGORIES)
+        labels, index_load_seconds, index_peak = measured(label_index.load_label_index, "label_index")
+
+        transactions_csv = os.path.join(folder, "txid_addresses.csv")
+        write_transactions(transactions_csv, index["addresses"][::7].astype(str).tolist(), args.rows, args.seed)
+        start = time.perf_counter()
+        expected = transaction_labelling.map_transactions_to_labels(transactions_csv, sets)
+        sets_labelling = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = transaction_labelling.map_transactions_to_labels(transactions_csv, labels, wallets=True)
+        index_labelling = time.perf_counter() - start
+
+        assert actual[["tx_hash", "Label"]].equals(expected), "labels differ"
+        assert actual["Wallet"].notna().all(), "labelled rows without a wallet"
+        n_addresses = len(labels)
+
+    print(f"{len(CATEGORIES) * args.wallets} wallet CSVs, {n_addresses} distinct labelled addresses, "
+          f"{args.rows} transaction rows ({len(actual)} labelled, identical)")
+    print(f"ingestion: original {original_seconds:6.2f}s   index {index_seconds:6.2f}s ({args.workers} workers)")
+    print(f"load:      sets     {sets_seconds:6.3f}s {sets_peak / 1e6:7.1f} MB   "
+          f"index {index_load_seconds:6.3f}s {index_peak / 1e6:7.1f} MB traced")
+    print(f"labelling: sets     {sets_labelling:6.2f}s   index {index_labelling:6.2f}s (with wallet names)")
+
+
+if __name__ == "__main__":
+    main()
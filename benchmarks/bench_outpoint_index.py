@@ -0,0 +1,73 @@
+"""
+Builds the outpoint index over a synthetic block cache and compares a
+batched lookup of every outpoint against the full rescan that
+`warm_up_resolver` needs without it. Lookups are checked against the
+generated chain.
+
+    python benchmarks/bench_outpoint_index.py --blocks 40 --txs 2000
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from common import timer
+from synthetic import SyntheticChain
+
+import block_cache
+from input_resolution import OutpointResolver, warm_up_resolver
+from outpoint_index import OutpointIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, default=40)
+    parser.add_argument("--txs", type=int, default=2000, help="transactions per block")
+    parser.add_argument("--batch-blocks", type=int, default=10, help="blocks per index segment")
+    args = parser.parse_args()
+
+    chain = SyntheticChain(txs_per_block=args.txs)
+    expected = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, "blocks")
+        cache = block_cache.get_cache(folder, "compact")
+        for block in chain.blocks(args.blocks):
+            cache.save(block, block["height"])
+            for tx in block["tx"]:
+                for vout in tx["vout"]:
+                    if vout["scriptPubKey"]["type"] != "nulldata":
+                        expected[(tx["txid"], vout["n"])] = (round(vout["value"] * 100000000),
+                                                             vout["scriptPubKey"]["address"])
+
+        times = {}
+        index = OutpointIndex(os.path.join(tmp, "outpoint_index"))
+        with timer(times, "build"):
+            index.update(folder, batch_blocks=args.batch_blocks)
+        with timer(times, "open"):
+            index = OutpointIndex(os.path.join(tmp, "outpoint_index"))
+
+        outpoints = list(expected)
+        random.Random(0).shuffle(outpoints)
+        with timer(times, "lookup"):
+            result = index.lookup([txid for txid, _ in outpoints], [n for _, n in outpoints])
+        assert result["found"].all()
+        assert list(zip(result["value"].tolist(), result["address"])) == [expected[outpoint] for outpoint in outpoints]
+
+        with timer(times, "compact"):
+            index.compact()
+        with timer(times, "lookup_compact"):
+            index.lookup([txid for txid, _ in outpoints], [n for _, n in outpoints])
+
+        with timer(times, "rescan"):
+            warm_up_resolver(OutpointResolver(), folder, chain.height)
+
+    print(f"{len(outpoints)} outputs, {args.blocks} blocks, {len(index)} indexed, {(result['spent'] >= 0).sum()} spent")
+    print(f"build:            {times['build']:8.2f}s")
+    print(f"open:             {times['open'] * 1000:8.2f}ms")
+    print(f"batched lookup:   {times['lookup']:8.2f}s ({args.blocks // args.batch_blocks} segments)")
+    print(f"after compact:    {times['lookup_compact']:8.2f}s (compact {times['compact']:.2f}s)")
+    print(f"full rescan:      {times['rescan']:8.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Compares the dill-pickled reverse map (`revmap.pkl`) with the memory-mapped
+`revmap_index/` folder: file size, load time, memory allocated on load and
+lookup throughput.
+
+    python benchmarks/bench_revmap_index.py --addresses 2000000 --txs 1000000
+"""
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import dill as pickle
+
+import common  # noqa: F401  (puts the pipeline modules on sys.path)
+
+import revmap_index
+
+
+def synthetic_reverse_map(n_addresses, n_txs):
+    transaction_dict = {hashlib.sha256(str(i).encode()).hexdigest(): i for i in range(n_txs)}
+    account_dict = {"bc1q" + hashlib.sha256(b"a" + str(i).encode()).hexdigest()[:38]: n_txs + i
+                    for i in range(n_addresses)}
+    return {"transaction_dict": transaction_dict, "account_dict": account_dict, "block_dict": {}}
+
+
+def measure_load(load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    loaded = load()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return loaded, elapsed, peak
+
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--addresses", type=int, default=1000000)
+    parser.add_argument("--txs", type=int, default=500000)
+    parser.add_argument("--lookups", type=int, default=100000)
+    args = parser.parse_args()
+
+    reverse_map = synthetic_reverse_map(args.addresses, args.txs)
+    queries = random.Random(0).sample(list(reverse_map["account_dict"]), min(args.lookups, args.addresses))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pickle_path = os.path.join(tmp, "revmap.pkl")
+        index_path = os.path.join(tmp, "revmap_index")
+        with open(pickle_path, "wb") as f:
+            pickle.dump(reverse_map, f)
+        revmap_index.save_index(reverse_map, index_path)
+        del reverse_map
+
+        def load_pickle():
+            with open(pickle_path, "rb") as f:
+                return pickle.load(f)
+
+        loaded, pickle_time, pickle_mem = measure_load(load_pickle)
+        start = time.perf_counter()
+        for address in queries:
+            loaded["account_dict"][address]
+        dict_lookup = time.perf_counter() - start
+        del loaded
+
+        index, index_time, index_mem = measure_load(lambda: revmap_index.load_index(index_path))
+        accounts = index["account_dict"]
+        start = time.perf_counter()
+        for address in queries:
+            accounts[address]
+        index_lookup = time.perf_counter() - start
+        start = time.perf_counter()
+        found = accounts.lookup_many(queries)
+        batched_lookup = time.perf_counter() - start
+        assert (found >= 0).all()
+
+        print(f"pickle: {os.path.getsize(pickle_path) / 1e6:8.1f} MB  load {pickle_time * 1000:9.1f} ms  "
+              f"allocated {pickle_mem / 1e6:8.1f} MB  {len(queries) / dict_lookup:12.0f} lookups/s")
+        print(f"index:  {folder_size(index_path) / 1e6:8.1f} MB  load {index_time * 1000:9.1f} ms  "
+              f"allocated {index_mem / 1e6:8.1f} MB  {len(queries) / index_lookup:12.0f} lookups/s  "
+              f"{len(queries) / batched_lookup:12.0f} batched lookups/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Times the WalletExplorer scraper against a locally served copy of the site,
+with one download at a time and with a pool of concurrent downloads.
+
+    python benchmarks/bench_scraper.py --wallets 25 --latency 0.05 --workers 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import load_script
+from mock_walletexplorer import MockWalletExplorer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wallets", type=int, default=25, help="wallets per category")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock server latency per request (s)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=100.0, help="request rate limit (requests/s)")
+    args = parser.parse_args()
+
+    site = MockWalletExplorer(wallets_per_category=args.wallets, latency=args.latency)
+    server = site.serve()
+    scraper = load_script("labelled_addresses_scraper/1_walletexplorer_scraper.py")
+    total = args.wallets * len(site.wallets)
+
+    for workers in (1, args.workers):
+        with tempfile.TemporaryDirectory() as output:
+            start = time.perf_counter()
+            downloaded = scraper.scrape(server.url, output, workers=workers, rate=args.rate)
+            elapsed = time.perf_counter() - start
+            files = sum(len(files) for files in downloaded.values())
+            assert files == total, f"downloaded {files} of {total} wallets"
+            assert all(os.path.getsize(f) > 0 for paths in downloaded.values() for f in paths)
+        print(f"{workers:3d} workers: {files} wallets in {elapsed:6.2f}s ({files / elapsed:6.1f} wallets/s)")
+    # the original scraper started a browser per wallet and slept 8s after each download
+    print(f"original fixed sleep alone: {total * 8:.0f}s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
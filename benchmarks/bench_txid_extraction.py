@@ -0,0 +1,87 @@
+"""
+Peak memory and runtime of txid -> address extraction: the original
+collect-everything-then-write approach against the streaming writer, for a
+growing number of blocks, plus the process pool and sharded modes.
+
+    python benchmarks/bench_txid_extraction.py --blocks 10 40 --txs 2000 --workers 4
+"""
+import argparse
+import csv
+import glob
+import os
+import tempfile
+import time
+import tracemalloc
+
+from common import load_script
+from synthetic import SyntheticChain
+
+import block_cache
+
+
+def traced(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def read_rows(paths):
+    rows = []
+    for path in sorted(paths):
+        with open(path, newline='') as f:
+            rows.extend(tuple(row) for row in list(csv.reader(f))[1:])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--blocks", type=int, nargs="+", default=[10, 40])
+    parser.add_argument("--txs", type=int, default=2000, help="transactions per block")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    extraction = load_script("raw_bitcoin_data_and_graph_creation/3_transact_and_address_matching.py")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, "blocks")
+        cache = block_cache.get_cache(folder, "compact")
+        chain = SyntheticChain(txs_per_block=args.txs)
+        written = 0
+        for n_blocks in sorted(args.blocks):
+            for block in chain.blocks(n_blocks - written):
+                cache.save(block, block["height"])
+            written = n_blocks
+
+            def collect_then_write(output):
+                extraction.save_to_csv(extraction.process_all_json_files(folder), output)
+
+            def stream(output):
+                extraction.save_to_csv(extraction.iter_txid_addresses(folder), output)
+
+            list_output, stream_output = os.path.join(tmp, "list.csv"), os.path.join(tmp, "stream.csv")
+            _, list_time, list_peak = traced(collect_then_write, list_output)
+            _, stream_time, stream_peak = traced(stream, stream_output)
+            print(f"{n_blocks:5d} blocks  list:   peak {list_peak / 1e6:8.1f} MB  {list_time:6.2f}s")
+            print(f"{n_blocks:5d} blocks  stream: peak {stream_peak / 1e6:8.1f} MB  {stream_time:6.2f}s")
+
+        expected = read_rows([stream_output])
+        assert read_rows([list_output]) == expected
+
+        start = time.perf_counter()
+        parallel_output = os.path.join(tmp, "parallel.csv")
+        extraction.save_to_csv(extraction.iter_txid_addresses(folder, args.workers), parallel_output)
+        print(f"ordered, {args.workers} workers: {time.perf_counter() - start:6.2f}s")
+        assert read_rows([parallel_output]) == expected
+
+        start = time.perf_counter()
+        extraction.save_sharded(folder, os.path.join(tmp, "sharded"), args.workers, args.workers)
+        print(f"sharded, {args.workers} workers: {time.perf_counter() - start:6.2f}s")
+        assert read_rows(glob.glob(os.path.join(tmp, "sharded.part-*.csv"))) == expected
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import importlib.util
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PIPELINE_DIR = os.path.join(REPO_ROOT, "raw_bitcoin_data_and_graph_creation")
+SCRAPER_DIR = os.path.join(REPO_ROOT, "labelled_addresses_scraper")
+
+# the pipeline scripts import their helper modules by plain name
+for path in (REPO_ROOT, PIPELINE_DIR, SCRAPER_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def load_script(relative_path, name=None):
+    """
+    Imports one of the numbered pipeline scripts (e.g. `1_get_block_data.py`) as a module.
+
+    Args:
+    - relative_path (str): Script path relative to the repository root.
+    - name (str): Module name to register it under.
+
+    Returns:
+    - module: The imported script.
+    """
+    path = os.path.join(REPO_ROOT, relative_path)
+    name = name or os.path.splitext(os.path.basename(path))[0].lstrip("0123456789_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+@contextmanager
+def timer(results, key):
+    start = time.perf_counter()
+    yield
+    results[key] = time.perf_counter() - start
@@ -0,0 +1,95 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockBitcoinNode:
+    """
+    In-memory Bitcoin JSON-RPC endpoint serving a fixed list of blocks.
+
+    Args:
+    - blocks (list of dict): Verbosity-2 blocks, ordered by height.
+    - latency (float): Seconds slept per HTTP request, to mimic a remote node.
+    - error_rate (float): Probability that a request is answered with HTTP 429.
+    - max_batch (int): Larger batches are rejected with a single error object, like some nodes do.
+    """
+
+    def __init__(self, blocks, latency=0.0, error_rate=0.0, seed=0, max_batch=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_batch = max_batch
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.set_blocks(blocks)
+
+    def set_blocks(self, blocks):
+        with self.lock:
+            self.blocks_by_hash = {block["hash"]: block for block in blocks}
+            self.hash_by_height = {block["height"]: block["hash"] for block in blocks}
+            self.tip = max(self.hash_by_height)
+
+    def handle(self, request):
+        method, params = request["method"], request.get("params", [])
+        if method == "getblockcount":
+            result = self.tip
+        elif method == "getbestblockhash":
+            result = self.hash_by_height[self.tip]
+        elif method == "getblockhash":
+            result = self.hash_by_height.get(params[0])
+        elif method == "getblock":
+            result = self.blocks_by_hash.get(params[0])
+        else:
+            return {"jsonrpc": "2.0", "id": request.get("id"), "result": None,
+                    "error": {"code": -32601, "message": "Method not found"}}
+        if result is None:
+            return {"jsonrpc": "2.0", "id": request.get("id"), "result": None,
+                    "error": {"code": -8, "message": "Block not found"}}
+        return {"jsonrpc": "2.0", "id": request.get("id"), "result": result, "error": None}
+
+    def serve(self, host="127.0.0.1", port=0):
+        """
+        Starts the HTTP server in a daemon thread and returns it; `server.url` holds the endpoint.
+        """
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                with node.lock:
+                    node.requests += 1
+                    throttled = node.rng.random() < node.error_rate
+                if node.latency:
+                    time.sleep(node.latency)
+                if throttled:
+                    payload = b'{"error": "rate limited"}'
+                    self.send_response(429)
+                    self.send_header("Retry-After", "0.01")
+                else:
+                    request = json.loads(body)
+                    if isinstance(request, list) and node.max_batch is not None and len(request) > node.max_batch:
+                        reply = {"jsonrpc": "2.0", "id": None, "result": None,
+                                 "error": {"code": -32600, "message": "Batch too large"}}
+                    elif isinstance(request, list):
+                        reply = [node.handle(r) for r in request]
+                    else:
+                        reply = node.handle(request)
+                    payload = json.dumps(reply).encode()
+                    self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        server.url = f"http://{host}:{server.server_address[1]}/"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,109 @@
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+CATEGORIES = ['Exchanges', 'Pools', 'Services/others', 'Gambling']
+
+
+class MockWalletExplorer:
+    """
+    Locally served stand-in for walletexplorer.com: a front page listing wallets
+    per category, an address page per wallet with a "Download as CSV" link, and
+    the CSV itself in the WalletExplorer layout.
+
+    Args:
+    - wallets_per_category (int): Number of wallets listed under each category.
+    - addresses_per_wallet (int): Rows in each wallet CSV.
+    - latency (float): Seconds slept per request.
+    """
+
+    def __init__(self, wallets_per_category=20, addresses_per_wallet=100, latency=0.05):
+        self.latency = latency
+        self.addresses_per_wallet = addresses_per_wallet
+        self.wallets = {category: [f"{category.split('/')[0]}Wallet{i}.com" for i in range(wallets_per_category)]
+                        for category in CATEGORIES}
+        self.lock = threading.Lock()
+        self.requests = 0
+        # bump a wallet's version to make its CSV content change
+        self.versions = {}
+        # wallets whose address page has no "Download as CSV" link
+        self.without_csv_link = set()
+
+    def front_page(self):
+        sections = []
+        for category, names in self.wallets.items():
+            links = "".join(f'<li><a href="/wallet/{name}">{name}</a></li>' for name in names)
+            sections.append(f"<h3>{category}:</h3><ul>{links}</ul>")
+        return f"<html><body>{''.join(sections)}</body></html>"
+
+    def addresses_page(self, name):
+        if name in self.without_csv_link:
+            return f'<html><body><h2>Wallet {name}</h2></body></html>'
+        return (f'<html><body><h2>Wallet {name}</h2>'
+                f'<a href="/wallet/{name}/addresses?format=csv">Download as CSV</a></body></html>')
+
+    def wallet_csv(self, name):
+        wallet_id = hashlib.sha256(name.encode()).hexdigest()[:16]
+        version = self.versions.get(name, 0)
+        rows = [f'"#Wallet {name} ({wallet_id}), page 1 from 1, addresses 1-{self.addresses_per_wallet}. '
+                f'Updated to block 858677. Source: WalletExplorer.com"',
+                "address,balance,incoming txs,last used in block"]
+        for i in range(self.addresses_per_wallet):
+            address = "1" + hashlib.sha256(f"{name}{i}{version}".encode()).hexdigest()[:33]
+            rows.append(f"{address},0.0001,{i % 7 + 1},{858000 + i}")
+        filename = f"walletexplorer-{name.replace('.', '_')}-{wallet_id}-addresses-1.csv"
+        return "\n".join(rows) + "\n", filename
+
+    def serve(self, host="127.0.0.1", port=0):
+        """
+        Starts the HTTP server in a daemon thread; `server.url` holds the base URL.
+        """
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with site.lock:
+                    site.requests += 1
+                if site.latency:
+                    time.sleep(site.latency)
+                parsed = urlparse(self.path)
+                parts = [p for p in parsed.path.split("/") if p]
+                extra_headers = {}
+                if not parts:
+                    body, content_type = site.front_page(), "text/html"
+                elif parts[0] == "wallet" and len(parts) == 3 and parse_qs(parsed.query).get("format") == ["csv"]:
+                    body, filename = site.wallet_csv(parts[1])
+                    content_type = "text/csv"
+                    etag = '"' + hashlib.sha256(body.encode()).hexdigest()[:16] + '"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    extra_headers["ETag"] = etag
+                    extra_headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+                elif parts[0] == "wallet" and len(parts) == 3:
+                    body, content_type = site.addresses_page(parts[1]), "text/html"
+                else:
+                    body, content_type = f"<a href='{self.path}/addresses'>show wallet addresses</a>", "text/html"
+                payload = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in extra_headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        server.url = f"http://{host}:{server.server_address[1]}/"
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,290 @@
+"""
+End-to-end benchmark suite on deterministic synthetic data. Every stage of the
+pipeline runs against the same generated chain:
+
+- fetch: `1_get_block_data.fetch_blocks` against a local mock RPC node
+- graph: `2_graph_creation.traverse_folder`
+- txid: `3_transact_and_address_matching.process_all_json_files` and `save_to_csv`
+- aggregation: `2_addresses_collection_from_scraped_csv.process_labeled_folders`
+- labelling: `transaction_labelling.map_transactions_to_labels`
+
+Each stage's time, throughput and peak traced memory are appended with the
+current commit to a history file, and compared with the last recorded run of
+the same configuration on another commit. Stages whose dependencies are not
+installed are reported as skipped.
+
+    python benchmarks/suite.py --blocks 100 --txs 500
+    python benchmarks/suite.py --stages graph txid --fail-on-regression
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from common import REPO_ROOT, load_script, working_directory
+from mock_rpc import MockBitcoinNode
+from synthetic import SyntheticChain
+
+CATEGORIES = ['Exchanges', 'Pools', 'Services_others', 'Gambling']
+
+DEFAULT_HISTORY = os.path.join(REPO_ROOT, "benchmarks", "history.jsonl")
+
+
+def write_scraped_csvs(folder, chain_addresses, wallets, addresses_per_wallet, labelled_share, seed):
+    """
+    Writes per-category wallet CSVs in the WalletExplorer layout. About
+    `labelled_share` of the rows are addresses that appear on the chain, so the
+    labelling stage finds matches.
+    """
+    rng = random.Random(seed)
+    for category in CATEGORIES:
+        os.makedirs(os.path.join(folder, category), exist_ok=True)
+        for w in range(wallets):
+            name = f"{category}Wallet{w}"
+            wallet_id = hashlib.sha256(name.encode()).hexdigest()[:16]
+            rows = [f'"#Wallet {name} ({wallet_id}), page 1 from 1. Source: WalletExplorer.com"',
+                    "address,balance,incoming txs,last used in block"]
+            for i in range(addresses_per_wallet):
+                if chain_addresses and rng.random() < labelled_share:
+                    address = rng.choice(chain_addresses)
+                else:
+                    address = "1" + hashlib.sha256(f"{name}{i}".encode()).hexdigest()[:33]
+                rows.append(f"{address},0.0001,{i % 7 + 1},{858000 + i}")
+            path = os.path.join(folder, category, f"walletexplorer-{name}-{wallet_id}-addresses-1.csv")
+            with open(path, "w") as f:
+                f.write("\n".join(rows) + "\n")
+
+
+class Workspace:
+    """
+    The synthetic chain and a scratch folder shared by the stages. Stages that
+    produce an input of a later stage (the block cache, `txid_addresses.csv`,
+    the `*_addresses.csv` files) write it here.
+    """
+
+    def __init__(self, folder, args):
+        self.folder = folder
+        self.args = args
+        chain = SyntheticChain(txs_per_block=args.txs, max_inputs=args.max_inputs, max_outputs=args.max_outputs,
+                               address_reuse=args.address_reuse, seed=args.seed)
+        self.blocks = chain.blocks(args.blocks)
+        self.n_tx = sum(len(block["tx"]) for block in self.blocks)
+        self.addresses = chain.addresses
+        self.cache_folder = os.path.join(folder, "blocks")
+        self.txid_csv = os.path.join(folder, "txid_addresses.csv")
+        self.scraper_folder = os.path.join(folder, "scraper")
+        self.labels_folder = os.path.join(folder, "labels")
+        write_scraped_csvs(self.scraper_folder, self.addresses, args.wallets, args.addresses_per_wallet,
+                           args.labelled_share, args.seed)
+
+    def block_cache(self):
+        """
+        Returns the block cache folder, writing the blocks directly when the
+        fetch stage did not run.
+        """
+        if not os.path.isdir(self.cache_folder):
+            import block_cache
+
+            cache = block_cache.get_cache(self.cache_folder, self.args.cache_format)
+            for block in self.blocks:
+                cache.save(block, block["height"])
+        return self.cache_folder
+
+
+def stage_fetch(workspace):
+    node = MockBitcoinNode(workspace.blocks, latency=workspace.args.latency)
+    server = node.serve()
+    get_block_data = load_script("raw_bitcoin_data_and_graph_creation/1_get_block_data.py")
+    get_block_data.rpc_url = server.url
+    get_block_data.cache_format = workspace.args.cache_format
+    logging.getLogger().setLevel(logging.WARNING)
+    # a fresh folder every run, so nothing is served from the cache
+    with tempfile.TemporaryDirectory(dir=workspace.folder) as folder, working_directory(folder):
+        get_block_data.fetch_blocks(len(workspace.blocks))
+        if not os.path.isdir(workspace.cache_folder):
+            os.replace("blocks", workspace.cache_folder)
+    server.shutdown()
+    return len(workspace.blocks), "blocks"
+
+
+def stage_graph(workspace):
+    graph_creation = load_script("raw_bitcoin_data_and_graph_creation/2_graph_creation.py")
+    import graph_tool.all as gt
+
+    graph = gt.Graph(directed=True)
+    graph_creation.add_graph_properties(graph)
+    graph_creation.traverse_folder(graph, workspace.block_cache())
+    assert len(graph_creation.reverse_map["transaction_dict"]) == workspace.n_tx
+    return len(workspace.blocks), "blocks"
+
+
+def stage_txid(workspace):
+    txid_matching = load_script("raw_bitcoin_data_and_graph_creation/3_transact_and_address_matching.py")
+    rows = txid_matching.save_to_csv(txid_matching.process_all_json_files(workspace.block_cache()), workspace.txid_csv)
+    return rows, "rows"
+
+
+def stage_aggregation(workspace):
+    collection = load_script("labelled_addresses_scraper/2_addresses_collection_from_scraped_csv.py")
+    os.makedirs(workspace.labels_folder, exist_ok=True)
+    with working_directory(workspace.labels_folder):
+        collection.process_labeled_folders(workspace.scraper_folder, force=True)
+    return len(CATEGORIES) * workspace.args.wallets * workspace.args.addresses_per_wallet, "addresses"
+
+
+def stage_labelling(workspace):
+    import transaction_labelling
+
+    labeled_addresses = transaction_labelling.load_labeled_addresses(workspace.labels_folder, CATEGORIES)
+    labelled = transaction_labelling.map_transactions_to_labels(workspace.txid_csv, labeled_addresses)
+    assert len(labelled), "no transaction was labelled"
+    with open(workspace.txid_csv) as f:
+        return sum(1 for _ in f) - 1, "rows"
+
+
+STAGES = {"fetch": stage_fetch, "graph": stage_graph, "txid": stage_txid,
+          "aggregation": stage_aggregation, "labelling": stage_labelling}
+
+# stages reading the output of other stages; the block cache is written on demand instead
+DEPENDENCIES = {"labelling": ["txid", "aggregation"]}
+
+
+def run_stage(function, workspace, repeat, memory):
+    """
+    Runs a stage `repeat` times for the best wall time, then once under
+    tracemalloc for its peak Python heap (allocations made by C++ extensions
+    such as graph-tool are not traced).
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        units, unit = function(workspace)
+        best = min(best, time.perf_counter() - start)
+    result = {"seconds": best, "units": units, "unit": unit, "throughput": units / best if best else None}
+    if memory:
+        tracemalloc.start()
+        function(workspace)
+        result["peak_mib"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, dirty
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_baseline(history, record):
+    """
+    Latest earlier run with the same configuration on a different commit.
+    """
+    for previous in reversed(history):
+        if previous["config"] == record["config"] and previous["commit"] != record["commit"]:
+            return previous
+    return None
+
+
+def regressions(record, baseline, threshold):
+    """
+    Lists the stages whose throughput fell, or whose peak memory grew, by more than `threshold`.
+    """
+    found = []
+    for name, stage in record["stages"].items():
+        before = baseline["stages"].get(name)
+        if not before or "skipped" in stage or "skipped" in before:
+            continue
+        if before["throughput"] and stage["throughput"] < before["throughput"] * (1 - threshold):
+            found.append(f"{name}: throughput {before['throughput']:.1f} -> {stage['throughput']:.1f} {stage['unit']}/s")
+        if before.get("peak_mib") and stage.get("peak_mib", 0) > before["peak_mib"] * (1 + threshold):
+            found.append(f"{name}: peak memory {before['peak_mib']:.1f} -> {stage['peak_mib']:.1f} MiB")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--blocks", type=int, default=50)
+    parser.add_argument("--txs", type=int, default=500, help="transactions per block")
+    parser.add_argument("--max-inputs", type=int, default=3, help="maximum fan-in of a transaction")
+    parser.add_argument("--max-outputs", type=int, default=3, help="maximum fan-out of a transaction")
+    parser.add_argument("--address-reuse", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency", type=float, default=0.0, help="mock node latency per request (s)")
+    parser.add_argument("--cache-format", choices=["compact", "json"], default="compact")
+    parser.add_argument("--wallets", type=int, default=20, help="scraped wallets per category")
+    parser.add_argument("--addresses-per-wallet", type=int, default=500)
+    parser.add_argument("--labelled-share", type=float, default=0.2,
+                        help="share of wallet addresses taken from the chain")
+    parser.add_argument("--repeat", type=int, default=1, help="timed runs per stage, the best one is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced run measuring peak memory")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON lines file the results are appended to")
+    parser.add_argument("--no-save", action="store_true", help="compare with the history without appending")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on a regression")
+    args = parser.parse_args()
+
+    config = {key: getattr(args, key) for key in ("blocks", "txs", "max_inputs", "max_outputs", "address_reuse",
+                                                   "seed", "latency", "cache_format", "wallets",
+                                                   "addresses_per_wallet", "labelled_share")}
+    required = set(args.stages) | {dependency for name in args.stages for dependency in DEPENDENCIES.get(name, [])}
+    selected = [name for name in STAGES if name in required]
+
+    commit, dirty = git_commit()
+    record = {"commit": commit, "dirty": dirty, "timestamp": datetime.now(timezone.utc).isoformat(),
+              "python": platform.python_version(), "config": config, "stages": {}}
+    with tempfile.TemporaryDirectory() as folder:
+        workspace = Workspace(folder, args)
+        print(f"{len(workspace.blocks)} blocks, {workspace.n_tx} transactions, {len(workspace.addresses)} addresses")
+        for name in selected:
+            try:
+                result = run_stage(STAGES[name], workspace, args.repeat, not args.no_memory)
+            except ImportError as e:
+                result = {"skipped": f"missing dependency: {e.name}"}
+                print(f"{name:12s} skipped ({result['skipped']})")
+            else:
+                memory = f", peak {result['peak_mib']:8.1f} MiB" if "peak_mib" in result else ""
+                print(f"{name:12s} {result['seconds']:8.2f}s, {result['throughput']:10.1f} {result['unit']}/s{memory}")
+            if name in args.stages:
+                record["stages"][name] = result
+
+    history = load_history(args.history)
+    baseline = find_baseline(history, record)
+    if not args.no_save:
+        with open(args.history, "a") as f:
+            f.write(json.dumps(record) + "\n")
+    if baseline is None:
+        print("No earlier run of this configuration on another commit to compare with.")
+        return
+    found = regressions(record, baseline, args.threshold)
+    print(f"Compared with {baseline['commit']} ({baseline['timestamp']}): "
+          f"{len(found)} regression(s) beyond {args.threshold:.0%}")
+    for line in found:
+        print(f"  {line}")
+    if found and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import hashlib
+import random
+
+STANDARD_TYPES = ["pubkeyhash", "scripthash", "witness_v0_keyhash", "witness_v0_scripthash", "witness_v1_taproot"]
+
+
+def _hex_digest(*parts):
+    return hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()
+
+
+class SyntheticChain:
+    """
+    Deterministic generator of blocks shaped like `getblock <hash> 2` output.
+
+    Inputs spend outputs created earlier in the same synthetic chain, so the
+    blocks can also be used to exercise prevout resolution.
+
+    Args:
+    - start_height (int): Height of the first generated block.
+    - txs_per_block (int): Number of transactions per block (including the coinbase).
+    - max_inputs (int): Maximum fan-in of a non-coinbase transaction.
+    - max_outputs (int): Maximum fan-out of a transaction.
+    - address_reuse (float): Probability that an output pays an already used address.
+    - nulldata_rate (float): Probability that a transaction carries an OP_RETURN output.
+    - seed (int): Random seed; the same arguments always produce the same chain.
+    - verbosity (int): 3 adds the `prevout` of every input, like `getblock <hash> 3`.
+    - with_fee (bool): Include the `fee` field of non-coinbase transactions.
+
+    `totals` accumulates the exact input, output and fee amounts in satoshis of
+    everything generated so far.
+    """
+
+    def __init__(self, start_height=850000, txs_per_block=200, max_inputs=3, max_outputs=3,
+                 address_reuse=0.3, nulldata_rate=0.05, seed=42, verbosity=2, with_fee=True):
+        self.start_height = start_height
+        self.txs_per_block = txs_per_block
+        self.max_inputs = max_inputs
+        self.max_outputs = max_outputs
+        self.address_reuse = address_reuse
+        self.nulldata_rate = nulldata_rate
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.verbosity = verbosity
+        self.with_fee = with_fee
+        self.totals = {"inputs": 0, "outputs": 0, "fees": 0}
+        self.addresses = []
+        self.unspent = []
+        self.prev_hash = "0" * 64
+        self.height = start_height
+
+    def _address(self):
+        if self.addresses and self.rng.random() < self.address_reuse:
+            return self.rng.choice(self.addresses)
+        address = "bc1q" + _hex_digest(self.seed, "address", len(self.addresses))[:38]
+        self.addresses.append(address)
+        return address
+
+    def _vout(self, n, value_sats):
+        script_type = self.rng.choice(STANDARD_TYPES)
+        script_hex = "0014" + _hex_digest(self.seed, "script", self.height, n, value_sats)[:40]
+        return {
+            "value": value_sats / 100000000,
+            "n": n,
+            "scriptPubKey": {
+                "asm": "0 " + script_hex[4:],
+                "desc": "addr(...)",
+                "hex": script_hex,
+                "address": self._address(),
+                "type": script_type,
+            },
+        }
+
+    def _take_inputs(self):
+        count = min(len(self.unspent), self.rng.randint(1, self.max_inputs))
+        inputs = []
+        for _ in range(count):
+            inputs.append(self.unspent.pop(self.rng.randrange(len(self.unspent))))
+        return inputs
+
+    def _transaction(self, index):
+        txid = _hex_digest(self.seed, "tx", self.height, index)
+        if index == 0 or not self.unspent:
+            vin = [{"coinbase": _hex_digest(self.height)[:16], "txinwitness": ["00" * 32], "sequence": 4294967295}]
+            total_in = 625000000
+            fee = 0
+        else:
+            spent = self._take_inputs()
+            vin = [{
+                "txid": prev_txid,
+                "vout": prev_n,
+                "scriptSig": {"asm": "", "hex": ""},
+                "txinwitness": [_hex_digest(prev_txid, prev_n) * 2, _hex_digest(prev_n, prev_txid)[:66]],
+                "sequence": 4294967293,
+            } for prev_txid, prev_n, _, _ in spent]
+            if self.verbosity >= 3:
+                for vin_entry, (_, _, value, script) in zip(vin, spent):
+                    vin_entry["prevout"] = {"generated": False, "height": self.height - 1,
+                                            "value": value / 100000000, "scriptPubKey": script}
+            total_in = sum(value for _, _, value, _ in spent)
+            fee = min(total_in // 100, self.rng.randint(200, 20000))
+            self.totals["inputs"] += total_in
+            self.totals["fees"] += fee
+
+        vout = []
+        remaining = total_in - fee
+        n_outputs = self.rng.randint(1, self.max_outputs)
+        for n in range(n_outputs):
+            value = remaining if n == n_outputs - 1 else self.rng.randint(0, remaining)
+            remaining -= value
+            vout.append(self._vout(n, value))
+        if self.rng.random() < self.nulldata_rate:
+            vout.append({"value": 0.0, "n": len(vout),
+                         "scriptPubKey": {"asm": "OP_RETURN", "hex": "6a", "type": "nulldata"}})
+
+        for out in vout:
+            if out["scriptPubKey"]["type"] != "nulldata":
+                self.unspent.append((txid, out["n"], round(out["value"] * 100000000), out["scriptPubKey"]))
+        self.totals["outputs"] += total_in - fee
+
+        size = 10 + 148 * len(vin) + 34 * len(vout)
+        tx = {
+            "txid": txid,
+            "hash": txid,
+            "version": 2,
+            "size": size,
+            "vsize": size,
+            "weight": size * 4,
+            "locktime": 0,
+            "vin": vin,
+            "vout": vout,
+            "hex": "02000000" + "00" * size,
+        }
+        if fee and self.with_fee:
+            tx["fee"] = fee / 100000000
+        return tx
+
+    def next_block(self):
+        """
+        Generates the next block of the chain.
+        """
+        txs = [self._transaction(i) for i in range(self.txs_per_block)]
+        block_hash = _hex_digest(self.seed, "block", self.height)
+        block = {
+            "hash": block_hash,
+            "confirmations": 1,
+            "height": self.height,
+            "version": 536870912,
+            "merkleroot": _hex_digest(self.seed, "merkle", self.height),
+            "time": 1724000000 + 600 * (self.height - self.start_height),
+            "nTx": len(txs),
+            "previousblockhash": self.prev_hash,
+            "tx": txs,
+        }
+        self.prev_hash = block_hash
+        self.height += 1
+        return block
+
+    def blocks(self, n_blocks):
+        return [self.next_block() for _ in range(n_blocks)]
+
+
+def generate_blocks(n_blocks=10, **kwargs):
+    """
+    Generates `n_blocks` consecutive synthetic blocks (see SyntheticChain for options).
+    """
+    return SyntheticChain(**kwargs).blocks(n_blocks)
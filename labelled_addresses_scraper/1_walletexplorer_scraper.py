@@ -1,103 +1,376 @@
 from bs4 import BeautifulSoup
 import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+import argparse
+import hashlib
+import json
 import os
+import queue
+import re
+import sys
+import threading
 import time
 
-############################################
-# Step 1: Static Scraping with BeautifulSoup
-############################################
+# the run instrumentation lives with the pipeline scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'raw_bitcoin_data_and_graph_creation'))
+from instrumentation import recorder
 
-url = "https://www.walletexplorer.com/"
+base_url = "https://www.walletexplorer.com/"
 headers = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
 }
 
-response = requests.get(url, headers=headers)
-soup = BeautifulSoup(response.text, 'html.parser')
-
 # categories to scrape
 wallet_categories = ['Exchanges', 'Pools', 'Services/others', 'Gambling']
 
-wallet_links = {}
+# directory where to save downloaded CSVs, one subfolder per category
+base_download_dir = "scraper"
+
+
+class RateLimiter:
+    """
+    Spaces out requests shared by all download threads to at most `rate` per second.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(self.next_time, now)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class ScrapeManifest:
+    """
+    Record of every scraped wallet (file, content hash, HTTP validators and
+    timestamps), saved after each wallet so an interrupted run can resume.
+
+    Entries are keyed by "category/wallet name".
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def get(self, key):
+        with self.lock:
+            return dict(self.entries.get(key, {}))
+
+    def is_fresh(self, key, max_age):
+        """
+        True if the wallet was checked less than `max_age` seconds ago and its file is still there.
+        """
+        entry = self.get(key)
+        return (bool(entry) and time.time() - entry.get('checked_at', 0) < max_age
+                and os.path.exists(entry.get('file', '')))
+
+    def record(self, key, **fields):
+        with self.lock:
+            self.entries.setdefault(key, {}).update(fields, checked_at=time.time())
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(self.path + '.tmp', self.path)
+
 
-# extract the wallet links for each category
-for category in wallet_categories:
-    h3_tag = soup.find('h3', string=lambda text: category in text if text else False)
-    if h3_tag:
-        section = h3_tag.find_next('ul')
-        links = section.find_all('a', href=True)
-        wallet_links[category] = {link.text: link['href'] for link in links}
-    else:
-        print(f"Category {category} not found.")
+def file_sha256(file_path):
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def make_session(pool_size=8):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=3)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(headers)
+    return session
+
+############################################
+# Step 1: Static Scraping with BeautifulSoup
+############################################
+
+def get_wallet_links(session, url=base_url):
+    """
+    Collects the wallet links listed under each category on the WalletExplorer front page.
+
+    Returns:
+    - dict: {category: {wallet name: relative url}}
+    """
+    response = session.get(url, timeout=30)
+    soup = BeautifulSoup(response.text, 'html.parser')
+
+    wallet_links = {}
+
+    # extract the wallet links for each category
+    for category in wallet_categories:
+        h3_tag = soup.find('h3', string=lambda text: category in text if text else False)
+        if h3_tag:
+            section = h3_tag.find_next('ul')
+            links = section.find_all('a', href=True)
+            wallet_links[category] = {link.text: link['href'] for link in links}
+        else:
+            print(f"Category {category} not found.")
+
+    return wallet_links
 
 ############################################
-# Step 2: Dynamic Scraping with Selenium
+# Step 2: Direct CSV downloads over HTTP
 ############################################
 
-# ChromeDriver -- replace
-driver_path = '/Users/ekaterinabasova/Downloads/chromedriver-mac-arm64/chromedriver'  # Update with your actual path
-
-# directory where to save downloaded CSVs
-base_download_dir = "/Users/ekaterinabasova/Documents/HU/Projects/itsec_blockchain_bitcoin_2024/2_collecting_scraped_addresses/scraper"  # Base directory
-
-# Chrome options
-options = webdriver.ChromeOptions()
-prefs = {"download.default_directory": base_download_dir}  # Base directory will be updated later
-options.add_experimental_option("prefs", prefs)
-
-# WebDriver Service
-service = Service(executable_path=driver_path)
-
-# ensuring all download directories exist
-for category in wallet_links.keys():
-    download_dir = os.path.join(base_download_dir, category.replace('/', '_'))  # Replace slashes in directory names
-    if not os.path.exists(download_dir):
-        os.makedirs(download_dir)
-
-# visit each wallet's page, show addresses, and download the CSV
-def download_wallet_csv(name, relative_url, download_dir):
-    options = webdriver.ChromeOptions()
-    prefs = {"download.default_directory": download_dir}
-    options.add_experimental_option("prefs", prefs)
-    
-    driver = webdriver.Chrome(service=service, options=options)
-    
-    wallet_url = f"https://www.walletexplorer.com{relative_url}"
-    driver.get(wallet_url)
+def csv_filename(response, name):
+    disposition = response.headers.get('Content-Disposition', '')
+    match = re.search(r'filename="?([^";]+)"?', disposition)
+    if match:
+        return os.path.basename(match.group(1))
+    return f"walletexplorer-{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}-addresses-1.csv"
+
 
+def download_wallet_csv(session, limiter, manifest, key, name, relative_url, download_dir, url=base_url):
+    """
+    Opens a wallet's address page, follows its "Download as CSV" link and
+    writes the file once the download has completed. The CSV request is
+    conditional on the validators stored in the manifest, and a file whose
+    content hash did not change is left untouched.
+
+    Returns:
+    - tuple: (path of the CSV or None on failure, whether its content changed)
+    """
+    previous = manifest.get(key)
     try:
+        limiter.wait()
+        addresses_url = urljoin(url, relative_url.rstrip('/') + '/addresses')
+        with recorder.timed('page_seconds'):
+            page = session.get(addresses_url, timeout=30)
+        page.raise_for_status()
+
+        csv_link = BeautifulSoup(page.text, 'html.parser').find('a', string='Download as CSV', href=True)
+        if csv_link is None:
+            print(f"Failed to download CSV for {name}: no CSV link on {addresses_url}")
+            return None, False
+
+        conditional = {}
+        if previous.get('etag'):
+            conditional['If-None-Match'] = previous['etag']
+        if previous.get('last_modified'):
+            conditional['If-Modified-Since'] = previous['last_modified']
+
+        limiter.wait()
+        start = time.perf_counter()
+        response = session.get(urljoin(addresses_url, csv_link['href']), headers=conditional, timeout=60)
+        recorder.observe('csv_download_latency', time.perf_counter() - start)
+        recorder.count('bytes_downloaded', len(response.content))
+        if response.status_code == 304 and os.path.exists(previous.get('file', '')):
+            manifest.record(key)
+            return previous['file'], False
+        response.raise_for_status()
+
+        validators = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+        sha256 = hashlib.sha256(response.content).hexdigest()
+        if sha256 == previous.get('sha256') and os.path.exists(previous.get('file', '')):
+            manifest.record(key, **validators)
+            return previous['file'], False
+
+        # write to a temporary name first so a partial download never looks complete
+        file_path = os.path.join(download_dir, csv_filename(response, name))
+        with open(file_path + '.part', 'wb') as f:
+            f.write(response.content)
+        os.replace(file_path + '.part', file_path)
+        if previous.get('file') and previous['file'] != file_path and os.path.exists(previous['file']):
+            os.remove(previous['file'])
+
+        manifest.record(key, file=file_path, sha256=sha256, downloaded_at=time.time(), **validators)
+        print(f"Downloaded CSV for {name} in {download_dir}")
+        return file_path, True
+
+    except Exception as e:
+        print(f"Failed to download CSV for {name}: {e}")
+        return None, False
+
+############################################
+# Alternative: pool of headless browsers
+############################################
+
+class BrowserPool:
+    """
+    Bounded pool of headless Chrome instances that are reused across wallets.
+    """
+
+    def __init__(self, size, driver_path, download_dir):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+
+        self.drivers = queue.Queue()
+        self.all_drivers = []
+        for _ in range(size):
+            options = webdriver.ChromeOptions()
+            options.add_argument('--headless=new')
+            options.add_experimental_option("prefs", {"download.default_directory": os.path.abspath(download_dir)})
+            driver = webdriver.Chrome(service=Service(executable_path=driver_path), options=options)
+            self.drivers.put(driver)
+            self.all_drivers.append(driver)
+
+    def acquire(self):
+        return self.drivers.get()
+
+    def release(self, driver):
+        self.drivers.put(driver)
+
+    def close(self):
+        for driver in self.all_drivers:
+            driver.quit()
+
+
+def wait_for_download(download_dir, known_files, name, timeout=60):
+    """
+    Waits until a new, fully written CSV for wallet `name` appears in
+    `download_dir` instead of sleeping a fixed time.
+    """
+    # WalletExplorer file names contain the wallet name with punctuation replaced by underscores
+    name_hint = re.sub(r'[^A-Za-z0-9]', '_', name)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        files = set(os.listdir(download_dir))
+        new_csvs = [f for f in files - known_files if f.endswith('.csv') and name_hint in f]
+        if new_csvs and not any(f.endswith('.crdownload') for f in files):
+            return os.path.join(download_dir, new_csvs[0])
+        time.sleep(0.2)
+    return None
+
+
+def download_wallet_csv_browser(pool, limiter, manifest, key, name, relative_url, download_dir, url=base_url):
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    driver = pool.acquire()
+    try:
+        # downloads go to the folder the browser was started with, so point it at this category
+        driver.execute_cdp_cmd('Page.setDownloadBehavior', {'behavior': 'allow', 'downloadPath': os.path.abspath(download_dir)})
+        limiter.wait()
+        driver.get(urljoin(url, relative_url))
+
         # waiting for the <show wallet addresses> link and click it
-        show_wallet_addresses_link = WebDriverWait(driver, 20).until(
-            EC.element_to_be_clickable((By.LINK_TEXT, "show wallet addresses"))
-        )
-        show_wallet_addresses_link.click()
+        WebDriverWait(driver, 20).until(EC.element_to_be_clickable((By.LINK_TEXT, "show wallet addresses"))).click()
 
         # waiting for the <download as CSV> link and clicking it
-        download_csv_link = WebDriverWait(driver, 20).until(
-            EC.element_to_be_clickable((By.LINK_TEXT, "Download as CSV"))
-        )
+        download_csv_link = WebDriverWait(driver, 20).until(EC.element_to_be_clickable((By.LINK_TEXT, "Download as CSV")))
+        known_files = set(os.listdir(download_dir))
+        previous = manifest.get(key)
+        previous_file = previous.get('file')
+        previous_stat = os.stat(previous_file) if previous_file and os.path.exists(previous_file) else None
         download_csv_link.click()
 
-        # short delay to ensure the file has time to download
-        time.sleep(8)
+        file_path = wait_for_download(download_dir, known_files, name)
+        if file_path is None:
+            print(f"Failed to download CSV for {name}: download did not finish")
+            return None, False
+
+        sha256 = file_sha256(file_path)
+        if previous_stat is not None and sha256 == previous.get('sha256'):
+            # unchanged: keep the previous file and its modification time
+            if file_path != previous_file:
+                os.remove(file_path)
+            else:
+                os.utime(previous_file, ns=(previous_stat.st_atime_ns, previous_stat.st_mtime_ns))
+            manifest.record(key)
+            return previous_file, False
 
+        # Chrome saves re-downloads as "name (1).csv", so move them back over the previous file
+        if previous_file and previous_file != file_path:
+            os.replace(file_path, previous_file)
+            file_path = previous_file
+
+        manifest.record(key, file=file_path, sha256=sha256, downloaded_at=time.time())
         print(f"Downloaded CSV for {name} in {download_dir}")
+        return file_path, True
 
     except Exception as e:
         print(f"Failed to download CSV for {name}: {e}")
-    
-    driver.quit()
+        return None, False
+    finally:
+        pool.release(driver)
+
+
+def scrape(url=base_url, download_root=base_download_dir, workers=4, rate=2.0, mode='http', driver_path=None,
+           max_age=24 * 3600):
+    """
+    Downloads the address CSVs of every wallet in every category, `workers` at a
+    time and at most `rate` requests per second overall. Wallets checked less
+    than `max_age` seconds ago according to `{download_root}/manifest.json` are
+    skipped, which also resumes an interrupted run.
+
+    Returns:
+    - dict: {category: list of CSV paths whose content changed}
+    """
+    os.makedirs(download_root, exist_ok=True)
+    manifest = ScrapeManifest(os.path.join(download_root, 'manifest.json'))
+    session = make_session(workers)
+    limiter = RateLimiter(rate)
+    wallet_links = get_wallet_links(session, url)
+
+    # browser downloads are synchronous per driver, so the pool size is the concurrency
+    pool = BrowserPool(workers, driver_path, download_root) if mode == 'browser' else None
+    changed, unchanged, skipped, failed = {}, 0, 0, 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for category, wallets in wallet_links.items():
+                download_dir = os.path.join(download_root, category.replace('/', '_'))  # Ensure safe folder names
+                os.makedirs(download_dir, exist_ok=True)
+                for name, relative_url in wallets.items():
+                    key = f"{category}/{name}"
+                    if manifest.is_fresh(key, max_age):
+                        skipped += 1
+                        continue
+                    download = download_wallet_csv_browser if pool is not None else download_wallet_csv
+                    future = executor.submit(download, pool if pool is not None else session, limiter, manifest, key,
+                                             name, relative_url, download_dir, url)
+                    futures[future] = category
+            for future, category in futures.items():
+                file_path, is_changed = future.result()
+                if file_path is None:
+                    failed += 1
+                elif is_changed:
+                    changed.setdefault(category, []).append(file_path)
+                else:
+                    unchanged += 1
+    finally:
+        if pool is not None:
+            pool.close()
+        session.close()
+
+    for counter, value in (('wallets_changed', sum(len(files) for files in changed.values())),
+                           ('wallets_unchanged', unchanged), ('wallets_skipped', skipped), ('wallets_failed', failed)):
+        recorder.count(counter, value)
+    print(f"{sum(len(files) for files in changed.values())} changed, {unchanged} unchanged, "
+          f"{skipped} skipped as recently checked, {failed} failed.")
+    return changed
 
-# iterating through each category
-for category, wallets in wallet_links.items():
-    category_download_dir = os.path.join(base_download_dir, category.replace('/', '_'))  # Ensure safe folder names
-    for name, relative_url in wallets.items():
-        download_wallet_csv(name, relative_url, category_download_dir)
 
-print("All CSV files have been downloaded.")
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Download the address CSVs of all WalletExplorer wallets.")
+    parser.add_argument('--url', default=base_url, help="WalletExplorer base URL (e.g. a locally served copy)")
+    parser.add_argument('--output', default=base_download_dir, help="folder for the per-category CSVs")
+    parser.add_argument('--workers', type=int, default=4, help="concurrent downloads")
+    parser.add_argument('--rate', type=float, default=2.0, help="maximum requests per second")
+    parser.add_argument('--mode', choices=['http', 'browser'], default='http',
+                        help="fetch CSV links directly, or click through a pool of headless Chrome instances")
+    parser.add_argument('--driver-path', help="ChromeDriver path for --mode browser")
+    parser.add_argument('--max-age', type=float, default=24, help="hours before an already scraped wallet is checked again")
+    args = parser.parse_args()
 
+    with recorder.stage('scraping'):
+        scrape(args.url, args.output, args.workers, args.rate, args.mode, args.driver_path, args.max_age * 3600)
+    print("All CSV files have been downloaded.")
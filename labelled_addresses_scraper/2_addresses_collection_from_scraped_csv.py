@@ -1,47 +1,102 @@
+import argparse
+import json
 import os
+import sys
+import numpy as np
 import pandas as pd
 
+# the run instrumentation and the label index live with the pipeline scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'raw_bitcoin_data_and_graph_creation'))
+from instrumentation import recorder
+from label_index import build_label_index, read_scraped_folder, save_label_index
+
 scraper_folder = 'scraper'
 
-def extract_addresses(folder_path, address_column='address'):
-    addresses = []
+# fingerprints of the scraped CSVs each *_addresses.csv was last built from
+state_file = 'aggregation_state.json'
+
+# address -> (category, wallet) index of all categories, see label_index.py
+index_folder = 'label_index'
 
-    for file_name in os.listdir(folder_path):
+def folder_fingerprint(folder_path):
+    """
+    Size and modification time of every CSV in a category folder. The scraper
+    leaves files of unchanged wallets untouched, so an equal fingerprint means
+    no wallet of the category changed.
+    """
+    fingerprint = {}
+    for file_name in sorted(os.listdir(folder_path)):
         if file_name.endswith('.csv'):
-            file_path = os.path.join(folder_path, file_name)
-            print(f"Reading file: {file_path}")
+            stat = os.stat(os.path.join(folder_path, file_name))
+            fingerprint[file_name] = [stat.st_size, stat.st_mtime_ns]
+    return fingerprint
 
-            try:
-                # skip first row and read the second row as headers
-                df = pd.read_csv(file_path, skiprows=1)
+def load_state(path=state_file):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {}
 
-                # checking if the specified address column exists
-                if address_column in df.columns:
-                    df = df[[address_column]].copy()  # keeping only the address column
-                    addresses.append(df)
-                    print(f"Extracted {len(df)} addresses from {file_name}.")
-                else:
-                    print(f"No '{address_column}' column found in {file_name}. Column names found: {df.columns}")
+def save_state(state, path=state_file):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
 
-            except Exception as e:
-                print(f"Error reading {file_path}: {e}")
+def process_labeled_folders(scraper_folder, force=False, workers=0, index_folder=index_folder):
+    """
+    Writes one deduplicated, sorted `{category}_addresses.csv` per category
+    folder, skipping categories whose scraped CSVs did not change since the
+    last run, and the address -> (category, wallet) index of all of them.
 
-    return pd.concat(addresses, ignore_index=True) if addresses else pd.DataFrame()
+    Args:
+    - scraper_folder (str): Folder with one subfolder of wallet CSVs per category.
+    - force (bool): Rebuild every category regardless of the saved state.
+    - workers (int): Number of processes reading the scraped CSVs (0 = serial).
+    - index_folder (str): Output folder of the label index.
+    """
+    state = load_state()
 
-def process_labeled_folders(scraper_folder):
-    for folder_name in os.listdir(scraper_folder):
+    changed = {}
+    for folder_name in sorted(os.listdir(scraper_folder)):
         folder_path = os.path.join(scraper_folder, folder_name)
         if os.path.isdir(folder_path):
-            print(f"Processing folder: {folder_name}...")
+            output_file = f"{folder_name}_addresses.csv"
+            fingerprint = folder_fingerprint(folder_path)
+            if not force and state.get(folder_name) == fingerprint and os.path.exists(output_file):
+                print(f"Skipping {folder_name}: no wallet changed since the last run.")
+                continue
+            changed[folder_name] = fingerprint
+
+    if not changed and os.path.isdir(index_folder):
+        return
+
+    # the index merges all categories, so all are read, but only the changed ones are rewritten
+    scraped = read_scraped_folder(scraper_folder, workers)
+    for folder_name, fingerprint in changed.items():
+        print(f"Processing folder: {folder_name}...")
+        wallet_addresses = [addresses for _, addresses in scraped[folder_name]]
+
+        if sum(len(addresses) for addresses in wallet_addresses):
+            # one row per address, sorted, so reruns produce identical files
+            addresses = np.char.decode(np.unique(np.concatenate(wallet_addresses)))
+            pd.DataFrame({'address': addresses}).to_csv(f"{folder_name}_addresses.csv", index=False)
+            recorder.count('addresses', len(addresses))
+            print(f"Saved {len(addresses)} unique addresses to {folder_name}_addresses.csv")
+        else:
+            print(f"No addresses found in {folder_name}.")
 
-            addresses_df = extract_addresses(folder_path, address_column='address')
+        state[folder_name] = fingerprint
+        save_state(state)
 
-            if not addresses_df.empty:
-                output_file = f"{folder_name}_addresses.csv"
-                addresses_df.to_csv(output_file, index=False)
-                print(f"Saved addresses to {output_file}")
-            else:
-                print(f"No addresses found in {folder_name}.")
+    index = build_label_index(scraped)
+    save_label_index(index, index_folder)
+    print(f"Saved {len(index['addresses'])} labelled addresses from {len(index['wallets'])} wallets to {index_folder}/")
 
-process_labeled_folders(scraper_folder)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Collect the scraped wallet addresses per category.")
+    parser.add_argument('--force', action='store_true', help="rebuild every category, even if unchanged")
+    parser.add_argument('--workers', type=int, default=0, help="processes reading the scraped CSVs (0 = serial)")
+    args = parser.parse_args()
 
+    with recorder.stage('address_aggregation'):
+        process_labeled_folders(scraper_folder, args.force, args.workers)
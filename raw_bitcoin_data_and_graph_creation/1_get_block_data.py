@@ -1,58 +1,90 @@
-import requests
-import json
-import csv
-from collections import defaultdict
+import argparse
+import asyncio
 import logging
-import dash
-from dash import dcc, html, dash_table
-from dash.dependencies import Input, Output
 import os
-import networkx as nx
+from block_cache import get_cache
+from chain_follower import ChainFollower
+from instrumentation import profiled, recorder
+from rpc_client import BatchRpcClient
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # QuickNode RPC URL
-rpc_url = "--"
+rpc_url = os.environ.get("RPC_URL", "--")
 
+# block cache format: "compact" (binary .blk files) or "json" (the original pretty-printed files)
+cache_format = os.environ.get("BLOCK_CACHE_FORMAT", "compact")
+
+# getblock verbosity: 3 also returns the output spent by each input (`prevout`), if the node supports it
+block_verbosity = int(os.environ.get("BLOCK_VERBOSITY", "2"))
+
+# shared keep-alive client, created on first use so rpc_url can still be changed before fetching
+_client = None
+
+def get_client(batch_size=10, max_workers=4):
+    global _client
+    if _client is None or _client.rpc_url != rpc_url:
+        _client = BatchRpcClient(rpc_url, batch_size=batch_size, max_workers=max_workers)
+    _client.batch_size = batch_size
+    _client.resize(max_workers)
+    return _client
+
+@profiled
 def rpc_call(method, params=[]):
-    headers = {'Content-Type': 'application/json'}
-    payload = json.dumps({
-        "jsonrpc": "2.0",
-        "id": "curltest",
-        "method": method,
-        "params": params
-    })
-    response = requests.post(rpc_url, headers=headers, data=payload, timeout=30)
-    response.raise_for_status()
-    return response.json()['result']
+    return get_client().call(method, params)
 
 def get_block_from_cache(height):
-    cache_file = f'blocks/block_{height}.json'
-    if os.path.exists(cache_file):
-        with open(cache_file, 'r') as f:
-            return json.load(f)
-    return None
+    return get_cache('blocks', cache_format).get(height)
 
 def save_block_to_cache(block, height):
-    os.makedirs('blocks', exist_ok=True)
-    cache_file = f'blocks/block_{height}.json'
-    with open(cache_file, 'w') as f:
-        json.dump(block, f, indent=2)
+    get_cache('blocks', cache_format).save(block, height)
+
+def fetch_blocks(num_blocks=10, batch_size=10, max_workers=4):
+    with recorder.stage("fetch"):
+        return _fetch_blocks(num_blocks, batch_size, max_workers)
 
-def fetch_blocks(num_blocks=10):
+def _fetch_blocks(num_blocks, batch_size, max_workers):
     logging.info(f"Fetching the last {num_blocks} blocks")
-    current_height = rpc_call("getblockcount")
-    blocks = []
-    for height in range(current_height, current_height - num_blocks, -1):
+    client = get_client(batch_size, max_workers)
+    current_height = client.call("getblockcount")
+    heights = list(range(current_height, current_height - num_blocks, -1))
+
+    blocks = {}
+    missing = []
+    for height in heights:
         cached_block = get_block_from_cache(height)
         if cached_block:
             logging.info(f"Using cached data for block at height {height}")
-            blocks.append(cached_block)
+            blocks[height] = cached_block
+            recorder.count("blocks_cached")
         else:
-            logging.info(f"Fetching block at height {height}")
-            block_hash = rpc_call("getblockhash", [height])
-            block = rpc_call("getblock", [block_hash, 2])
+            missing.append(height)
+
+    # uncached blocks are fetched in JSON-RPC batches over the pooled session
+    logging.info(f"Fetching {len(missing)} blocks in batches of {batch_size} ({max_workers} in flight)")
+    for height, block in client.iter_blocks(missing, block_verbosity):
+        logging.info(f"Fetched block at height {height}")
+        with recorder.block(height):
             save_block_to_cache(block, height)
-            blocks.append(block)
-    return blocks
-blocks = fetch_blocks(1000)
+        recorder.count("blocks_fetched")
+        blocks[height] = block
+
+    return [blocks[height] for height in heights]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fetch the latest blocks into the block cache.")
+    parser.add_argument("--blocks", type=int, default=1000, help="number of blocks below the tip to fetch")
+    parser.add_argument("--follow", action="store_true",
+                        help="then keep following the chain tip until interrupted (see chain_follower.py)")
+    parser.add_argument("--poll", type=float, default=5.0, help="seconds between tip polls when following")
+    args = parser.parse_args()
+
+    blocks = fetch_blocks(args.blocks)
+    if args.follow:
+        del blocks
+        follower = ChainFollower(get_client(), get_cache('blocks', cache_format), verbosity=block_verbosity,
+                                 poll_interval=args.poll)
+        try:
+            asyncio.run(follower.run())
+        except KeyboardInterrupt:
+            pass
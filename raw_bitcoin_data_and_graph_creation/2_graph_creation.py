@@ -1,18 +1,32 @@
+import argparse
 import json
 import os
 import graph_tool.all as gt
 from tqdm import tqdm
-from decimal import Decimal
 import traceback
 import dill as pickle
 from collections import defaultdict
+from address_store import AddressStats, graph_edge_arrays, save_address_table
+from block_cache import iter_block_files, load_block_records
+from graph_builder import (NEXT_NODE, PREV_NODE, STANDARD_SCRIPT_TYPES, TX_TYPES, build_graph_parallel, is_compact,
+                           update_graph)
+from graph_schema import add_compact_properties, save_vertex_strings, strings_path
+from graph_windows import GraphWindows, save_partitions
+from input_resolution import SATOSHI_PER_BTC, OutpointResolver, satoshi_to_btc
+from instrumentation import profiled, recorder
+from outpoint_index import OutpointIndex
+from revmap_index import load_reverse_map, save_index
 
 reverse_map = defaultdict(dict)
 
-def satoshi_to_btc(satoshi):
-    return float(Decimal(satoshi) / Decimal(100000000))
+# outputs of the transactions processed so far, used to resolve the value and address of inputs
+outpoints = OutpointResolver()
+
+def add_graph_properties(graph, schema="legacy"):
+    if schema == "compact":
+        add_compact_properties(graph)
+        return
 
-def add_graph_properties(graph):
     # transaction node properties
     for prop in ["tx_hash", "tx_inputs_count", "tx_inputs_value", "tx_outputs_count", 
                  "tx_outputs_value", "tx_block_height", "tx_block_time", "tx_fee", "tx_size"]:
@@ -31,6 +45,9 @@ def add_graph_properties(graph):
 def add_tx_node(graph, **kwargs):
     tx_node = graph.add_vertex()
     for key, value in kwargs.items():
+        if key == "hash" and is_compact(graph):
+            # the compact schema keeps txids in the reverse map only
+            continue
         graph.vp[f"tx_{key}"][tx_node] = value
     reverse_map["transaction_dict"][kwargs["hash"]] = graph.vertex_index[tx_node]
     return tx_node
@@ -39,8 +56,11 @@ def add_address_node(graph, address, node_type):
     if address not in reverse_map["account_dict"]:
         ads_node = graph.add_vertex()
         reverse_map["account_dict"][address] = graph.vertex_index[ads_node]
-        graph.vp["address"][ads_node] = address
-        graph.vp[f"{node_type}_type"][ads_node] = "unknown"
+        if is_compact(graph):
+            graph.vp["node_type"][ads_node] = PREV_NODE if node_type == "prev" else NEXT_NODE
+        else:
+            graph.vp["address"][ads_node] = address
+            graph.vp[f"{node_type}_type"][ads_node] = "unknown"
     else:
         ads_node = graph.vertex(reverse_map["account_dict"][address])
     return ads_node
@@ -55,44 +75,60 @@ def add_edge(graph, source, target, value, time):
         print(f"Error adding edge: {e}")
         return None
 
+def set_tx_type(graph, edge, tx_type):
+    # the compact schema stores the index of the type in TX_TYPES
+    graph.ep["tx_type"][edge] = TX_TYPES.index(tx_type) if is_compact(graph) else tx_type
+
+@profiled
 def process_transaction(graph, tx, block_height, block_time):
     try:
         tx_hash = tx["txid"]
-        
+
+        # (satoshis or None, address) per spent output, from `prevout` or the outpoint map
+        inputs = [outpoints.resolve_vin(vin) for vin in tx["vin"] if "coinbase" not in vin]
+        outputs = [int(round(vout["value"] * SATOSHI_PER_BTC)) for vout in tx["vout"]]
+        inputs_value = sum(value for value, _ in inputs if value is not None)
+        if "fee" in tx:
+            fee = int(round(tx["fee"] * SATOSHI_PER_BTC))
+        elif inputs and all(value is not None for value, _ in inputs):
+            fee = inputs_value - sum(outputs)
+        else:
+            fee = 0
+
         tx_node = add_tx_node(
             graph,
             hash=tx_hash,
             inputs_count= len(tx["vin"]),
-            inputs_value= sum(satoshi_to_btc(vin.get("value", 0)) for vin in tx["vin"] if "value" in vin),
+            inputs_value= satoshi_to_btc(inputs_value),
             outputs_count=len(tx["vout"]),
-            outputs_value=sum(satoshi_to_btc(vout["value"]) for vout in tx["vout"]),
+            outputs_value=satoshi_to_btc(sum(outputs)),
             block_height=block_height,
             block_time=block_time,
-            fee=satoshi_to_btc(tx.get("fee", 0)),
+            fee=satoshi_to_btc(fee),
             size=tx["size"]
         )
 
-        for vin in tx["vin"]:
-            if "coinbase" not in vin:
-                input_address = vin.get("address", "unknown")
-                input_node = add_address_node(graph, input_address, "prev")
-                edge = add_edge(graph, input_node, tx_node, satoshi_to_btc(vin.get("value", 0)), block_time)
-                if edge:
-                    graph.ep["tx_type"][edge] = "standard"
+        for value, input_address in inputs:
+            input_node = add_address_node(graph, input_address, "prev")
+            edge = add_edge(graph, input_node, tx_node, satoshi_to_btc(value or 0), block_time)
+            if edge:
+                set_tx_type(graph, edge, "standard")
 
-        for vout in tx["vout"]:
+        for vout, value in zip(tx["vout"], outputs):
             if vout["scriptPubKey"].get("type") == "nulldata":
                 op_return_node = add_address_node(graph, "OP_RETURN", "next")
                 edge = add_edge(graph, tx_node, op_return_node, 0, block_time)
                 if edge:
-                    graph.ep["tx_type"][edge] = "op_return"
+                    set_tx_type(graph, edge, "op_return")
             else:
                 output_address = vout["scriptPubKey"].get("address", "unknown")
                 output_node = add_address_node(graph, output_address, "next")
-                edge = add_edge(graph, tx_node, output_node, satoshi_to_btc(vout["value"]), block_time)
+                edge = add_edge(graph, tx_node, output_node, satoshi_to_btc(value), block_time)
                 if edge:
                     script_type = vout["scriptPubKey"].get("type", "unknown")
-                    graph.ep["tx_type"][edge] = "complex" if script_type not in ["pubkey", "pubkeyhash", "scripthash", "witness_v0_keyhash", "witness_v0_scripthash"] else "standard"
+                    set_tx_type(graph, edge, "complex" if script_type not in STANDARD_SCRIPT_TYPES else "standard")
+
+        outpoints.add_tx_outputs(tx)
 
     except Exception as e:
         print(f"Error processing transaction {tx.get('txid', 'unknown')}: {e}")
@@ -102,6 +138,14 @@ def process_block(graph, block_data):
     try:
         block_height = block_data["height"]
         block_time = block_data["time"]
+        reverse_map["block_dict"][block_height] = block_data.get("hash")
+
+        # an index-backed resolver loads the outputs the block spends in one batched lookup, not one per input
+        spent = [(vin.get("txid"), vin.get("vout")) for tx in block_data["tx"] for vin in tx["vin"]
+                 if "coinbase" not in vin and "prevout" not in vin]
+        if spent:
+            txids, ns = zip(*spent)
+            outpoints.prefetch(list(txids), list(ns))
 
         for tx in block_data["tx"]:
             process_transaction(graph, tx, block_height, block_time)
@@ -110,30 +154,101 @@ def process_block(graph, block_data):
         traceback.print_exc()
 
 def traverse_folder(graph, folder_path):
-    for filename in tqdm(os.listdir(folder_path)):
-        if filename.endswith(".json"):
-            file_path = os.path.join(folder_path, filename)
-            try:
-                with open(file_path, 'r') as json_file:
-                    try:
-                        block_data = json.load(json_file)
-                        process_block(graph, block_data)
-                    except json.JSONDecodeError as e:
-                        print(f"Error decoding JSON in file {file_path}: {e}")
-            except Exception as e:
-                print(f"Error processing file {filename}: {e}")
-                traceback.print_exc()
+    for height, file_path in tqdm(iter_block_files(folder_path)):
+        try:
+            with recorder.block(height):
+                block_data = load_block_records(file_path)
+                process_block(graph, block_data)
+            recorder.count("blocks")
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON in file {file_path}: {e}")
+        except Exception as e:
+            print(f"Error processing file {file_path}: {e}")
+            traceback.print_exc()
 
 if __name__ == '__main__':
-    graph = gt.Graph(directed=True)
-    add_graph_properties(graph)
+    parser = argparse.ArgumentParser(description="Build BitcoinGraph.gt and revmap.pkl from the cached blocks.")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="parse blocks in a pool of this many processes and build the graph in bulk (0 = serial)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="load the existing graph and reverse map and only add blocks that are not in it yet")
+    parser.add_argument("--reorg-depth", type=int, default=6,
+                        help="number of blocks below the recorded tip checked for reorgs in incremental mode")
+    parser.add_argument("--no-pickle", action="store_true",
+                        help="only write the memory-mapped revmap_index/ folder, not revmap.pkl")
+    parser.add_argument("--outpoint-index", metavar="FOLDER",
+                        help="update this outpoint index (see outpoint_index.py) and resolve inputs from it; "
+                             "--incremental runs use outpoint_index/ by default")
+    parser.add_argument("--windows", type=int, metavar="BLOCKS",
+                        help="also write one graph per BLOCKS-block window to graph_windows/ (see graph_windows.py)")
+    parser.add_argument("--address-table", action="store_true",
+                        help="also keep per-address aggregates and write the address_table/ folder (see address_store.py)")
+    parser.add_argument("--schema", choices=["legacy", "compact"], default="legacy",
+                        help="property schema of a new graph; incremental runs keep the schema of the loaded graph "
+                             "(see graph_schema.py)")
+    args = parser.parse_args()
 
     folder_path = os.path.join(os.getcwd().replace('\\', '/'), 'blocks')
-    traverse_folder(graph, folder_path)
-
-    with open("revmap.pkl", "wb") as f:
-        pickle.dump(dict(reverse_map), f)
+    resolver = None
+    changed_heights = None
+    if args.outpoint_index:
+        index = OutpointIndex(args.outpoint_index)
+        index.update(folder_path, args.reorg_depth)
+        resolver = outpoints = index.resolver()
+    has_revmap = os.path.exists("revmap.pkl") or os.path.isdir("revmap_index")
+    incremental = args.incremental and os.path.exists("BitcoinGraph.gt") and has_revmap
+    if incremental:
+        graph = gt.load_graph("BitcoinGraph.gt")
+        reverse_map.update(load_reverse_map(materialize=True))
+    else:
+        graph = gt.Graph(directed=True)
+        add_graph_properties(graph, args.schema)
+    address_stats = None
+    if args.address_table:
+        # the saved aggregates are reused if they match the loaded graph
+        address_stats = AddressStats.for_graph(graph, reverse_map) if incremental else AddressStats()
+
+    vertices, edges = graph.num_vertices(), graph.num_edges()
+    with recorder.stage("graph_creation"):
+        if incremental:
+            added, dropped = update_graph(graph, folder_path, reverse_map, args.workers, args.reorg_depth, resolver,
+                                          address_stats)
+            changed_heights = added + dropped
+            if dropped:
+                print(f"Reorg detected: dropped blocks {dropped[0]}-{dropped[-1]}.")
+            print(f"Added {len(added)} new blocks.")
+        elif args.workers > 0:
+            build_graph_parallel(graph, folder_path, reverse_map, workers=args.workers, resolver=resolver,
+                                 address_stats=address_stats)
+        else:
+            traverse_folder(graph, folder_path)
+            if address_stats is not None:
+                # the serial builder adds edges one at a time, so the aggregates are computed in one pass after it
+                address_stats.rebuild(graph, reverse_map)
+        # net counts: a reorg removes vertices and edges before adding new ones
+        recorder.count("vertices_added", graph.num_vertices() - vertices)
+        recorder.count("edges_added", graph.num_edges() - edges)
+
+    if not args.no_pickle:
+        with open("revmap.pkl", "wb") as f:
+            pickle.dump(dict(reverse_map), f)
+    elif os.path.exists("revmap.pkl"):
+        # an older pickle would miss the blocks added by this run
+        os.remove("revmap.pkl")
+    save_index(reverse_map, "revmap_index")
 
     graph.save("BitcoinGraph.gt")
+    if is_compact(graph):
+        save_vertex_strings(reverse_map, graph.num_vertices(), strings_path("BitcoinGraph.gt"))
+
+    if args.windows:
+        # in incremental mode only the windows of added or dropped heights are rewritten
+        written = save_partitions(GraphWindows(graph, reverse_map), "graph_windows", args.windows, changed_heights)
+        print(f"Saved {len(written)} window graphs to 'graph_windows/'.")
+
+    if address_stats is not None:
+        save_address_table(address_stats, graph_edge_arrays(graph, reverse_map), reverse_map, "address_table",
+                           graph.num_vertices())
+        print("Saved the address table to 'address_table/'.")
 
-    print("Graph generation complete. Files saved as 'BitcoinGraph.gt' and 'revmap.pkl'.")
+    print("Graph generation complete. Files saved as 'BitcoinGraph.gt', 'revmap.pkl' and 'revmap_index/'.")
@@ -1,14 +1,24 @@
+import argparse
 import json
-import os
-import glob
 import csv
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from block_cache import iter_block_files, load_block_columns
+from instrumentation import recorder
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 
 def extract_txid_addresses(data):
     """
     Extracts transaction IDs (txid) and associated output addresses from raw JSON data.
 
     Args:
-    - data (dict): The raw JSON data containing blockchain transaction information.
+    - data (dict or BlockRecord): The raw JSON data containing blockchain transaction information,
+      or a block as returned by `block_cache.load_block_records`.
 
     Returns:
     - list of tuples: A list of (txid, address) tuples.
@@ -24,54 +34,191 @@ def extract_txid_addresses(data):
 
     return txid_addresses
 
-def process_all_json_files(directory):
+def extract_txid_addresses_from_columns(columns):
     """
-    Processes all JSON files in the given directory and extracts txid-address pairs.
+    Same as `extract_txid_addresses`, for a block in the columnar cache layout.
 
     Args:
-    - directory (str): The directory containing JSON files.
+    - columns (dict): A block as returned by `block_cache.load_block_columns`.
 
     Returns:
-    - list of tuples: A consolidated list of (txid, address) tuples from all files.
+    - list of tuples: A list of (txid, address) tuples.
+    """
+    txid_addresses = []
+    vout_address = columns['vout_address']
+    position = 0
+
+    for txid, vout_count in zip(columns['txid'], columns['vout_count']):
+        for address in vout_address[position:position + vout_count]:
+            if address:
+                txid_addresses.append((txid, address))
+        position += vout_count
+
+    return txid_addresses
+
+def load_txid_addresses(block_file):
+    """
+    Loads one cached block file and extracts its txid-address pairs (also used as process pool worker).
+
+    Args:
+    - block_file (str): Path of a `.json` or `.blk` block file.
+
+    Returns:
+    - list of tuples: The (txid, address) tuples of the block, empty if the file can't be read.
+    """
+    try:
+        return extract_txid_addresses_from_columns(load_block_columns(block_file))
+    except json.JSONDecodeError as e:
+        print(f"Error decoding JSON from file {block_file}: {e}")
+    except Exception as e:
+        print(f"Error processing file {block_file}: {e}")
+    return []
+
+def iter_txid_addresses(directory, workers=0, window=16):
+    """
+    Streams txid-address pairs block by block, in block height order, so only a
+    few blocks' rows are held in memory at any time.
+
+    Args:
+    - directory (str): The directory containing the block files.
+    - workers (int): Number of parser processes (0 = parse in this process).
+    - window (int): Maximum number of blocks parsed ahead of the consumer.
+
+    Yields:
+    - tuple: (txid, address) pairs.
     """
-    all_txid_addresses = []
+    block_files = iter_block_files(directory)
 
-    # all JSON files in the directory
-    json_files = glob.glob(os.path.join(directory, "*.json"))
+    if workers <= 0:
+        for height, block_file in block_files:
+            with recorder.block(height):
+                rows = load_txid_addresses(block_file)
+            yield from rows
+        return
 
-    for json_file in json_files:
-        with open(json_file, 'r') as f:
-            try:
-                raw_data = json.load(f)
-                # transaction IDs and addresses from each file
-                txid_addresses = extract_txid_addresses(raw_data)
-                all_txid_addresses.extend(txid_addresses)
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON from file {json_file}: {e}")
-            except Exception as e:
-                print(f"Error processing file {json_file}: {e}")
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for _, block_file in block_files:
+            if len(pending) >= window:
+                yield from pending.popleft().result()
+            pending.append(executor.submit(load_txid_addresses, block_file))
+        while pending:
+            yield from pending.popleft().result()
 
-    return all_txid_addresses
+def process_all_json_files(directory):
+    """
+    Processes all cached block files (JSON or compact) in the given directory and extracts txid-address pairs.
+
+    Args:
+    - directory (str): The directory containing the block files.
+
+    Returns:
+    - list of tuples: A consolidated list of (txid, address) tuples from all files.
+    """
+    return list(iter_txid_addresses(directory))
 
 def save_to_csv(data, output_file):
     """
     Saves the extracted txid-address pairs to a CSV file.
 
     Args:
-    - data (list of tuples): The extracted txid-address pairs.
+    - data (iterable of tuples): The extracted txid-address pairs, e.g. from `iter_txid_addresses`.
     - output_file (str): The output CSV file path.
+
+    Returns:
+    - int: Number of rows written.
     """
+    rows = 0
     with open(output_file, mode='w', newline='') as file:
         writer = csv.writer(file)
         writer.writerow(['Transaction ID', 'Address'])  # Write header
-        writer.writerows(data)
+        for row in data:
+            writer.writerow(row)
+            rows += 1
+    return rows
+
+def save_to_parquet(data, output_file, row_group_size=1_000_000):
+    """
+    Saves the extracted txid-address pairs to a Parquet file, one row group at a time.
+
+    Args:
+    - data (iterable of tuples): The extracted txid-address pairs.
+    - output_file (str): The output Parquet file path.
+    - row_group_size (int): Rows buffered before a row group is written.
+
+    Returns:
+    - int: Number of rows written.
+    """
+    if pq is None:
+        raise ImportError("pyarrow is required to write Parquet output")
+
+    schema = pa.schema([('Transaction ID', pa.string()), ('Address', pa.string())])
+    rows = 0
+    txids, addresses = [], []
+    with pq.ParquetWriter(output_file, schema) as writer:
+        for txid, address in data:
+            txids.append(txid)
+            addresses.append(address)
+            if len(txids) >= row_group_size:
+                writer.write_table(pa.table([txids, addresses], schema=schema))
+                rows += len(txids)
+                txids, addresses = [], []
+        if txids or not rows:
+            writer.write_table(pa.table([txids, addresses], schema=schema))
+            rows += len(txids)
+    return rows
+
+WRITERS = {'csv': save_to_csv, 'parquet': save_to_parquet}
+
+def write_shard(block_files, output_file, output_format='csv'):
+    """
+    Process pool worker for sharded output: extracts and writes the pairs of a group of blocks.
+
+    Returns:
+    - tuple: (output file, number of rows written).
+    """
+    rows = (row for block_file in block_files for row in load_txid_addresses(block_file))
+    return output_file, WRITERS[output_format](rows, output_file)
+
+def save_sharded(directory, output_prefix, shards, workers=4, output_format='csv'):
+    """
+    Splits the blocks into `shards` contiguous height ranges and lets each worker
+    write its own `{output_prefix}.part-NNNN.{format}` file, so no rows pass
+    through the parent process.
+
+    Returns:
+    - list of tuples: (shard file, number of rows) per shard, in height order.
+    """
+    block_files = [block_file for _, block_file in iter_block_files(directory)]
+    per_shard = -(-len(block_files) // shards) if block_files else 1
+    groups = [block_files[i:i + per_shard] for i in range(0, len(block_files), per_shard)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write_shard, group, f"{output_prefix}.part-{k:04d}.{output_format}", output_format)
+                   for k, group in enumerate(groups)]
+        return [future.result() for future in futures]
 
 def main():
+    parser = argparse.ArgumentParser(description="Extract txid-address pairs from the cached blocks.")
+    parser.add_argument('--workers', type=int, default=0, help="parser processes (0 = parse in this process)")
+    parser.add_argument('--format', choices=sorted(WRITERS), default='csv', help="output file format")
+    parser.add_argument('--shards', type=int, default=0,
+                        help="write this many part files in parallel instead of one ordered file")
+    args = parser.parse_args()
+
     directory = 'blocks'
-    all_txid_addresses = process_all_json_files(directory)
-    output_file = 'txid_addresses.csv'
-    save_to_csv(all_txid_addresses, output_file)
-    print(f"Data saved to {output_file}")
+    output_prefix = 'txid_addresses'
+    with recorder.stage("txid_extraction"):
+        if args.shards > 0:
+            for output_file, rows in save_sharded(directory, output_prefix, args.shards, max(args.workers, 1), args.format):
+                recorder.count("rows", rows)
+                print(f"Saved {rows} rows to {output_file}")
+            return
+
+        output_file = f'{output_prefix}.{args.format}'
+        rows = WRITERS[args.format](iter_txid_addresses(directory, args.workers), output_file)
+        recorder.count("rows", rows)
+    print(f"Data saved to {output_file} ({rows} rows)")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+
+import numpy as np
+from tqdm import tqdm
+
+from block_cache import iter_block_files, load_block_columns
+from graph_builder import INPUT, OP_RETURN, OUTPUT, resolve_parsed
+from ingest import iter_ingested_blocks
+from input_resolution import OutpointResolver
+from outpoint_index import OutpointIndex
+from revmap_index import hash_keys, key_hash
+
+
+class UnionFind:
+    """
+    Union-find over the ids 0..n-1 backed by a single parent array. Unions are
+    applied in vectorized batches: every round links the root of each pair's
+    larger side to the smaller one (so links always point to lower ids and
+    never form cycles), and `find` points every node it visits at its root.
+
+    Args:
+    - n (int): Number of elements.
+    """
+
+    def __init__(self, n):
+        self.parent = np.arange(n, dtype=np.int32 if n < 2**31 else np.int64)
+
+    # levels `find` climbs one at a time before compressing the whole array instead
+    MAX_WALK = 4
+
+    def find(self, ids):
+        ids = np.asarray(ids)
+        visited = [ids]
+        roots = self.parent[ids]
+        for _ in range(self.MAX_WALK):
+            up = self.parent[roots]
+            if np.array_equal(up, roots):
+                # every node on the walked paths now points straight at its root
+                for nodes in visited:
+                    self.parent[nodes] = roots
+                return roots
+            visited.append(roots)
+            roots = up
+        # long paths (e.g. a chain linked in one batch) are halved in every round of
+        # pointer jumping, so this takes log(depth) passes instead of depth steps
+        return self.roots()[ids]
+
+    def union(self, a, b):
+        """
+        Merges the sets of a[i] and b[i] for every i.
+        """
+        a, b = np.asarray(a, dtype=np.int64), np.asarray(b, dtype=np.int64)
+        while len(a):
+            root_a, root_b = self.find(a), self.find(b)
+            differ = root_a != root_b
+            if not differ.any():
+                break
+            low, high = np.minimum(root_a, root_b)[differ], np.maximum(root_a, root_b)[differ]
+            # several pairs may link the same root; the lowest target wins and the rest retry
+            np.minimum.at(self.parent, high, low.astype(self.parent.dtype))
+            a, b = a[differ], b[differ]
+
+    def roots(self):
+        """
+        Compresses every path and returns the root of each element.
+        """
+        while True:
+            up = self.parent[self.parent]
+            if np.array_equal(up, self.parent):
+                return self.parent
+            self.parent = up
+
+
+def collect_address_hashes(folder_path, reduce_every=256):
+    """
+    First pass over the block cache: the sorted 64-bit hashes of every address
+    that appears in an output (or a verbosity 3 `prevout`). The position of a
+    hash is the address id used by the clustering.
+
+    Args:
+    - folder_path (str): The block cache folder.
+    - reduce_every (int): Blocks between deduplications, which bound the memory use.
+
+    Returns:
+    - np.ndarray: Sorted unique uint64 address hashes.
+    """
+    hashes, parts = np.zeros(0, dtype=np.uint64), []
+    for height, file_path in tqdm(iter_block_files(folder_path), desc="addresses"):
+        columns = load_block_columns(file_path)
+        addresses = {address for address in columns["vout_address"] if address is not None}
+        addresses.update(address for address in columns["vin_address"] if address is not None)
+        parts.append(hash_keys(list(addresses)))
+        if len(parts) >= reduce_every:
+            hashes, parts = np.unique(np.concatenate([hashes] + parts)), []
+    return np.unique(np.concatenate([hashes] + parts))
+
+
+def address_ids(addresses, hashes):
+    """
+    Maps addresses to their ids, -1 for the "unknown"/"OP_RETURN" placeholders
+    (which never join a cluster) and for addresses outside `hashes`.
+    """
+    if not len(hashes):
+        return np.full(len(addresses), -1, dtype=np.int64)
+    keys = np.fromiter((0 if address in ("unknown", "OP_RETURN") else key_hash(address) for address in addresses),
+                       dtype=np.uint64, count=len(addresses))
+    ids = np.minimum(np.searchsorted(hashes, keys), len(hashes) - 1)
+    return np.where((hashes[ids] == keys) & (keys != 0), ids, -1)
+
+
+def block_links(parsed, hashes, seen, change_heuristic=False):
+    """
+    The address pairs the heuristics merge for one resolved block.
+
+    Multi-input: all input addresses of a transaction belong to one owner.
+    Change (optional): in a non-coinbase transaction with two or more outputs
+    and no output paying one of its own input addresses, an output address
+    seen for the first time is the sender's change if it is the only such output.
+
+    Args:
+    - parsed (dict): A block from `parse_block_columns`, after `resolve_parsed`.
+    - hashes (np.ndarray): Address hashes from `collect_address_hashes`.
+    - seen (np.ndarray): Per address id, whether it appeared in an earlier block; updated in place.
+    - change_heuristic (bool): Also link change outputs.
+
+    Returns:
+    - tuple: (a, b) arrays of address ids to merge.
+    """
+    n_tx = len(parsed["tx_hash"])
+    edge_tx = np.repeat(np.arange(n_tx), parsed["edge_count"])
+    ids = address_ids(parsed["edge_address"], hashes)
+    valid = ids >= 0
+    inputs = valid & (parsed["edge_direction"] == INPUT)
+
+    # every input is linked to the first input of its transaction
+    first_input = np.full(n_tx, -1, dtype=np.int64)
+    input_tx, first = np.unique(edge_tx[inputs], return_index=True)
+    first_input[input_tx] = ids[inputs][first]
+    a, b = first_input[edge_tx[inputs]], ids[inputs]
+
+    if change_heuristic:
+        outputs = (parsed["edge_direction"] == OUTPUT) & (parsed["edge_type"] != OP_RETURN)
+        first_occurrence = np.zeros(len(ids), dtype=bool)
+        first_occurrence[np.flatnonzero(valid)[np.unique(ids[valid], return_index=True)[1]]] = True
+        new = first_occurrence & ~seen[np.maximum(ids, 0)]
+        n_outputs = np.bincount(edge_tx[outputs], minlength=n_tx)
+        n_new = np.bincount(edge_tx[outputs & new & valid], minlength=n_tx)
+        tx_address = edge_tx * np.int64(len(hashes) + 1) + ids
+        self_change = np.bincount(edge_tx[outputs & valid & np.isin(tx_address, tx_address[inputs])], minlength=n_tx) > 0
+        eligible = (first_input >= 0) & (n_outputs >= 2) & (n_new == 1) & ~self_change
+        change = outputs & new & valid & eligible[edge_tx]
+        a = np.concatenate([a, first_input[edge_tx[change]]])
+        b = np.concatenate([b, ids[change]])
+
+    seen[ids[valid]] = True
+    keep = a != b
+    return a[keep], b[keep]
+
+
+def cluster_addresses(folder_path, outpoint_index=None, change_heuristic=False, workers=0, batch_blocks=64):
+    """
+    Clusters every address of the block cache with the common-input-ownership
+    heuristic (and optionally the change heuristic).
+
+    Memory holds the address hashes, the parent array and the per-address
+    `seen` flags, plus the outpoint map used to resolve inputs; pass an
+    `outpoint_index` folder to resolve them from disk instead.
+
+    Args:
+    - folder_path (str): The block cache folder.
+    - outpoint_index (str): Folder of an `OutpointIndex` covering the cache.
+    - change_heuristic (bool): Also merge change outputs with their inputs.
+    - workers (int): Decoder processes (0 = decode in this process).
+    - batch_blocks (int): Blocks whose links are merged in one union batch.
+
+    Returns:
+    - tuple: (address hashes, cluster id per hash, number of blocks).
+    """
+    hashes = collect_address_hashes(folder_path)
+    union_find = UnionFind(len(hashes))
+    seen = np.zeros(len(hashes), dtype=bool)
+    resolver = OutpointIndex(outpoint_index).resolver() if outpoint_index else OutpointResolver()
+
+    pending_a, pending_b, blocks = [], [], 0
+    for block in tqdm(iter_ingested_blocks(folder_path, workers, parse=True), desc="clustering"):
+        a, b = block_links(resolve_parsed(block.parsed, resolver), hashes, seen, change_heuristic)
+        pending_a.append(a)
+        pending_b.append(b)
+        blocks += 1
+        if len(pending_a) >= batch_blocks:
+            union_find.union(np.concatenate(pending_a), np.concatenate(pending_b))
+            pending_a, pending_b = [], []
+    if pending_a:
+        union_find.union(np.concatenate(pending_a), np.concatenate(pending_b))
+
+    # clusters are numbered 0..k-1 in the order of their lowest address id
+    clusters = np.unique(union_find.roots(), return_inverse=True)[1].astype(np.int64)
+    return hashes, clusters, blocks
+
+
+class AddressClusters:
+    """
+    Memory-mapped address -> cluster id mapping written by `save_clusters`.
+    Addresses are matched on their 64-bit hash, like `StringIndex.lookup_many`
+    without `verify`.
+    """
+
+    def __init__(self, folder="address_clusters"):
+        self.hashes = np.load(os.path.join(folder, "hashes.npy"), mmap_mode="r")
+        self.clusters = np.load(os.path.join(folder, "clusters.npy"), mmap_mode="r")
+        self.sizes = np.load(os.path.join(folder, "sizes.npy"), mmap_mode="r")
+        with open(os.path.join(folder, "meta.json")) as f:
+            self.meta = json.load(f)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __getitem__(self, address):
+        cluster = self.lookup_many([address])[0]
+        if cluster < 0:
+            raise KeyError(address)
+        return int(cluster)
+
+    def lookup_many(self, addresses):
+        """
+        Returns the cluster id of every address, -1 for unknown addresses.
+        """
+        if not len(self.hashes):
+            return np.full(len(addresses), -1, dtype=np.int64)
+        keys = hash_keys(list(addresses))
+        positions = np.minimum(np.searchsorted(self.hashes, keys), len(self.hashes) - 1)
+        return np.where(self.hashes[positions] == keys, self.clusters[positions], -1)
+
+
+def save_clusters(hashes, clusters, folder="address_clusters", **meta):
+    os.makedirs(folder, exist_ok=True)
+    np.save(os.path.join(folder, "hashes.npy"), hashes)
+    np.save(os.path.join(folder, "clusters.npy"), clusters)
+    np.save(os.path.join(folder, "sizes.npy"), np.bincount(clusters) if len(clusters) else np.zeros(0, dtype=np.int64))
+    with open(os.path.join(folder, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def load_clusters(folder="address_clusters"):
+    return AddressClusters(folder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster the addresses of the cached blocks by common ownership.")
+    parser.add_argument("--change", action="store_true", help="also apply the change address heuristic")
+    parser.add_argument("--outpoint-index", metavar="FOLDER", help="resolve inputs from this outpoint index")
+    parser.add_argument("--workers", type=int, default=0, help="decoder processes (0 = decode in this process)")
+    parser.add_argument("--output", default="address_clusters", help="output folder, next to revmap.pkl")
+    args = parser.parse_args()
+
+    hashes, clusters, blocks = cluster_addresses("blocks", args.outpoint_index, args.change, args.workers)
+    save_clusters(hashes, clusters, args.output, blocks=blocks, change_heuristic=args.change)
+    sizes = np.bincount(clusters) if len(clusters) else np.zeros(0, dtype=np.int64)
+    print(f"{len(hashes)} addresses in {len(sizes)} clusters (largest: {sizes.max(initial=0)}), saved to {args.output}/")
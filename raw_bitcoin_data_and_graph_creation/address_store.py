@@ -0,0 +1,333 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from graph_features import split_edges, transaction_vertices
+from input_resolution import btc_to_satoshi, satoshi_to_btc
+from revmap_index import StringIndex, encode_strings, load_reverse_map
+
+# per-address aggregates; amounts in satoshis, `first_*`/`last_*` over the address's edges
+STAT_COLUMNS = ["received", "sent", "outputs", "inputs", "tx_count",
+                "first_height", "last_height", "first_time", "last_time"]
+
+# initial value of each column, so np.minimum.at / np.maximum.at can update it
+_UNSET = {"first_height": np.iinfo(np.int64).max, "first_time": np.iinfo(np.int64).max,
+          "last_height": -1, "last_time": -1}
+
+
+def _distinct(keys, return_counts=False):
+    """
+    Sorted distinct values of an integer array (and how often each occurs),
+    by sorting; much faster than `np.unique` on large int64 arrays.
+    """
+    keys = np.sort(keys)
+    first = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+    if return_counts:
+        return keys[first], np.diff(np.r_[first, len(keys)])
+    return keys[first]
+
+
+def graph_edge_arrays(graph, reverse_map):
+    """
+    Returns the edges of a transaction graph as address-centric arrays.
+
+    Args:
+    - graph (gt.Graph): A graph built by `2_graph_creation.py`.
+    - reverse_map (dict or RevmapIndex): The graph's reverse map.
+
+    Returns:
+    - dict: `address` and `tx` vertex ids, `value` in satoshis, `is_input`
+      (address spends into the tx), and the block `height` and `time`, one entry per edge.
+    """
+    _, tx_vertices = transaction_vertices(reverse_map)
+    tx, address, is_input, columns = split_edges(graph, tx_vertices, [graph.ep["value"], graph.ep["time"]])
+    return {
+        "address": address,
+        "tx": tx,
+        "value": btc_to_satoshi(columns[:, 0]),
+        "is_input": is_input,
+        "height": np.asarray(graph.vp["tx_block_height"].a, dtype=np.int64)[tx],
+        "time": columns[:, 1].astype(np.int64),
+    }
+
+
+class AddressStats:
+    """
+    Per-address aggregates (`STAT_COLUMNS`) in arrays indexed by vertex id,
+    updated in bulk as edges are added to the graph. Transaction vertices
+    have rows too, which stay empty.
+
+    Args:
+    - n_vertices (int): Initial number of rows.
+    """
+
+    def __init__(self, n_vertices=0):
+        self.columns = {name: np.full(n_vertices, _UNSET.get(name, 0), dtype=np.int64) for name in STAT_COLUMNS}
+
+    def __len__(self):
+        return len(self.columns["received"])
+
+    def _grow(self, n_vertices):
+        if n_vertices <= len(self):
+            return
+        # grown geometrically, so adding block after block stays linear overall
+        size = max(n_vertices, 2 * len(self))
+        for name, column in self.columns.items():
+            grown = np.full(size, _UNSET.get(name, 0), dtype=np.int64)
+            grown[:len(column)] = column
+            self.columns[name] = grown
+
+    def add_edges(self, edges):
+        """
+        Adds edges in the layout of `graph_edge_arrays`. All edges of a
+        transaction have to be added in the same call, since `tx_count` counts
+        the distinct (address, tx) pairs of each call.
+        """
+        address = np.asarray(edges["address"], dtype=np.int64)
+        if not len(address):
+            return
+        self._grow(int(address.max()) + 1)
+        is_input = np.asarray(edges["is_input"], dtype=bool)
+        value = np.asarray(edges["value"], dtype=np.int64)
+        height = np.asarray(edges["height"], dtype=np.int64)
+        time = np.asarray(edges["time"], dtype=np.int64)
+        columns = self.columns
+
+        np.add.at(columns["received"], address[~is_input], value[~is_input])
+        np.add.at(columns["sent"], address[is_input], value[is_input])
+        np.add.at(columns["outputs"], address[~is_input], 1)
+        np.add.at(columns["inputs"], address[is_input], 1)
+        tx = np.asarray(edges["tx"], dtype=np.int64)
+        span = int(tx.max()) + 1
+        np.add.at(columns["tx_count"], _distinct(address * span + tx) // span, 1)
+        np.minimum.at(columns["first_height"], address, height)
+        np.maximum.at(columns["last_height"], address, height)
+        np.minimum.at(columns["first_time"], address, time)
+        np.maximum.at(columns["last_time"], address, time)
+
+    def rebuild(self, graph, reverse_map):
+        """
+        Recomputes every aggregate from the graph, e.g. after `drop_heights`
+        renumbered the vertices.
+        """
+        self.columns = AddressStats(graph.num_vertices()).columns
+        self.add_edges(graph_edge_arrays(graph, reverse_map))
+
+    @classmethod
+    def from_graph(cls, graph, reverse_map):
+        stats = cls()
+        stats.rebuild(graph, reverse_map)
+        return stats
+
+    @classmethod
+    def for_graph(cls, graph, reverse_map, folder="address_table"):
+        """
+        Loads the aggregates saved in `folder` if they match the graph (same
+        number of vertices and edges), else recomputes them from the graph.
+        """
+        meta_path = os.path.join(folder, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["n_edges"] == graph.num_edges() and meta["n_vertices"] == graph.num_vertices():
+                stats = cls(graph.num_vertices())
+                vertices = np.load(os.path.join(folder, "vertices.npy"))
+                for name in STAT_COLUMNS:
+                    stats.columns[name][vertices] = np.load(os.path.join(folder, f"{name}.npy"))
+                return stats
+        return cls.from_graph(graph, reverse_map)
+
+
+def _csr(rows, n_rows):
+    """
+    Offsets (n_rows + 1) of entries sorted by their row.
+    """
+    offsets = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=offsets[1:])
+    return offsets
+
+
+def save_address_table(stats, edges, reverse_map, folder="address_table", n_vertices=None):
+    """
+    Writes the address table: one row per address, sorted by `account_dict`
+    vertex id, with the `STAT_COLUMNS`, the address strings, and each address's
+    edges (sorted by height) in a CSR layout. Transactions get a matching table
+    with their txid, height and the address rows of their edges, so neighbourhood
+    queries do not need the graph.
+
+    Args:
+    - stats (AddressStats): The aggregates.
+    - edges (dict): All edges of the graph, as returned by `graph_edge_arrays`.
+    - reverse_map (dict or RevmapIndex): The graph's reverse map.
+    - folder (str): Output folder.
+    - n_vertices (int): Vertex count of the graph, recorded to detect stale tables.
+    """
+    os.makedirs(folder, exist_ok=True)
+    account_dict = reverse_map["account_dict"]
+    addresses = list(account_dict.keys())
+    if isinstance(account_dict, StringIndex):
+        address_vertices = np.asarray(account_dict.values, dtype=np.int64)
+    else:
+        address_vertices = np.fromiter(account_dict.values(), dtype=np.int64, count=len(addresses))
+    order = np.argsort(address_vertices, kind="stable")
+    address_vertices = address_vertices[order]
+    txids, tx_vertices = transaction_vertices(reverse_map)
+
+    def save(name, array):
+        np.save(os.path.join(folder, f"{name}.npy"), array)
+
+    save("vertices", address_vertices)
+    stats._grow(int(address_vertices[-1]) + 1 if len(address_vertices) else 0)
+    for name in STAT_COLUMNS:
+        save(name, stats.columns[name][address_vertices])
+    offsets, strings = encode_strings([addresses[i] for i in order.tolist()])
+    save("address.offsets", offsets)
+    save("address.strings", strings)
+
+    address_row = np.searchsorted(address_vertices, edges["address"])
+    tx_row = np.searchsorted(tx_vertices, edges["tx"])
+    by_address = np.lexsort((edges["height"], address_row))
+    save("address_edges.offsets", _csr(address_row, len(address_vertices)))
+    save("address_edges.tx", tx_row[by_address])
+    save("address_edges.value", np.asarray(edges["value"], dtype=np.int64)[by_address])
+    save("address_edges.is_input", np.asarray(edges["is_input"], dtype=bool)[by_address])
+
+    tx_height = np.zeros(len(tx_vertices), dtype=np.int64)
+    tx_height[tx_row] = edges["height"]
+    offsets, strings = encode_strings(txids)
+    save("tx.offsets", offsets)
+    save("tx.strings", strings)
+    save("tx.height", tx_height)
+    by_tx = np.argsort(tx_row, kind="stable")
+    save("tx_edges.offsets", _csr(tx_row, len(tx_vertices)))
+    save("tx_edges.address", address_row[by_tx])
+
+    with open(os.path.join(folder, "meta.json"), "w") as f:
+        json.dump({"n_addresses": len(address_vertices), "n_transactions": len(tx_vertices),
+                   "n_edges": len(address_row),
+                   "n_vertices": n_vertices if n_vertices is not None else len(stats)}, f)
+
+
+class AddressTable:
+    """
+    Read-only queries over a saved address table. The files are memory-mapped,
+    so opening is instant and a query only reads the pages of the rows it
+    touches; addresses are resolved through the `account_dict` of the
+    memory-mapped reverse map.
+
+    Args:
+    - folder (str): Folder written by `save_address_table`.
+    - revmap_folder (str): Folder written by `revmap_index.save_index` for the same graph.
+    """
+
+    def __init__(self, folder="address_table", revmap_folder="revmap_index"):
+        def load(name):
+            return np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="r")
+
+        self.accounts = StringIndex(revmap_folder, "account_dict")
+        self.vertices = load("vertices")
+        self.columns = {name: load(name) for name in STAT_COLUMNS}
+        self.address_offsets, self.address_strings = load("address.offsets"), load("address.strings")
+        self.edge_offsets, self.edge_tx = load("address_edges.offsets"), load("address_edges.tx")
+        self.edge_value, self.edge_is_input = load("address_edges.value"), load("address_edges.is_input")
+        self.tx_offsets, self.tx_strings, self.tx_height = load("tx.offsets"), load("tx.strings"), load("tx.height")
+        self.tx_edge_offsets, self.tx_edge_address = load("tx_edges.offsets"), load("tx_edges.address")
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def row(self, address):
+        """
+        Returns the table row of an address, or None if it is not in the graph.
+        """
+        vertex = self.accounts.get(address)
+        if vertex is None:
+            return None
+        row = int(np.searchsorted(self.vertices, vertex))
+        return row if row < len(self.vertices) and self.vertices[row] == vertex else None
+
+    def address_at(self, row):
+        return self.address_strings[self.address_offsets[row]:self.address_offsets[row + 1]].tobytes().decode()
+
+    def txid_at(self, row):
+        return self.tx_strings[self.tx_offsets[row]:self.tx_offsets[row + 1]].tobytes().decode()
+
+    def stats(self, address):
+        """
+        Returns the aggregates of an address, with amounts in BTC, or None.
+        `balance` is received minus sent, which is exact when every input was resolved.
+        """
+        row = self.row(address)
+        if row is None:
+            return None
+        values = {name: int(column[row]) for name, column in self.columns.items()}
+        values["balance"] = values["received"] - values["sent"]
+        for name in ("received", "sent", "balance"):
+            values[name] = satoshi_to_btc(values[name])
+        return {"address": address, "vertex": int(self.vertices[row]), **values}
+
+    def transactions(self, address, limit=None):
+        """
+        Returns the address's edges in height order as (txid, height, direction,
+        value in BTC) tuples; direction is "sent" for inputs and "received" for
+        outputs. With `limit`, only the latest `limit` edges.
+        """
+        row = self.row(address)
+        if row is None:
+            return []
+        start, end = int(self.edge_offsets[row]), int(self.edge_offsets[row + 1])
+        if limit is not None:
+            start = max(start, end - limit)
+        tx_rows = self.edge_tx[start:end].tolist()
+        values = satoshi_to_btc(np.asarray(self.edge_value[start:end])).tolist()
+        inputs = self.edge_is_input[start:end].tolist()
+        return [(self.txid_at(tx), int(self.tx_height[tx]), "sent" if is_input else "received", value)
+                for tx, value, is_input in zip(tx_rows, values, inputs)]
+
+    def neighbours(self, address, limit=100):
+        """
+        Returns the counterparties of an address: the other addresses of its
+        transactions, as (address, shared transactions) pairs, most shared first.
+        The cost grows with the number of edges of the address's transactions.
+        """
+        row = self.row(address)
+        if row is None:
+            return []
+        tx_rows = _distinct(self.edge_tx[int(self.edge_offsets[row]):int(self.edge_offsets[row + 1])])
+        starts = np.asarray(self.tx_edge_offsets[tx_rows])
+        lengths = np.asarray(self.tx_edge_offsets[tx_rows + 1]) - starts
+        # positions of all edges of those transactions, gathered in one fancy index
+        positions = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        members = np.asarray(self.tx_edge_address[positions])
+        # every (tx, address) pair once, so an address spending twice in a tx counts once
+        pairs = _distinct(np.repeat(tx_rows, lengths) * len(self.vertices) + members)
+        members = pairs % len(self.vertices)
+        others, counts = _distinct(members[members != row], return_counts=True)
+        top = np.argsort(-counts, kind="stable")[:limit]
+        return [(self.address_at(other), int(count)) for other, count in zip(others[top].tolist(), counts[top].tolist())]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the address table from BitcoinGraph.gt, or query it.")
+    parser.add_argument("addresses", nargs="*", help="addresses to look up in an existing table")
+    parser.add_argument("--graph", default="BitcoinGraph.gt")
+    parser.add_argument("--folder", default="address_table")
+    args = parser.parse_args()
+
+    if args.addresses:
+        table = AddressTable(args.folder)
+        for address in args.addresses:
+            print(json.dumps({"stats": table.stats(address), "neighbours": table.neighbours(address, 10),
+                              "latest_transactions": table.transactions(address, 10)}, indent=1))
+    else:
+        import graph_tool.all as gt
+
+        graph = gt.load_graph(args.graph)
+        reverse_map = load_reverse_map()
+        if reverse_map is None:
+            parser.error("no revmap.pkl or revmap_index/ in the current folder")
+        stats = AddressStats.from_graph(graph, reverse_map)
+        save_address_table(stats, graph_edge_arrays(graph, reverse_map), reverse_map, args.folder, graph.num_vertices())
+        print(f"Saved the address table of {len(reverse_map['account_dict'])} addresses to {args.folder}/")
@@ -0,0 +1,354 @@
+import argparse
+import json
+import os
+import re
+import time
+import zlib
+
+from block_reader import decode_block_records, read_mapped, records_from_columns
+from instrumentation import recorder
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# compact files start with this magic followed by one byte for the serializer and one for the compressor
+COMPACT_MAGIC = b"BLK1"
+
+BLOCK_FILE_PATTERN = re.compile(r"^block_(\d+)\.(json|blk)$")
+
+COLUMNS = ("txid", "size", "fee", "vin_count", "vout_count",
+           "vin_txid", "vin_vout", "vin_value", "vin_address", "vin_type",
+           "vout_value", "vout_n", "vout_address", "vout_type")
+
+
+def block_to_columns(block):
+    """
+    Flattens a block into a columnar layout holding only the fields the pipeline
+    reads (hex, scriptSig, witness and asm strings are dropped).
+
+    Transactions are rows of the `txid`/`size`/`fee` columns; their inputs and
+    outputs are stored consecutively in the `vin_*` and `vout_*` columns, with
+    `vin_count`/`vout_count` giving the number of rows per transaction.
+    Coinbase inputs have `vin_txid` set to None.
+
+    Args:
+    - block (dict): A `getblock` verbosity 2 (or 3) block.
+
+    Returns:
+    - dict: The block header fields plus one list per column.
+    """
+    columns = {key: block[key] for key in ("hash", "height", "time", "previousblockhash") if key in block}
+    for key in COLUMNS:
+        columns[key] = []
+    txid, size, fee = columns["txid"], columns["size"], columns["fee"]
+    vin_count, vout_count = columns["vin_count"], columns["vout_count"]
+    vin_txid, vin_vout = columns["vin_txid"], columns["vin_vout"]
+    vin_value, vin_address, vin_type = columns["vin_value"], columns["vin_address"], columns["vin_type"]
+    vout_value, vout_n = columns["vout_value"], columns["vout_n"]
+    vout_address, vout_type = columns["vout_address"], columns["vout_type"]
+
+    for tx in block.get("tx", []):
+        txid.append(tx["txid"])
+        size.append(tx.get("size"))
+        fee.append(tx.get("fee"))
+        vins, vouts = tx.get("vin", []), tx.get("vout", [])
+        vin_count.append(len(vins))
+        vout_count.append(len(vouts))
+        for vin in vins:
+            if "coinbase" in vin:
+                vin_txid.append(None)
+                vin_vout.append(None)
+            else:
+                vin_txid.append(vin.get("txid"))
+                vin_vout.append(vin.get("vout"))
+            # verbosity 3 carries the spent output as `prevout`
+            prevout = vin.get("prevout") or {}
+            script = prevout.get("scriptPubKey", {})
+            vin_value.append(prevout.get("value"))
+            vin_address.append(script.get("address"))
+            vin_type.append(script.get("type"))
+        for vout in vouts:
+            script = vout.get("scriptPubKey", {})
+            vout_value.append(vout.get("value"))
+            vout_n.append(vout.get("n"))
+            vout_address.append(script.get("address"))
+            vout_type.append(script.get("type"))
+    return columns
+
+
+def columns_to_block(columns):
+    """
+    Rebuilds a nested, `getblock`-shaped block from `block_to_columns` output,
+    restricted to the stored fields.
+    """
+    block = {key: columns[key] for key in ("hash", "height", "time", "previousblockhash") if key in columns}
+    txs = []
+    vin_pos, vout_pos = 0, 0
+    for i, txid in enumerate(columns["txid"]):
+        vins = []
+        for j in range(vin_pos, vin_pos + columns["vin_count"][i]):
+            if columns["vin_txid"][j] is None:
+                vins.append({"coinbase": ""})
+                continue
+            vin = {"txid": columns["vin_txid"][j], "vout": columns["vin_vout"][j]}
+            if columns["vin_value"][j] is not None:
+                script = {"address": columns["vin_address"][j], "type": columns["vin_type"][j]}
+                vin["prevout"] = {"value": columns["vin_value"][j],
+                                  "scriptPubKey": {k: v for k, v in script.items() if v is not None}}
+            vins.append(vin)
+        vin_pos += columns["vin_count"][i]
+
+        vouts = []
+        for j in range(vout_pos, vout_pos + columns["vout_count"][i]):
+            script = {}
+            if columns["vout_address"][j] is not None:
+                script["address"] = columns["vout_address"][j]
+            if columns["vout_type"][j] is not None:
+                script["type"] = columns["vout_type"][j]
+            vouts.append({"value": columns["vout_value"][j], "n": columns["vout_n"][j], "scriptPubKey": script})
+        vout_pos += columns["vout_count"][i]
+
+        tx = {"txid": txid, "size": columns["size"][i], "vin": vins, "vout": vouts}
+        if columns["fee"][i] is not None:
+            tx["fee"] = columns["fee"][i]
+        txs.append(tx)
+    block["tx"] = txs
+    return block
+
+
+def encode_compact(block):
+    """
+    Serializes the columnar form of a block to the compact binary format
+    (msgpack + zstd when installed, falling back to json + zlib).
+    """
+    columns = block_to_columns(block)
+    if msgpack is not None:
+        serializer, payload = b"m", msgpack.packb(columns, use_bin_type=True)
+    else:
+        serializer, payload = b"j", json.dumps(columns, separators=(",", ":")).encode()
+    if zstandard is not None:
+        compressor, payload = b"z", zstandard.ZstdCompressor(level=3).compress(payload)
+    else:
+        compressor, payload = b"d", zlib.compress(payload, 6)
+    return COMPACT_MAGIC + serializer + compressor + payload
+
+
+def decode_compact(data):
+    """
+    Decodes bytes written by `encode_compact` into the columnar block layout.
+    """
+    if data[:4] != COMPACT_MAGIC:
+        raise ValueError("Not a compact block file")
+    serializer, compressor, payload = data[4:5], data[5:6], data[6:]
+    if compressor == b"z":
+        if zstandard is None:
+            raise ImportError("zstandard is required to read this block file")
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        payload = zlib.decompress(payload)
+    if serializer == b"m":
+        if msgpack is None:
+            raise ImportError("msgpack is required to read this block file")
+        return msgpack.unpackb(payload, raw=False)
+    return json.loads(payload)
+
+
+def _read_block(file_path):
+    """
+    Reads and decodes a cached block file, recording the bytes read and the
+    decode time. Compact files decode to columns, JSON files to a nested dict.
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+    recorder.count("bytes_read", len(data))
+    if file_path.endswith(".blk"):
+        with recorder.timed("decode_seconds"):
+            return decode_compact(data)
+    with recorder.timed("json_decode_seconds"):
+        return json.loads(data)
+
+
+def _read_block_records(file_path):
+    """
+    Reads a cached JSON block file through a memory map and decodes it
+    straight into records (see `block_reader`), recording the bytes read and
+    the decode time.
+    """
+    start = time.perf_counter()
+    block, size = read_mapped(file_path, decode_block_records)
+    recorder.count("json_decode_seconds", time.perf_counter() - start)
+    recorder.count("bytes_read", size)
+    return block
+
+
+def load_block_records(file_path):
+    """
+    Loads a cached block as a `block_reader.BlockRecord`, which holds only the
+    fields the pipeline reads and can be indexed like a `getblock` dict. This is
+    the fast path for JSON files, which skips the fields the pipeline ignores.
+    """
+    if file_path.endswith(".blk"):
+        return records_from_columns(_read_block(file_path))
+    return _read_block_records(file_path)
+
+
+def load_block_columns(file_path):
+    """
+    Loads a cached block in the columnar layout of `block_to_columns`. This is
+    the fast path for compact files, which are stored in that layout.
+    """
+    if file_path.endswith(".blk"):
+        return _read_block(file_path)
+    return block_to_columns(_read_block_records(file_path))
+
+
+def load_block_file(file_path):
+    """
+    Loads a cached block from either a `.json` or a compact `.blk` file as a
+    nested, `getblock`-shaped dict with every field of the file.
+    """
+    if file_path.endswith(".blk"):
+        return columns_to_block(_read_block(file_path))
+    return _read_block(file_path)
+
+
+def iter_block_files(folder_path):
+    """
+    Lists the cached block files in a folder, one per height, sorted by height.
+    When a height exists in both formats the compact file is used.
+
+    Args:
+    - folder_path (str): The block cache folder.
+
+    Returns:
+    - list of tuples: (height, file_path) pairs.
+    """
+    files = {}
+    for filename in os.listdir(folder_path):
+        match = BLOCK_FILE_PATTERN.match(filename)
+        if not match:
+            continue
+        height, extension = int(match.group(1)), match.group(2)
+        if height not in files or extension == "blk":
+            files[height] = os.path.join(folder_path, filename)
+    return sorted(files.items())
+
+
+class JsonBlockCache:
+    """
+    The original cache layout: one pretty-printed `block_{height}.json` per block.
+    """
+    extension = "json"
+    mode = "w"
+
+    def __init__(self, folder="blocks"):
+        self.folder = folder
+
+    def path(self, height):
+        return os.path.join(self.folder, f"block_{height}.{self.extension}")
+
+    def write(self, f, block):
+        json.dump(block, f, indent=2)
+
+    def save(self, block, height):
+        os.makedirs(self.folder, exist_ok=True)
+        # written next to the target and renamed, so readers never see a partial file
+        path = self.path(height)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, self.mode) as f:
+                self.write(f, block)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def remove(self, height):
+        """
+        Deletes the cached block at `height` in every format, e.g. after a reorg.
+        """
+        for extension in ("blk", "json"):
+            file_path = os.path.join(self.folder, f"block_{height}.{extension}")
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def get(self, height):
+        """
+        Returns the cached block at `height` in any format, or None.
+        """
+        for extension in ("blk", "json"):
+            file_path = os.path.join(self.folder, f"block_{height}.{extension}")
+            if os.path.exists(file_path):
+                return load_block_file(file_path)
+        return None
+
+
+class CompactBlockCache(JsonBlockCache):
+    """
+    Compact layout: one `block_{height}.blk` per block holding only the used fields, column by column.
+    """
+    extension = "blk"
+    mode = "wb"
+
+    def write(self, f, block):
+        f.write(encode_compact(block))
+
+
+CACHE_BACKENDS = {"json": JsonBlockCache, "compact": CompactBlockCache}
+
+
+def get_cache(folder="blocks", cache_format="compact"):
+    """
+    Returns the cache backend for `cache_format` ("json" or "compact").
+    """
+    return CACHE_BACKENDS[cache_format](folder)
+
+
+def convert_folder(folder_path, remove_json=False):
+    """
+    Converts every `block_{height}.json` in a folder into the compact format.
+
+    Args:
+    - folder_path (str): The block cache folder.
+    - remove_json (bool): Delete each JSON file once its compact copy is written.
+
+    Returns:
+    - tuple: (number of converted blocks, bytes before, bytes after).
+    """
+    cache = CompactBlockCache(folder_path)
+    converted, bytes_before, bytes_after = 0, 0, 0
+    for filename in sorted(os.listdir(folder_path)):
+        match = BLOCK_FILE_PATTERN.match(filename)
+        if not match or match.group(2) != "json":
+            continue
+        height = int(match.group(1))
+        file_path = os.path.join(folder_path, filename)
+        try:
+            block = load_block_file(file_path)
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON in file {file_path}: {e}")
+            continue
+        cache.save(block, height)
+        bytes_before += os.path.getsize(file_path)
+        bytes_after += os.path.getsize(cache.path(height))
+        converted += 1
+        if remove_json:
+            os.remove(file_path)
+    return converted, bytes_before, bytes_after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the JSON block cache to the compact format.")
+    parser.add_argument("folder", nargs="?", default="blocks")
+    parser.add_argument("--remove-json", action="store_true", help="delete JSON files after conversion")
+    args = parser.parse_args()
+
+    converted, before, after = convert_folder(args.folder, args.remove_json)
+    print(f"Converted {converted} blocks: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
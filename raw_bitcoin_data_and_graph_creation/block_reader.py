@@ -0,0 +1,186 @@
+import json
+import mmap
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class Record:
+    """
+    Dict-style read access to the record fields, so records can be passed to
+    code written for `getblock` dicts (`tx["txid"]`, `vin.get("prevout")`,
+    `"coinbase" in vin`). A field set to None counts as missing.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        value = getattr(self, key, None)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return getattr(self, key, None) is not None
+
+
+# the records hold only the fields the pipeline reads; msgspec skips the rest
+# (hex, scriptSig, txinwitness, asm, ...) without building objects for them
+
+@dataclass(slots=True)
+class ScriptRecord(Record):
+    address: Optional[str] = None
+    type: Optional[str] = None
+
+
+@dataclass(slots=True)
+class PrevoutRecord(Record):
+    value: Optional[float] = None
+    scriptPubKey: ScriptRecord = field(default_factory=ScriptRecord)
+
+
+@dataclass(slots=True)
+class VinRecord(Record):
+    txid: Optional[str] = None
+    vout: Optional[int] = None
+    coinbase: Optional[str] = None
+    prevout: Optional[PrevoutRecord] = None
+
+
+@dataclass(slots=True)
+class VoutRecord(Record):
+    value: float = 0.0
+    n: int = 0
+    scriptPubKey: ScriptRecord = field(default_factory=ScriptRecord)
+
+
+@dataclass(slots=True)
+class TxRecord(Record):
+    txid: str = ""
+    size: Optional[int] = None
+    fee: Optional[float] = None
+    vin: list[VinRecord] = field(default_factory=list)
+    vout: list[VoutRecord] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class BlockRecord(Record):
+    hash: Optional[str] = None
+    height: Optional[int] = None
+    time: Optional[int] = None
+    previousblockhash: Optional[str] = None
+    tx: list[TxRecord] = field(default_factory=list)
+
+
+_decoder = msgspec.json.Decoder(BlockRecord) if msgspec is not None else None
+
+DECODER = "msgspec" if msgspec is not None else "orjson" if orjson is not None else "json"
+
+
+def decode_json(data):
+    """
+    Decodes JSON bytes (or any buffer) with orjson when installed, else the stdlib.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(bytes(data))
+
+
+def _script(script):
+    return ScriptRecord(script.get("address"), script.get("type")) if script else ScriptRecord()
+
+
+def records_from_block(block):
+    """
+    Converts a decoded `getblock` dict into records.
+    """
+    txs = []
+    for tx in block.get("tx", []):
+        vins = []
+        for vin in tx.get("vin", []):
+            prevout = vin.get("prevout")
+            if prevout is not None:
+                prevout = PrevoutRecord(prevout.get("value"), _script(prevout.get("scriptPubKey")))
+            vins.append(VinRecord(vin.get("txid"), vin.get("vout"), vin.get("coinbase"), prevout))
+        vouts = [VoutRecord(vout.get("value"), vout.get("n"), _script(vout.get("scriptPubKey")))
+                 for vout in tx.get("vout", [])]
+        txs.append(TxRecord(tx["txid"], tx.get("size"), tx.get("fee"), vins, vouts))
+    return BlockRecord(block.get("hash"), block.get("height"), block.get("time"), block.get("previousblockhash"), txs)
+
+
+def records_from_columns(columns):
+    """
+    Converts a block in the columnar cache layout (`block_cache.block_to_columns`) into records.
+    """
+    scripts = [ScriptRecord(address, script_type)
+               for address, script_type in zip(columns["vout_address"], columns["vout_type"])]
+    vouts = [VoutRecord(value, n, script) for value, n, script in zip(columns["vout_value"], columns["vout_n"], scripts)]
+    vins = []
+    for txid, n, value, address, script_type in zip(columns["vin_txid"], columns["vin_vout"], columns["vin_value"],
+                                                    columns["vin_address"], columns["vin_type"]):
+        if txid is None:
+            vins.append(VinRecord(coinbase=""))
+        else:
+            prevout = PrevoutRecord(value, ScriptRecord(address, script_type)) if value is not None else None
+            vins.append(VinRecord(txid, n, None, prevout))
+    txs = []
+    vin_pos = vout_pos = 0
+    for txid, size, fee, vin_count, vout_count in zip(columns["txid"], columns["size"], columns["fee"],
+                                                      columns["vin_count"], columns["vout_count"]):
+        txs.append(TxRecord(txid, size, fee, vins[vin_pos:vin_pos + vin_count], vouts[vout_pos:vout_pos + vout_count]))
+        vin_pos += vin_count
+        vout_pos += vout_count
+    return BlockRecord(columns.get("hash"), columns.get("height"), columns.get("time"),
+                       columns.get("previousblockhash"), txs)
+
+
+def decode_block_records(data):
+    """
+    Decodes a `getblock` JSON document into records. msgspec, when installed,
+    only materializes the record fields; otherwise the document is decoded
+    with orjson or the stdlib and converted. Malformed documents raise
+    `json.JSONDecodeError` with every decoder.
+
+    Args:
+    - data (bytes-like): The JSON document, e.g. a memory-mapped file.
+
+    Returns:
+    - BlockRecord: The block.
+    """
+    if _decoder is not None:
+        try:
+            return _decoder.decode(data)
+        except msgspec.DecodeError as e:
+            # callers handle malformed files as `json.JSONDecodeError`, which orjson's error already is
+            raise json.JSONDecodeError(str(e), "", 0) from e
+    return records_from_block(decode_json(data))
+
+
+def read_mapped(file_path, decode):
+    """
+    Memory-maps a file and returns `decode(buffer)`, avoiding a copy of the
+    file contents into a bytes object. Also returns the file size.
+    """
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return decode(b""), 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                return decode(view), size
+            finally:
+                view.release()
@@ -0,0 +1,260 @@
+"""
+Bloom filters over the labelled address sets, used as a prefilter before the
+exact address -> label lookup. The filters are built from the same source as
+the exact lookup: one per `{label}_addresses.csv`, saved next to it as
+`{label}_addresses.bloom.npy` and `.bloom.json`, or one per category of a
+`label_index/` folder, saved inside it. Rows whose address no filter may
+contain are known to be unlabelled and skip the exact lookup; the rest are
+confirmed exactly, so the labels never change.
+
+    python bloom_filter.py ../labelled_addresses_scraper --fp-rate 0.01
+    python bloom_filter.py --index ../labelled_addresses_scraper/label_index
+"""
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from label_index import CATEGORIES, load_label_index
+
+# 16-byte key of pandas' siphash; fixed so saved filters stay valid
+HASH_KEY = "labelledaddress0"
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def address_hashes(addresses):
+    """
+    Two 64-bit hashes per address: pandas' vectorized siphash, and a remix of it
+    used as the probe step, forced odd so the probes of an address never collapse.
+    """
+    h1 = pd.util.hash_array(np.asarray(addresses, dtype=object), hash_key=HASH_KEY, categorize=False)
+    with np.errstate(over="ignore"):
+        h2 = ((h1 ^ (h1 >> np.uint64(31))) * GOLDEN) | np.uint64(1)
+    return h1, h2
+
+
+class BloomFilter:
+    """
+    Bit array of `n_bits` bits probed `n_hashes` times per address by double
+    hashing. Lookups are vectorized over arrays of addresses.
+    """
+
+    def __init__(self, n_bits, n_hashes, bits=None, count=0):
+        self.n_bits = int(n_bits)
+        self.n_hashes = int(n_hashes)
+        self.bits = np.zeros((self.n_bits + 7) // 8, dtype=np.uint8) if bits is None else bits
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, n_addresses, fp_rate=0.01, bits_per_address=None):
+        """
+        Sizes a filter for `n_addresses` addresses.
+
+        Args:
+        - n_addresses (int): Number of addresses it will hold.
+        - fp_rate (float): Target false positive rate.
+        - bits_per_address (float): Memory budget per address; overrides `fp_rate`.
+
+        Returns:
+        - BloomFilter: An empty filter with the optimal number of hashes for its size.
+        """
+        n_addresses = max(int(n_addresses), 1)
+        if bits_per_address is None:
+            bits_per_address = -math.log(fp_rate) / math.log(2) ** 2
+        n_bits = max(int(math.ceil(bits_per_address * n_addresses)), 64)
+        n_hashes = max(1, round(n_bits / n_addresses * math.log(2)))
+        return cls(n_bits, n_hashes)
+
+    def probe(self, h1, h2, i):
+        with np.errstate(over="ignore"):
+            return (h1 + np.uint64(i) * h2) % np.uint64(self.n_bits)
+
+    def add(self, addresses):
+        h1, h2 = address_hashes(addresses)
+        for i in range(self.n_hashes):
+            positions = self.probe(h1, h2, i)
+            np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                             np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        self.count += len(addresses)
+
+    def might_contain_hashes(self, h1, h2):
+        """
+        `might_contain` for hashes from `address_hashes`, so several filters can
+        share one hashing pass.
+        """
+        # most absent addresses fail within a probe or two, so only the survivors are probed further
+        rows = np.arange(len(h1))
+        for i in range(self.n_hashes):
+            positions = self.probe(h1[rows], h2[rows], i)
+            rows = rows[(self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1 == 1]
+        result = np.zeros(len(h1), dtype=bool)
+        result[rows] = True
+        return result
+
+    def might_contain(self, addresses):
+        """
+        Returns:
+        - np.ndarray: False for addresses that are certainly not in the filter.
+        """
+        return self.might_contain_hashes(*address_hashes(addresses))
+
+    def __contains__(self, address):
+        return bool(self.might_contain([address])[0])
+
+    def expected_fp_rate(self):
+        """
+        False positive rate expected from the number of addresses added.
+        """
+        return (1 - math.exp(-self.n_hashes * self.count / self.n_bits)) ** self.n_hashes
+
+    def save(self, path, **meta):
+        """
+        Writes the bit array to `{path}.npy` and the parameters, with any extra
+        `meta` entries, to `{path}.json`.
+        """
+        np.save(f"{path}.npy", self.bits)
+        with open(f"{path}.json", "w") as f:
+            json.dump({"n_bits": self.n_bits, "n_hashes": self.n_hashes, "count": self.count, **meta}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(f"{path}.json") as f:
+            meta = json.load(f)
+        return cls(meta["n_bits"], meta["n_hashes"], np.load(f"{path}.npy", mmap_mode="r"), meta["count"])
+
+
+def filter_path(csv_folder, label):
+    return os.path.join(csv_folder, f"{label}_addresses.bloom")
+
+
+def csv_fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def index_fingerprint(index_folder):
+    """
+    Size and modification time of the files of a `label_index/` folder.
+    """
+    return [csv_fingerprint(os.path.join(index_folder, name)) for name in ("addresses.npy", "category.npy", "names.json")]
+
+
+def save_new_filter(addresses, path, source, fp_rate, bits_per_address):
+    """
+    Builds a filter of `addresses` and saves it with the fingerprint of its source.
+    """
+    bloom = BloomFilter.for_capacity(len(addresses), fp_rate, bits_per_address)
+    bloom.add(addresses)
+    bloom.save(path, source=source, fp_rate=fp_rate, bits_per_address=bits_per_address)
+    return bloom
+
+
+def load_current_filter(path, source, fp_rate, bits_per_address):
+    """
+    Loads the filter saved at `path`, or returns None if it is missing, built
+    from another version of its source or with other parameters.
+    """
+    if not (os.path.exists(f"{path}.json") and os.path.exists(f"{path}.npy")):
+        return None
+    with open(f"{path}.json") as f:
+        meta = json.load(f)
+    if (meta.get("source") != source or meta.get("fp_rate") != fp_rate
+            or meta.get("bits_per_address") != bits_per_address):
+        return None
+    return BloomFilter.load(path)
+
+
+def build_label_filter(csv_folder, label, fp_rate=0.01, bits_per_address=None):
+    """
+    Builds and saves the filter of `{label}_addresses.csv`, recording the CSV's
+    size and modification time so a changed CSV is detected.
+    """
+    csv_path = os.path.join(csv_folder, f"{label}_addresses.csv")
+    addresses = pd.read_csv(csv_path, usecols=['address'], dtype=str)['address'].dropna().to_numpy()
+    return save_new_filter(addresses, filter_path(csv_folder, label), csv_fingerprint(csv_path), fp_rate,
+                           bits_per_address)
+
+
+def load_label_filters(csv_folder, labels, fp_rate=0.01, bits_per_address=None):
+    """
+    Loads the filter of every label, rebuilding those that are missing, built
+    with other parameters, or older than their CSV (a stale filter could reject
+    labelled addresses).
+
+    Args:
+    - csv_folder (str): Directory containing the `{label}_addresses.csv` files.
+    - labels (list): Labels to load.
+    - fp_rate (float): Target false positive rate of each filter.
+    - bits_per_address (float): Memory budget per address; overrides `fp_rate`.
+
+    Returns:
+    - dict: Label -> BloomFilter.
+    """
+    filters = {}
+    for label in labels:
+        source = csv_fingerprint(os.path.join(csv_folder, f"{label}_addresses.csv"))
+        current = load_current_filter(filter_path(csv_folder, label), source, fp_rate, bits_per_address)
+        filters[label] = current or build_label_filter(csv_folder, label, fp_rate, bits_per_address)
+    return filters
+
+
+def load_index_filters(index_folder, fp_rate=0.01, bits_per_address=None):
+    """
+    Loads the filter of every category of a label index, saved in the index
+    folder as `{category}.bloom.npy`/`.json`, rebuilding them from the index's
+    own addresses when any is missing or the index changed.
+
+    Args:
+    - index_folder (str): Folder written by `label_index.save_label_index`.
+    - fp_rate (float): Target false positive rate of each filter.
+    - bits_per_address (float): Memory budget per address; overrides `fp_rate`.
+
+    Returns:
+    - dict: Category -> BloomFilter, for every category of the index.
+    """
+    source = index_fingerprint(index_folder)
+    index = load_label_index(index_folder)
+    filters = {}
+    for code, category in enumerate(index.categories):
+        path = os.path.join(index_folder, f"{category}.bloom")
+        current = load_current_filter(path, source, fp_rate, bits_per_address)
+        if current is None:
+            addresses = np.char.decode(index.addresses[np.asarray(index.category) == code]).astype(object)
+            current = save_new_filter(addresses, path, source, fp_rate, bits_per_address)
+        filters[category] = current
+    return filters
+
+
+def might_be_labelled(filters, addresses):
+    """
+    True where any label's filter may contain the address; False rows are certainly unlabelled.
+    """
+    h1, h2 = address_hashes(addresses)
+    candidates = np.zeros(len(h1), dtype=bool)
+    for bloom in filters.values():
+        # addresses already matched by an earlier filter need not be probed again
+        rest = np.flatnonzero(~candidates)
+        candidates[rest] = bloom.might_contain_hashes(h1[rest], h2[rest])
+    return candidates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv_folder", nargs="?", default=".")
+    parser.add_argument("--index", metavar="FOLDER", help="build the filters of this label index instead of the CSVs")
+    parser.add_argument("--labels", nargs="+", default=CATEGORIES)
+    parser.add_argument("--fp-rate", type=float, default=0.01, help="target false positive rate per filter")
+    parser.add_argument("--bits-per-address", type=float, help="memory budget per address, overrides --fp-rate")
+    args = parser.parse_args()
+
+    if args.index:
+        filters = load_index_filters(args.index, args.fp_rate, args.bits_per_address)
+    else:
+        filters = {label: build_label_filter(args.csv_folder, label, args.fp_rate, args.bits_per_address)
+                   for label in args.labels}
+    for label, bloom in filters.items():
+        print(f"{label}: {bloom.count} addresses, {bloom.bits.nbytes / 1e6:.1f} MB, {bloom.n_hashes} hashes, "
+              f"expected false positive rate {bloom.expected_fp_rate():.4f}")
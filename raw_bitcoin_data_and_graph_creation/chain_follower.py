@@ -0,0 +1,363 @@
+import argparse
+import asyncio
+import csv
+import importlib
+import logging
+import os
+import time
+from collections import deque
+
+import dill as pickle
+
+from block_cache import get_cache, iter_block_files, load_block_columns
+from outpoint_index import OutpointIndex
+from instrumentation import recorder
+from revmap_index import load_reverse_map, save_index
+from rpc_client import BatchRpcClient
+
+# the numbered pipeline scripts are imported by name so their helpers can be reused
+txid_matching = importlib.import_module("3_transact_and_address_matching")
+
+
+class BlockListener:
+    """
+    Base class of the consumers notified by `ChainFollower`. `on_block` is
+    called once per new block in height order, after the block is in the
+    cache; `on_reorg` with the heights removed from the cache before their
+    replacements arrive; `flush` after every poll that changed the cache.
+    """
+
+    def on_block(self, height, block):
+        pass
+
+    def on_reorg(self, heights):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class QueueListener(BlockListener):
+    """
+    Puts `("block", height, block)` and `("reorg", heights)` events on an
+    `asyncio.Queue`, for consumers running in the follower's event loop.
+    """
+
+    def __init__(self, queue=None):
+        self.queue = queue if queue is not None else asyncio.Queue()
+
+    def on_block(self, height, block):
+        self.queue.put_nowait(("block", height, block))
+
+    def on_reorg(self, heights):
+        self.queue.put_nowait(("reorg", heights))
+
+
+class TxidListener(BlockListener):
+    """
+    Appends the txid-address pairs of every new block to `txid_addresses.csv`.
+    Rows of blocks dropped by a reorg are truncated away, as long as they were
+    appended by this listener.
+    """
+
+    def __init__(self, output_file="txid_addresses.csv", keep=100):
+        new = not os.path.exists(output_file)
+        self.file = open(output_file, "a", newline="")
+        self.writer = csv.writer(self.file)
+        if new:
+            self.writer.writerow(['Transaction ID', 'Address'])
+        self.offsets = {}
+        self.keep = keep
+
+    def on_block(self, height, block):
+        self.offsets[height] = self.file.tell()
+        for height_kept in [h for h in self.offsets if h <= height - self.keep]:
+            del self.offsets[height_kept]
+        self.writer.writerows(txid_matching.extract_txid_addresses(block))
+
+    def on_reorg(self, heights):
+        known = [height for height in heights if height in self.offsets]
+        if len(known) < len(heights):
+            logging.warning(f"Rows of blocks {heights[0]}-{heights[-1]} were written before this run and are kept")
+        if known:
+            self.file.truncate(self.offsets[known[0]])
+            self.file.seek(0, os.SEEK_END)
+            for height in known:
+                del self.offsets[height]
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class GraphListener(BlockListener):
+    """
+    Keeps `BitcoinGraph.gt` and the reverse map up to date with `update_graph`
+    after every poll, saving them at most every `save_interval` seconds and on
+    close. Inputs are resolved from the persistent `OutpointIndex` next to the
+    graph, which is extended (or rolled back after a reorg) by the new blocks only.
+    """
+
+    def __init__(self, folder_path="blocks", graph_file="BitcoinGraph.gt", revmap_file="revmap.pkl",
+                 reorg_depth=6, save_interval=600):
+        import graph_tool.all as gt
+        graph_creation = importlib.import_module("2_graph_creation")
+
+        self.folder_path = folder_path
+        self.graph_file, self.revmap_file = graph_file, revmap_file
+        self.reorg_depth = reorg_depth
+        self.save_interval = save_interval
+        self.reverse_map = {"transaction_dict": {}, "account_dict": {}, "block_dict": {}}
+        if os.path.exists(graph_file):
+            self.graph = gt.load_graph(graph_file)
+            self.reverse_map.update(load_reverse_map(os.path.dirname(revmap_file) or ".", materialize=True) or {})
+        else:
+            self.graph = gt.Graph(directed=True)
+            graph_creation.add_graph_properties(self.graph)
+        self.outpoints = OutpointIndex(os.path.join(os.path.dirname(graph_file), "outpoint_index"))
+        self.dirty = False
+        self.saved = time.monotonic()
+
+    def on_block(self, height, block):
+        self.dirty = True
+
+    def on_reorg(self, heights):
+        # the index and the graph both roll back the orphaned blocks in the next flush
+        self.dirty = True
+
+    def flush(self):
+        from graph_builder import update_graph
+
+        if not self.dirty:
+            return
+        # its own stage, so the per-block assembly times are not mixed with the fetch times of "follow"
+        with recorder.stage("graph_update"):
+            self.outpoints.update(self.folder_path, self.reorg_depth)
+            added, dropped = update_graph(self.graph, self.folder_path, self.reverse_map,
+                                          reorg_depth=self.reorg_depth, resolver=self.outpoints.resolver())
+        if dropped:
+            logging.info(f"Graph: dropped blocks {dropped[0]}-{dropped[-1]}")
+        logging.info(f"Graph: added {len(added)} blocks, {self.graph.num_vertices()} vertices")
+        self.dirty = False
+        if time.monotonic() - self.saved >= self.save_interval:
+            self.save()
+
+    def save(self):
+        with open(self.revmap_file, "wb") as f:
+            pickle.dump(dict(self.reverse_map), f)
+        save_index(self.reverse_map, os.path.join(os.path.dirname(self.revmap_file), "revmap_index"))
+        self.graph.save(self.graph_file)
+        self.saved = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.save()
+
+
+class ChainFollower:
+    """
+    Follows the node's chain tip: polls `getbestblockhash`, and when it
+    changes fetches the new blocks with at most `concurrency` batches in
+    flight, writes them to the block cache and notifies the listeners.
+
+    A new block whose `previousblockhash` is not the cached tip, or a best
+    hash change without a new height, triggers a reorg check: the hashes of
+    the last `reorg_depth` cached blocks are compared with the node's, cached
+    blocks from the fork point up are removed and the new branch is fetched
+    in their place. The first poll always checks the cached blocks.
+
+    Args:
+    - client (BatchRpcClient): The node connection.
+    - cache (JsonBlockCache): The block cache to keep up to date.
+    - listeners (list of BlockListener): Consumers notified of new blocks and reorgs.
+    - verbosity (int): `getblock` verbosity level.
+    - poll_interval (float): Seconds between tip polls.
+    - concurrency (int): Batches fetched concurrently.
+    - reorg_depth (int): Number of blocks below the tip checked for reorgs.
+    - backfill (int): Blocks fetched below the tip when the cache is empty.
+    """
+
+    def __init__(self, client, cache, listeners=(), verbosity=2, poll_interval=5.0, concurrency=4,
+                 reorg_depth=6, backfill=10):
+        self.client = client
+        self.cache = cache
+        self.listeners = list(listeners)
+        self.verbosity = verbosity
+        self.poll_interval = poll_interval
+        self.concurrency = concurrency
+        self.reorg_depth = reorg_depth
+        self.backfill = backfill
+        self.hashes = {}
+        self.tip = None
+        self.best_hash = None
+        self.stale = True
+        if os.path.isdir(cache.folder):
+            for height, file_path in iter_block_files(cache.folder)[-(reorg_depth + 1):]:
+                self.hashes[height] = load_block_columns(file_path).get("hash")
+                self.tip = height
+
+    async def rpc(self, method, *params):
+        return await asyncio.to_thread(self.client.call, method, list(params))
+
+    def notify(self, method, *args):
+        for listener in self.listeners:
+            try:
+                getattr(listener, method)(*args)
+            except Exception:
+                logging.exception(f"{type(listener).__name__}.{method} failed")
+
+    async def check_reorg(self, node_tip):
+        """
+        Compares the recent cached hashes with the node's and removes the cached
+        blocks of an abandoned branch.
+
+        Returns:
+        - list of int: The removed heights.
+        """
+        heights = sorted(self.hashes)
+        node_hashes = await asyncio.to_thread(self.client.batch, "getblockhash",
+                                              [[height] for height in heights if height <= node_tip])
+        node_hashes += [None] * (len(heights) - len(node_hashes))
+        fork = next((height for height, node_hash in zip(heights, node_hashes)
+                     if self.hashes[height] is not None and node_hash != self.hashes[height]), None)
+        if fork is None:
+            return []
+        if fork == heights[0]:
+            logging.warning(f"Reorg reaches the oldest checked block {fork}, it may be deeper than {self.reorg_depth}")
+        dropped = [height for height in heights if height >= fork]
+        for height in dropped:
+            await asyncio.to_thread(self.cache.remove, height)
+            del self.hashes[height]
+        self.tip = fork - 1
+        recorder.count("reorgs")
+        recorder.count("blocks_dropped", len(dropped))
+        logging.info(f"Reorg: removed cached blocks {dropped[0]}-{dropped[-1]}")
+        self.notify("on_reorg", dropped)
+        return dropped
+
+    async def fetch(self, heights):
+        """
+        Fetches, caches and announces blocks in height order, with at most
+        `concurrency` batches in flight. Stops at a block that does not extend
+        the cached chain and marks the cache for a reorg check.
+
+        Returns:
+        - int: Number of blocks added.
+        """
+        batch_size = self.client.batch_size
+        chunks = deque(heights[i:i + batch_size] for i in range(0, len(heights), batch_size))
+        pending = deque()
+        added = 0
+        try:
+            while chunks or pending:
+                while chunks and len(pending) < self.concurrency:
+                    chunk = chunks.popleft()
+                    pending.append((chunk, asyncio.create_task(
+                        asyncio.to_thread(self.client.fetch_block_batch, chunk, self.verbosity))))
+                chunk, task = pending.popleft()
+                for height, block in zip(chunk, await task):
+                    previous = self.hashes.get(height - 1)
+                    if previous is not None and block.get("previousblockhash") != previous:
+                        logging.info(f"Block {height} does not extend the cached chain, checking for a reorg")
+                        self.stale = True
+                        return added
+                    with recorder.block(height):
+                        await asyncio.to_thread(self.cache.save, block, height)
+                        self.hashes[height] = block.get("hash")
+                        self.tip = height
+                        self.notify("on_block", height, block)
+                    for old in [h for h in self.hashes if h < height - self.reorg_depth]:
+                        del self.hashes[old]
+                    recorder.count("blocks_fetched")
+                    added += 1
+                    logging.info(f"Cached block {height}, {time.time() - block.get('time', time.time()):.0f}s behind wall clock")
+        finally:
+            for _, task in pending:
+                task.cancel()
+        return added
+
+    async def poll(self):
+        """
+        Brings the cache up to the node's tip once.
+
+        Returns:
+        - int: Number of blocks added or removed.
+        """
+        best_hash = await self.rpc("getbestblockhash")
+        if best_hash == self.best_hash:
+            return 0
+        node_tip = await self.rpc("getblockcount")
+        # a best hash change without a new height can only be a reorg
+        self.stale = self.stale or (self.tip is not None and node_tip <= self.tip)
+        changed = 0
+        for _ in range(2):
+            if self.stale and self.hashes:
+                changed += len(await self.check_reorg(node_tip))
+            self.stale = False
+            first = self.tip + 1 if self.tip is not None else max(0, node_tip - self.backfill + 1)
+            if first <= node_tip:
+                changed += await self.fetch(list(range(first, node_tip + 1)))
+            if not self.stale:
+                break
+        if self.tip == node_tip and not self.stale:
+            self.best_hash = best_hash
+        if changed:
+            self.notify("flush")
+        return changed
+
+    async def run(self, max_polls=None):
+        """
+        Polls until cancelled (or for `max_polls` polls); RPC errors are logged
+        and retried at the next poll.
+        """
+        polls = 0
+        with recorder.stage("follow"):
+            try:
+                while max_polls is None or polls < max_polls:
+                    try:
+                        await self.poll()
+                    except Exception:
+                        logging.exception("Poll failed, retrying")
+                    polls += 1
+                    if max_polls is None or polls < max_polls:
+                        await asyncio.sleep(self.poll_interval)
+            finally:
+                self.notify("close")
+
+
+LISTENERS = {"graph": GraphListener, "txid": TxidListener}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the block cache (and optionally the graph and txid list) at the chain tip.")
+    parser.add_argument("--rpc-url", default=os.environ.get("RPC_URL", "--"))
+    parser.add_argument("--folder", default="blocks")
+    parser.add_argument("--format", choices=["compact", "json"], default=os.environ.get("BLOCK_CACHE_FORMAT", "compact"))
+    parser.add_argument("--verbosity", type=int, default=int(os.environ.get("BLOCK_VERBOSITY", "2")))
+    parser.add_argument("--poll", type=float, default=5.0, help="seconds between tip polls")
+    parser.add_argument("--concurrency", type=int, default=4, help="block batches fetched concurrently")
+    parser.add_argument("--batch-size", type=int, default=10, help="blocks per batch")
+    parser.add_argument("--reorg-depth", type=int, default=6)
+    parser.add_argument("--backfill", type=int, default=10, help="blocks fetched below the tip when the cache is empty")
+    parser.add_argument("--listeners", nargs="*", choices=sorted(LISTENERS), default=[])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    client = BatchRpcClient(args.rpc_url, batch_size=args.batch_size, max_workers=args.concurrency)
+    listeners = []
+    for name in args.listeners:
+        if name == "graph":
+            listeners.append(GraphListener(args.folder, reorg_depth=args.reorg_depth))
+        else:
+            listeners.append(LISTENERS[name]())
+    follower = ChainFollower(client, get_cache(args.folder, args.format), listeners, args.verbosity, args.poll,
+                             args.concurrency, args.reorg_depth, args.backfill)
+    try:
+        asyncio.run(follower.run())
+    except KeyboardInterrupt:
+        pass
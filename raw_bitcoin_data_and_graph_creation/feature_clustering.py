@@ -0,0 +1,286 @@
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import IncrementalPCA
+from tqdm import tqdm
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# identify where a transaction sits in the chain rather than how it behaves
+EXCLUDED_FEATURES = ["tx_block_height", "tx_block_time"]
+
+
+def feature_columns(path, exclude=EXCLUDED_FEATURES):
+    """
+    Returns the header of a feature file and the numeric columns to cluster on.
+
+    Args:
+    - path (str): A feature matrix written by `graph_features.py` (Parquet or `.csv`).
+    - exclude (list): Columns left out of the clustering.
+
+    Returns:
+    - tuple: (list of all column names, list of feature column names)
+    """
+    if path.endswith(".csv"):
+        header = pd.read_csv(path, nrows=0).columns.tolist()
+    elif pq is None:
+        raise ImportError("pyarrow is required to read Parquet features")
+    else:
+        header = pq.ParquetFile(path).schema_arrow.names
+    return header, [column for column in header if column != "tx_hash" and column not in exclude]
+
+
+def feature_parts(path, chunksize):
+    """
+    Splits a feature file into parts of roughly `chunksize` rows that can be
+    read independently: runs of Parquet row groups, or newline-aligned byte
+    ranges of a CSV file.
+
+    Returns:
+    - list: Lists of row group indices (Parquet) or (start, end) byte offsets (CSV).
+    """
+    if not path.endswith(".csv"):
+        metadata = pq.ParquetFile(path).metadata
+        parts, part, rows = [], [], 0
+        for group in range(metadata.num_row_groups):
+            part.append(group)
+            rows += metadata.row_group(group).num_rows
+            if rows >= chunksize:
+                parts.append(part)
+                part, rows = [], 0
+        if part:
+            parts.append(part)
+        return parts
+
+    with open(path, "rb") as f:
+        f.readline()
+        start = f.tell()
+        f.readline()
+        # estimate the part size in bytes from the first data row
+        part_bytes = max((f.tell() - start) * chunksize, 1)
+        size = os.fstat(f.fileno()).st_size
+        parts = []
+        while start < size:
+            f.seek(min(start + part_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            parts.append((start, end))
+            start = end
+    return parts
+
+
+def read_part(path, part, columns, header):
+    """
+    Reads the given columns of one part of a feature file.
+    """
+    if not path.endswith(".csv"):
+        return pq.ParquetFile(path).read_row_groups(part, columns=columns).to_pandas()
+    start, end = part
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return pd.read_csv(BytesIO(data), header=None, names=header, usecols=columns, dtype={"tx_hash": str})
+
+
+def part_moments(path, part, columns, header):
+    """
+    Row count, mean and sum of squared deviations of each feature in one part.
+    """
+    values = np.nan_to_num(read_part(path, part, columns, header).to_numpy(dtype=np.float64))
+    mean = values.mean(axis=0) if len(values) else np.zeros(len(columns))
+    return len(values), mean, ((values - mean) ** 2).sum(axis=0)
+
+
+def standardized_part(path, part, columns, header, mean, scale, with_hash=False):
+    """
+    Reads one part and standardises its features with the given mean and scale.
+
+    Returns:
+    - tuple: (tx_hash array or None, float64 feature array)
+    """
+    frame = read_part(path, part, (["tx_hash"] if with_hash else []) + columns, header)
+    values = (np.nan_to_num(frame[columns].to_numpy(dtype=np.float64)) - mean) / scale
+    return (frame["tx_hash"].to_numpy() if with_hash else None), values
+
+
+def map_parts(function, path, parts, args, workers=0, window=8):
+    """
+    Applies `function(path, part, *args)` to every part, in a process pool when
+    `workers` > 0, yielding the results in part order.
+
+    Args:
+    - function (callable): A module-level function, so it can be sent to the workers.
+    - workers (int): Reader processes (0 = read in this process).
+    - window (int): Maximum number of parts read ahead of the consumer.
+    """
+    if workers <= 0:
+        for part in parts:
+            yield function(path, part, *args)
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for part in parts:
+            if len(pending) >= window:
+                yield pending.popleft().result()
+            pending.append(executor.submit(function, path, part, *args))
+        while pending:
+            yield pending.popleft().result()
+
+
+def batches(chunks, min_rows):
+    """
+    Merges chunks smaller than `min_rows` into the next one, since the partial
+    fits need at least as many rows as components or clusters. A short tail
+    is merged into the last full batch.
+    """
+    held, ready = [], None
+    for chunk in chunks:
+        held.append(chunk)
+        if sum(map(len, held)) >= min_rows:
+            if ready is not None:
+                yield ready
+            ready = np.concatenate(held) if len(held) > 1 else held[0]
+            held = []
+    if ready is not None or held:
+        yield np.concatenate(([ready] if ready is not None else []) + held)
+
+
+class StreamingClusterer:
+    """
+    Standardisation, IncrementalPCA and MiniBatchKMeans fitted chunk by chunk
+    over a feature file, so only a few chunks are in memory at a time.
+
+    Args:
+    - n_components (int): Principal components the clusters are fitted on.
+    - n_clusters (int): Number of k-means clusters.
+    - chunksize (int): Approximate rows per chunk.
+    - workers (int): Processes that read and standardise chunks (0 = in this process).
+    - epochs (int): Passes of mini-batch k-means over the data.
+    - exclude (list): Feature columns left out.
+    - random_state (int): Seed for k-means.
+    """
+
+    def __init__(self, n_components=10, n_clusters=8, chunksize=200_000, workers=0, epochs=1,
+                 exclude=EXCLUDED_FEATURES, random_state=0):
+        self.n_components = n_components
+        self.n_clusters = n_clusters
+        self.chunksize = chunksize
+        self.workers = workers
+        self.epochs = epochs
+        self.exclude = exclude
+        self.random_state = random_state
+
+    def _chunks(self, path, with_hash=False):
+        args = (self.columns, self.header, self.mean_, self.scale_, with_hash)
+        return map_parts(standardized_part, path, self.parts, args, self.workers)
+
+    def fit(self, path):
+        """
+        Fits the scaler, PCA and k-means in one streaming pass each.
+        """
+        self.header, self.columns = feature_columns(path, self.exclude)
+        self.parts = feature_parts(path, self.chunksize)
+
+        # Chan et al.'s pairwise combination of per-chunk means and squared deviations
+        count, mean, m2 = 0, np.zeros(len(self.columns)), np.zeros(len(self.columns))
+        for n, part_mean, part_m2 in map_parts(part_moments, path, self.parts, (self.columns, self.header),
+                                               self.workers):
+            if n == 0:
+                continue
+            delta = part_mean - mean
+            total = count + n
+            mean = mean + delta * n / total
+            m2 = m2 + part_m2 + delta ** 2 * count * n / total
+            count = total
+        if count < self.n_clusters:
+            raise ValueError(f"{path} has {count} rows, fewer than the {self.n_clusters} clusters")
+        # every PCA batch needs at least n_components rows, so a file smaller than that caps it
+        n_components = min(self.n_components, len(self.columns), count)
+        self.n_rows_ = count
+        self.mean_ = mean
+        std = np.sqrt(m2 / count)
+        self.scale_ = np.where(std > 0, std, 1.0)
+
+        self.pca_ = IncrementalPCA(n_components=n_components)
+        chunks = (values for _, values in self._chunks(path))
+        for values in tqdm(batches(chunks, n_components), desc="PCA", total=len(self.parts)):
+            self.pca_.partial_fit(values)
+
+        self.kmeans_ = MiniBatchKMeans(n_clusters=self.n_clusters, random_state=self.random_state, n_init=3)
+        for _ in range(self.epochs):
+            chunks = (self.pca_.transform(values) for _, values in self._chunks(path))
+            for values in tqdm(batches(chunks, self.n_clusters), desc="k-means", total=len(self.parts)):
+                self.kmeans_.partial_fit(values)
+        return self
+
+    def iter_assignments(self, path):
+        """
+        Yields one DataFrame per chunk with `tx_hash`, `Cluster` and the first
+        two principal components (`PC1`, `PC2`) for plotting.
+        """
+        for tx_hash, values in self._chunks(path, with_hash=True):
+            components = self.pca_.transform(values)
+            assignments = pd.DataFrame({"tx_hash": tx_hash, "Cluster": self.kmeans_.predict(components)})
+            for i in range(min(2, components.shape[1])):
+                assignments[f"PC{i + 1}"] = components[:, i]
+            yield assignments
+
+
+def save_assignments(assignments, output_file):
+    """
+    Writes the assignment chunks to one CSV or, unless the path ends in `.csv`,
+    one Parquet file (requires `pyarrow`), a chunk at a time.
+
+    Returns:
+    - int: Number of rows written.
+    """
+    if pq is None and not output_file.endswith(".csv"):
+        raise ImportError("pyarrow is required to write Parquet output")
+
+    rows, writer = 0, None
+    try:
+        for chunk in assignments:
+            if output_file.endswith(".csv"):
+                chunk.to_csv(output_file, mode="w" if rows == 0 else "a", header=rows == 0, index=False)
+            else:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_file, table.schema)
+                writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster the transaction feature matrix chunk by chunk.")
+    parser.add_argument("--features", default="transaction_features.parquet",
+                        help="feature matrix from graph_features.py, Parquet unless it ends in .csv")
+    parser.add_argument("--output", default="transaction_clusters.csv",
+                        help="tx_hash -> cluster assignments, CSV or Parquet")
+    parser.add_argument("--components", type=int, default=10, help="principal components")
+    parser.add_argument("--clusters", type=int, default=8, help="k-means clusters")
+    parser.add_argument("--chunksize", type=int, default=200_000, help="rows per chunk")
+    parser.add_argument("--workers", type=int, default=0, help="reader processes (0 = read in this process)")
+    parser.add_argument("--epochs", type=int, default=1, help="k-means passes over the data")
+    args = parser.parse_args()
+
+    clusterer = StreamingClusterer(args.components, args.clusters, args.chunksize, args.workers, args.epochs)
+    clusterer.fit(args.features)
+    rows = save_assignments(clusterer.iter_assignments(args.features), args.output)
+    explained = clusterer.pca_.explained_variance_ratio_.sum()
+    print(f"Saved {rows} cluster assignments to {args.output} "
+          f"({clusterer.pca_.n_components_} components, {explained:.1%} of the variance)")
@@ -0,0 +1,418 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from block_cache import iter_block_files, load_block_columns
+from input_resolution import OutpointResolver, btc_to_satoshi, satoshi_to_btc
+from instrumentation import recorder
+from outpoint_index import OutpointIndex
+
+# numeric transaction node properties, in the column order of `tx_props`
+TX_PROPERTIES = ["inputs_count", "inputs_value", "outputs_count", "outputs_value",
+                 "block_height", "block_time", "fee", "size"]
+
+STANDARD_SCRIPT_TYPES = {"pubkey", "pubkeyhash", "scripthash", "witness_v0_keyhash", "witness_v0_scripthash"}
+
+# edge tx_type values, stored as codes in the parsed arrays
+TX_TYPES = ["standard", "op_return", "complex"]
+STANDARD, OP_RETURN, COMPLEX = range(len(TX_TYPES))
+
+# edge directions: address -> tx for inputs, tx -> address for outputs
+INPUT, OUTPUT = 0, 1
+
+# `node_type` codes of the compact schema (see graph_schema.py): address vertices
+# record whether they were first seen as an input (prev) or an output (next)
+NODE_TYPES = ["tx", "prev", "next"]
+TX_NODE, PREV_NODE, NEXT_NODE = range(len(NODE_TYPES))
+
+
+def is_compact(graph):
+    """
+    True for graphs in the compact schema of `graph_schema.py`, which store
+    categories as integer codes and keep txids and addresses out of the graph.
+    """
+    return "schema" in graph.gp and graph.gp["schema"] == "compact"
+
+
+def parse_block_columns(columns):
+    """
+    Turns a block into the flat arrays the bulk graph builder needs, following
+    exactly the same rules as `process_transaction` in `2_graph_creation.py`.
+    Values are kept in integer satoshis; inputs without verbosity 3 `prevout`
+    data are left unresolved (address None, value -1) for `resolve_parsed`.
+
+    Args:
+    - columns (dict): A block in the columnar layout of `block_cache.block_to_columns`.
+
+    Returns:
+    - dict: `tx_hash` (list), `tx_props` (n_tx x len(TX_PROPERTIES) float array),
+      `tx_fee` and `tx_outputs` (satoshis, fee -1 if not in the block),
+      `edge_count` (edges per tx), and per-edge `edge_address` (list),
+      `edge_direction`, `edge_value` (satoshis), `edge_type`, `edge_txid` (list)
+      and `edge_n` arrays, in insertion order. `edge_txid`/`edge_n` are the
+      spent outpoint for inputs and the output index for outputs.
+    """
+    height, block_time = columns["height"], columns["time"]
+    n_tx = len(columns["txid"])
+    vin_count = np.asarray(columns["vin_count"], dtype=np.int64)
+    vout_count = np.asarray(columns["vout_count"], dtype=np.int64)
+
+    # inputs, minus the coinbase ones
+    vin_txid = columns["vin_txid"]
+    spends = np.array([txid is not None for txid in vin_txid], dtype=bool)
+    vin_tx = np.repeat(np.arange(n_tx), vin_count)[spends]
+    vin_value = [value for value, spend in zip(columns["vin_value"], spends) if spend]
+    known = np.array([value is not None for value in vin_value], dtype=bool)
+    in_value = np.full(len(vin_value), -1, dtype=np.int64)
+    if known.any():
+        in_value[known] = btc_to_satoshi([value for value in vin_value if value is not None])
+    vin_address = [address for address, spend in zip(columns["vin_address"], spends) if spend]
+    in_address = [None if value is None else address if address is not None else "unknown"
+                  for address, value in zip(vin_address, vin_value)]
+    in_txid = [txid for txid in vin_txid if txid is not None]
+    in_n = np.array([n for n, spend in zip(columns["vin_vout"], spends) if spend], dtype=np.int64)
+
+    # outputs
+    vout_tx = np.repeat(np.arange(n_tx), vout_count)
+    vout_type = columns["vout_type"]
+    out_value = btc_to_satoshi(columns["vout_value"]).reshape(-1)
+    nulldata = np.array([script_type == "nulldata" for script_type in vout_type], dtype=bool)
+    out_type = np.array([OP_RETURN if script_type == "nulldata" else
+                         STANDARD if script_type in STANDARD_SCRIPT_TYPES else COMPLEX
+                         for script_type in vout_type], dtype=np.int8)
+    out_address = ["OP_RETURN" if script_type == "nulldata" else address if address is not None else "unknown"
+                   for address, script_type in zip(columns["vout_address"], vout_type)]
+    tx_outputs = np.bincount(vout_tx, weights=out_value, minlength=n_tx).astype(np.int64)
+
+    # each tx lists its inputs, then its outputs; a stable sort on (tx, direction) interleaves them
+    order = np.argsort(np.concatenate([vin_tx * 2 + INPUT, vout_tx * 2 + OUTPUT]), kind="stable").tolist()
+    edge_address, edge_txid = in_address + out_address, in_txid + [None] * len(out_address)
+    edge_address, edge_txid = [edge_address[k] for k in order], [edge_txid[k] for k in order]
+    edge_direction = np.concatenate([np.full(len(in_txid), INPUT), np.full(len(out_address), OUTPUT)])[order]
+    edge_value = np.concatenate([in_value, np.where(nulldata, 0, out_value)])[order]
+    edge_type = np.concatenate([np.full(len(in_txid), STANDARD), out_type])[order]
+    edge_n = np.concatenate([in_n, np.asarray(columns["vout_n"], dtype=np.int64)])[order]
+    edge_count = np.bincount(np.concatenate([vin_tx, vout_tx]), minlength=n_tx)
+
+    tx_fee = np.array([-1 if fee is None else fee for fee in columns["fee"]], dtype=np.float64)
+    tx_fee = np.where(tx_fee < 0, -1, btc_to_satoshi(np.maximum(tx_fee, 0)))
+
+    tx_props = np.zeros((n_tx, len(TX_PROPERTIES)), dtype=np.float64)
+    tx_props[:, 0] = vin_count
+    tx_props[:, 2] = vout_count
+    tx_props[:, 3] = satoshi_to_btc(tx_outputs)
+    tx_props[:, 4] = height
+    tx_props[:, 5] = block_time
+    tx_props[:, 7] = columns["size"]
+
+    return {
+        "height": height,
+        "hash": columns.get("hash"),
+        "time": block_time,
+        "tx_hash": list(columns["txid"]),
+        "tx_props": tx_props,
+        "tx_fee": tx_fee.astype(np.int64),
+        "tx_outputs": tx_outputs,
+        "edge_count": edge_count.astype(np.int64),
+        "edge_address": edge_address,
+        "edge_direction": edge_direction.astype(np.int8),
+        "edge_value": edge_value.astype(np.int64),
+        "edge_type": edge_type.astype(np.int8),
+        "edge_txid": edge_txid,
+        "edge_n": edge_n.astype(np.int64),
+    }
+
+
+def resolve_parsed(parsed, resolver):
+    """
+    Fills in the unresolved inputs of a parsed block from the outpoint map,
+    registers its outputs, and computes the input value and fee of every tx
+    in integer satoshis. Blocks have to be resolved once each, in height order.
+
+    Args:
+    - parsed (dict): Output of `parse_block_columns`, updated in place.
+    - resolver (OutpointResolver): Outputs of the blocks resolved so far.
+
+    Returns:
+    - dict: `parsed`, with every `edge_value` >= 0 and `edge_address` set.
+    """
+    if parsed.get("resolved"):
+        return parsed
+    edge_address, edge_txid = parsed["edge_address"], parsed["edge_txid"]
+    values = parsed["edge_value"].tolist()
+    directions, types, ns = parsed["edge_direction"].tolist(), parsed["edge_type"].tolist(), parsed["edge_n"].tolist()
+    edge_count = parsed["edge_count"]
+    unresolved = [j for j, address in enumerate(edge_address) if address is None]
+    resolver.prefetch([edge_txid[j] for j in unresolved], [ns[j] for j in unresolved])
+
+    position = 0
+    for tx_hash, n_edges in zip(parsed["tx_hash"], edge_count.tolist()):
+        for j in range(position, position + n_edges):
+            if directions[j] == INPUT:
+                spent = resolver.spend(edge_txid[j], ns[j])
+                if edge_address[j] is None:
+                    values[j], edge_address[j] = spent if spent is not None else (-1, "unknown")
+            elif types[j] != OP_RETURN:
+                resolver.add(tx_hash, ns[j], values[j], edge_address[j])
+        position += n_edges
+
+    n_tx = len(parsed["tx_hash"])
+    values = np.array(values, dtype=np.int64)
+    edge_tx = np.repeat(np.arange(n_tx), edge_count)
+    inputs = parsed["edge_direction"] == INPUT
+    resolved = inputs & (values >= 0)
+    tx_inputs = np.bincount(edge_tx[resolved], weights=values[resolved], minlength=n_tx).astype(np.int64)
+    has_inputs = np.bincount(edge_tx[inputs], minlength=n_tx) > 0
+    all_resolved = np.bincount(edge_tx[inputs & ~resolved], minlength=n_tx) == 0
+
+    # the fee comes from the block when present, else from fully resolved inputs
+    fee = parsed["tx_fee"]
+    fee = np.where(fee >= 0, fee, np.where(has_inputs & all_resolved, tx_inputs - parsed["tx_outputs"], 0))
+    parsed["tx_props"][:, 1] = satoshi_to_btc(tx_inputs)
+    parsed["tx_props"][:, 6] = satoshi_to_btc(fee)
+    parsed["edge_value"] = np.maximum(values, 0)
+    parsed["resolved"] = True
+    return parsed
+
+
+def parse_block_file(file_path):
+    """
+    Process pool worker: loads one cached block and parses it into flat arrays.
+    """
+    try:
+        return parse_block_columns(load_block_columns(file_path))
+    except Exception as e:
+        print(f"Error processing file {file_path}: {e}")
+        return None
+
+
+def add_parsed_blocks(graph, parsed_blocks, reverse_map, resolver=None, address_stats=None):
+    """
+    Adds parsed blocks to the graph in bulk. Vertex ids are assigned in the
+    same order as the serial builder (each tx, then its new addresses), so the
+    result is identical to calling `process_block` block by block.
+
+    Args:
+    - graph (gt.Graph): Graph with the properties from `add_graph_properties`.
+    - parsed_blocks (iterable of dict): Output of `parse_block_columns`, in block order.
+    - reverse_map (dict): The `transaction_dict`/`account_dict`/`block_dict` reverse map, updated in place.
+    - resolver (OutpointResolver): Outputs of the blocks added before, to resolve inputs (default: empty).
+    - address_stats (address_store.AddressStats): Per-address aggregates updated with the new edges.
+    """
+    if resolver is None:
+        resolver = OutpointResolver()
+    compact = is_compact(graph)
+    # the compact schema stores the edge tx_type as its code
+    tx_type_values = range(len(TX_TYPES)) if compact else TX_TYPES
+    transaction_dict = reverse_map.setdefault("transaction_dict", {})
+    account_dict = reverse_map.setdefault("account_dict", {})
+    block_dict = reverse_map.setdefault("block_dict", {})
+    first_vertex = next_vertex = graph.num_vertices()
+
+    tx_vertices, tx_props, tx_hashes = [], [], []
+    address_vertices, new_addresses, new_address_types = [], [], []
+    edges = []
+
+    for parsed in parsed_blocks:
+        if parsed is None:
+            continue
+        with recorder.block(parsed["height"]):
+            resolve_parsed(parsed, resolver)
+            block_time = parsed["time"]
+            block_dict[parsed["height"]] = parsed["hash"]
+            edge_address, edge_direction = parsed["edge_address"], parsed["edge_direction"]
+            edge_value, edge_type = satoshi_to_btc(parsed["edge_value"]).tolist(), parsed["edge_type"].tolist()
+            position = 0
+            for tx_hash, n_edges in zip(parsed["tx_hash"], parsed["edge_count"].tolist()):
+                tx_vertex = next_vertex
+                next_vertex += 1
+                transaction_dict[tx_hash] = tx_vertex
+                tx_vertices.append(tx_vertex)
+                tx_hashes.append(tx_hash)
+
+                for j in range(position, position + n_edges):
+                    address = edge_address[j]
+                    address_vertex = account_dict.get(address)
+                    if address_vertex is None:
+                        address_vertex = account_dict[address] = next_vertex
+                        next_vertex += 1
+                        address_vertices.append(address_vertex)
+                        new_addresses.append(address)
+                        new_address_types.append("prev" if edge_direction[j] == INPUT else "next")
+                    if edge_direction[j] == INPUT:
+                        edges.append((address_vertex, tx_vertex, edge_value[j], block_time, tx_type_values[edge_type[j]]))
+                    else:
+                        edges.append((tx_vertex, address_vertex, edge_value[j], block_time, tx_type_values[edge_type[j]]))
+                position += n_edges
+            tx_props.append(parsed["tx_props"])
+
+    if next_vertex == first_vertex:
+        return
+    graph.add_vertex(next_vertex - first_vertex)
+
+    # numeric tx properties are assigned through the array views in one go
+    tx_index = np.array(tx_vertices, dtype=np.int64)
+    tx_props = np.concatenate(tx_props)
+    for k, prop in enumerate(TX_PROPERTIES):
+        graph.vp[f"tx_{prop}"].a[tx_index] = tx_props[:, k]
+
+    if compact:
+        # txids and addresses live in the reverse map and the side string table only
+        graph.vp["node_type"].a[address_vertices] = [PREV_NODE if node_type == "prev" else NEXT_NODE
+                                                     for node_type in new_address_types]
+    else:
+        # string maps have no array view, so they are filled per vertex
+        tx_hash_map = graph.vp["tx_hash"]
+        for vertex, tx_hash in zip(tx_vertices, tx_hashes):
+            tx_hash_map[graph.vertex(vertex)] = tx_hash
+        address_map, prev_type, next_type = graph.vp["address"], graph.vp["prev_type"], graph.vp["next_type"]
+        for vertex, address, node_type in zip(address_vertices, new_addresses, new_address_types):
+            vertex = graph.vertex(vertex)
+            address_map[vertex] = address
+            (prev_type if node_type == "prev" else next_type)[vertex] = "unknown"
+
+    graph.add_edge_list(edges, eprops=[graph.ep["value"], graph.ep["time"], graph.ep["tx_type"]])
+
+    if address_stats is not None and edges:
+        source, target, value, time = (np.array(column) for column in list(zip(*edges))[:4])
+        is_input = np.isin(target, tx_index)
+        tx = np.where(is_input, target, source)
+        address_stats.add_edges({
+            "address": np.where(is_input, source, target), "tx": tx, "value": btc_to_satoshi(value),
+            "is_input": is_input, "time": time,
+            "height": tx_props[np.searchsorted(tx_index, tx), TX_PROPERTIES.index("block_height")].astype(np.int64),
+        })
+
+
+def parse_block_files(file_paths, workers=0, chunksize=4):
+    """
+    Parses block files into flat arrays, in a process pool when `workers` > 0.
+    """
+    if workers > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(parse_block_file, file_paths, chunksize=chunksize))
+    return [parse_block_file(file_path) for file_path in file_paths]
+
+
+def build_graph_parallel(graph, folder_path, reverse_map, workers=4, chunksize=4, resolver=None, address_stats=None):
+    """
+    Parses every cached block in a process pool and assembles the graph in bulk.
+
+    Args:
+    - graph (gt.Graph): Graph with the properties from `add_graph_properties`.
+    - folder_path (str): The block cache folder.
+    - reverse_map (dict): The `transaction_dict`/`account_dict` reverse map, updated in place.
+    - workers (int): Number of parser processes.
+    - chunksize (int): Block files handed to a worker at a time.
+    - resolver (OutpointResolver): Outpoint map used to resolve inputs (default: empty).
+    - address_stats (address_store.AddressStats): Per-address aggregates updated with the new edges.
+    """
+    file_paths = [file_path for _, file_path in iter_block_files(folder_path)]
+    add_parsed_blocks(graph, parse_block_files(file_paths, workers, chunksize), reverse_map, resolver, address_stats)
+
+
+def _remap(mapping, removed):
+    """
+    Drops entries pointing at removed vertices and shifts the remaining vertex
+    ids down the way `remove_vertex(..., fast=False)` renumbers them.
+    """
+    keys = list(mapping.keys())
+    values = np.fromiter(mapping.values(), dtype=np.int64, count=len(keys))
+    keep = ~np.isin(values, removed)
+    shifted = (values - np.searchsorted(removed, values)).tolist()
+    return {key: shifted[i] for i, key in enumerate(keys) if keep[i]}
+
+
+def drop_heights(graph, reverse_map, heights):
+    """
+    Removes the transactions of the given block heights, their edges and any
+    address vertex that only those transactions touched (e.g. after a reorg).
+
+    Args:
+    - graph (gt.Graph): The transaction graph.
+    - reverse_map (dict): The reverse map, updated in place to the new vertex ids.
+    - heights (iterable of int): Block heights to drop.
+
+    Returns:
+    - int: Number of removed vertices.
+    """
+    heights = np.array(sorted(heights), dtype=np.int64)
+    if not len(heights) or not graph.num_vertices():
+        return 0
+    tx_vertices = reverse_map["transaction_dict"].values()
+    is_tx = np.zeros(graph.num_vertices(), dtype=bool)
+    is_tx[np.fromiter(tx_vertices, dtype=np.int64, count=len(tx_vertices))] = True
+    doomed_tx = np.flatnonzero(is_tx & np.isin(graph.vp["tx_block_height"].a, heights))
+
+    # addresses whose every edge goes to a dropped transaction disappear with it
+    edges = graph.get_edges()
+    dropped_edge = np.isin(edges[:, 0], doomed_tx) | np.isin(edges[:, 1], doomed_tx)
+    remaining_degree = np.bincount(edges[~dropped_edge].ravel(), minlength=graph.num_vertices())
+    touched = np.unique(edges[dropped_edge].ravel())
+    doomed_addresses = touched[~is_tx[touched] & (remaining_degree[touched] == 0)]
+
+    removed = np.union1d(doomed_tx, doomed_addresses)
+    graph.remove_vertex(removed, fast=False)
+
+    reverse_map["transaction_dict"] = _remap(reverse_map["transaction_dict"], removed)
+    reverse_map["account_dict"] = _remap(reverse_map["account_dict"], removed)
+    for height in heights.tolist():
+        reverse_map["block_dict"].pop(height, None)
+    return len(removed)
+
+
+def update_graph(graph, folder_path, reverse_map, workers=0, reorg_depth=6, resolver=None, address_stats=None,
+                 outpoint_folder="outpoint_index"):
+    """
+    Brings an existing graph up to date with the block cache: blocks whose
+    height is already recorded in `reverse_map["block_dict"]` are skipped, and
+    recorded heights within `reorg_depth` of the tip whose cached block hash
+    changed are dropped and re-added.
+
+    Args:
+    - graph (gt.Graph): A previously built graph.
+    - folder_path (str): The block cache folder.
+    - reverse_map (dict): The reverse map loaded from `revmap.pkl`, updated in place.
+    - workers (int): Parser processes for the new blocks (0 = in-process).
+    - reorg_depth (int): How many recorded blocks below the tip are checked for reorgs.
+    - resolver (OutpointResolver): Resolves the inputs of the new blocks; by default the
+      `OutpointIndex` in `outpoint_folder`.
+    - address_stats (address_store.AddressStats): Per-address aggregates kept up to date;
+      recomputed from the graph when blocks are dropped.
+    - outpoint_folder (str): Persistent outpoint index used when no resolver is given. It
+      is built from the whole cache once, then only extended by the new blocks.
+
+    Returns:
+    - tuple: (list of added heights, list of dropped heights).
+    """
+    block_dict = reverse_map.setdefault("block_dict", {})
+    if not block_dict and reverse_map.get("transaction_dict"):
+        # graphs built before heights were recorded: recover them from the tx nodes, without hashes
+        tx_vertices = np.fromiter(reverse_map["transaction_dict"].values(), dtype=np.int64)
+        for height in np.unique(graph.vp["tx_block_height"].a[tx_vertices]).astype(np.int64).tolist():
+            block_dict[height] = None
+
+    files = dict(iter_block_files(folder_path))
+    dropped = []
+    if block_dict:
+        tip = max(block_dict)
+        for height in sorted(h for h in block_dict if h >= tip - reorg_depth and h in files):
+            if block_dict[height] is not None and load_block_columns(files[height]).get("hash") != block_dict[height]:
+                # everything above a replaced block belongs to the orphaned branch as well
+                dropped = [h for h in sorted(block_dict) if h >= height]
+                break
+    if dropped:
+        drop_heights(graph, reverse_map, dropped)
+        if address_stats is not None:
+            address_stats.rebuild(graph, reverse_map)
+
+    new_heights = sorted(height for height in files if height not in reverse_map["block_dict"])
+    if resolver is None and new_heights:
+        # inputs of the new blocks may spend outputs of any block already in the graph; the index
+        # keeps those on disk across runs instead of replaying the whole cache every time
+        index = OutpointIndex(outpoint_folder)
+        index.update(folder_path, reorg_depth)
+        resolver = index.resolver()
+    add_parsed_blocks(graph, parse_block_files([files[h] for h in new_heights], workers), reverse_map, resolver,
+                      address_stats)
+    return new_heights, dropped
@@ -0,0 +1,177 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from graph_builder import TX_PROPERTIES
+from revmap_index import StringIndex, load_reverse_map
+
+# address nodes shared by every unresolvable input/output and every OP_RETURN
+# output; they are not counterparties
+PLACEHOLDER_ADDRESSES = ("unknown", "OP_RETURN")
+
+
+def transaction_vertices(reverse_map):
+    """
+    Returns the txids and vertex ids of the transaction nodes, in vertex order.
+
+    Args:
+    - reverse_map (dict or RevmapIndex): Reverse map with a `transaction_dict`.
+
+    Returns:
+    - tuple: (list of txids, np.ndarray of vertex ids)
+    """
+    transaction_dict = reverse_map["transaction_dict"]
+    tx_hashes = list(transaction_dict.keys())
+    if isinstance(transaction_dict, StringIndex):
+        vertices = np.asarray(transaction_dict.values, dtype=np.int64)
+    else:
+        vertices = np.fromiter(transaction_dict.values(), dtype=np.int64, count=len(tx_hashes))
+    order = np.argsort(vertices, kind="stable")
+    return [tx_hashes[i] for i in order.tolist()], vertices[order]
+
+
+def placeholder_vertices(reverse_map):
+    """
+    Vertex ids of the `PLACEHOLDER_ADDRESSES` nodes the graph has.
+    """
+    account_dict = reverse_map["account_dict"]
+    return np.array([account_dict[name] for name in PLACEHOLDER_ADDRESSES if name in account_dict], dtype=np.int64)
+
+
+def split_edges(graph, tx_vertices, properties=()):
+    """
+    Splits every edge of a transaction graph into its transaction and address
+    ends: input edges point from an address to a tx, output edges from a tx to
+    an address.
+
+    Args:
+    - graph (gt.Graph): A graph built by `2_graph_creation.py`.
+    - tx_vertices (np.ndarray): Vertex ids of the transaction nodes.
+    - properties (list): Edge properties to return, as for `graph.get_edges`.
+
+    Returns:
+    - tuple: `tx` and `address` vertex ids and `is_input` (the address spends
+      into the tx), one entry per edge, and the `properties` as one column each.
+    """
+    is_tx = np.zeros(graph.num_vertices(), dtype=bool)
+    is_tx[tx_vertices] = True
+    edges = graph.get_edges(list(properties))
+    source, target = edges[:, 0].astype(np.int64), edges[:, 1].astype(np.int64)
+    is_input = is_tx[target]
+    return np.where(is_input, target, source), np.where(is_input, source, target), is_input, edges[:, 2:]
+
+
+def group_stats(groups, values, n_groups):
+    """
+    Count, sum, mean, min, max and standard deviation of `values` per group id,
+    with 0 for empty groups.
+    """
+    count = np.bincount(groups, minlength=n_groups)
+    total = np.bincount(groups, weights=values, minlength=n_groups)
+    squares = np.bincount(groups, weights=values * values, minlength=n_groups)
+    nonempty = count > 0
+    mean = np.divide(total, count, out=np.zeros(n_groups), where=nonempty)
+    std = np.sqrt(np.maximum(np.divide(squares, count, out=np.zeros(n_groups), where=nonempty) - mean * mean, 0))
+
+    minimum, maximum = np.zeros(n_groups), np.zeros(n_groups)
+    if len(groups):
+        order = np.argsort(groups, kind="stable")
+        sorted_groups, sorted_values = groups[order], values[order]
+        starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+        minimum[sorted_groups[starts]] = np.minimum.reduceat(sorted_values, starts)
+        maximum[sorted_groups[starts]] = np.maximum.reduceat(sorted_values, starts)
+    return {"count": count, "sum": total, "mean": mean, "min": minimum, "max": maximum, "std": std}
+
+
+def extract_features(graph, reverse_map):
+    """
+    Computes the feature matrix of all transaction nodes from the graph's
+    array views, without visiting vertices one by one.
+
+    Besides the properties `add_tx_node` stores, every transaction gets its
+    degrees, count/sum/mean/min/max/std of its input and output edge values,
+    its fee rate, and statistics on its counterparty addresses: how many
+    distinct ones it has, how many of them appear in other transactions too,
+    their mean and largest number of transactions, and how many appear on
+    both its input and output side. The `PLACEHOLDER_ADDRESSES` nodes are left
+    out of the counterparty statistics.
+
+    Args:
+    - graph (gt.Graph): A graph built by `2_graph_creation.py`.
+    - reverse_map (dict or RevmapIndex): The graph's reverse map.
+
+    Returns:
+    - pd.DataFrame: One row per transaction, in vertex order.
+    """
+    tx_hashes, tx_vertices = transaction_vertices(reverse_map)
+    n_vertices, n_tx = graph.num_vertices(), len(tx_vertices)
+    row = np.full(n_vertices, -1, dtype=np.int64)
+    row[tx_vertices] = np.arange(n_tx)
+
+    features = {"tx_hash": tx_hashes}
+    for prop in TX_PROPERTIES:
+        features[f"tx_{prop}"] = np.asarray(graph.vp[f"tx_{prop}"].a)[tx_vertices]
+
+    tx, address, is_input, columns = split_edges(graph, tx_vertices, [graph.ep["value"]])
+    tx_row = row[tx]
+    value = columns[:, 0].astype(np.float64)
+
+    for side, mask in (("in", is_input), ("out", ~is_input)):
+        stats = group_stats(tx_row[mask], value[mask], n_tx)
+        features[f"{side}_degree"] = stats.pop("count")
+        for name, column in stats.items():
+            features[f"{side}_value_{name}"] = column
+
+    # satoshis per byte
+    features["fee_rate"] = np.divide(features["tx_fee"] * 1e8, features["tx_size"],
+                                     out=np.zeros(n_tx), where=features["tx_size"] > 0)
+
+    counterparty = ~np.isin(address, placeholder_vertices(reverse_map))
+    is_input, tx_row, address = is_input[counterparty], tx_row[counterparty], address[counterparty]
+
+    # one row per distinct (tx, counterparty) pair, with the number of txs the address appears in
+    pairs = np.unique(tx_row * np.int64(n_vertices) + address)
+    pair_tx, pair_address = pairs // n_vertices, pairs % n_vertices
+    address_tx_count = np.bincount(pair_address, minlength=n_vertices)
+    degree = address_tx_count[pair_address].astype(np.float64)
+    stats = group_stats(pair_tx, degree, n_tx)
+    features["counterparties"] = stats["count"]
+    features["reused_counterparties"] = np.bincount(pair_tx[degree > 1], minlength=n_tx)
+    features["counterparty_tx_mean"] = stats["mean"]
+    features["counterparty_tx_max"] = stats["max"]
+
+    input_pairs = np.unique(tx_row[is_input] * np.int64(n_vertices) + address[is_input])
+    output_pairs = np.unique(tx_row[~is_input] * np.int64(n_vertices) + address[~is_input])
+    features["self_transfers"] = np.bincount(np.intersect1d(input_pairs, output_pairs) // n_vertices, minlength=n_tx)
+
+    return pd.DataFrame(features)
+
+
+def save_features(features, output_file, row_group_size=100_000):
+    """
+    Writes the feature matrix as Parquet (requires `pyarrow`) or, for a `.csv` path, as CSV.
+    The Parquet row groups are the chunks `feature_clustering.py` reads them back in.
+    """
+    if output_file.endswith(".csv"):
+        features.to_csv(output_file, index=False)
+    else:
+        features.to_parquet(output_file, index=False, row_group_size=row_group_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the transaction feature matrix from BitcoinGraph.gt.")
+    parser.add_argument("--graph", default="BitcoinGraph.gt")
+    parser.add_argument("--output", default="transaction_features.parquet",
+                        help="output file, Parquet unless it ends in .csv")
+    args = parser.parse_args()
+
+    import graph_tool.all as gt
+
+    graph = gt.load_graph(args.graph)
+    reverse_map = load_reverse_map()
+    if reverse_map is None:
+        parser.error("no revmap.pkl or revmap_index/ in the current folder")
+    features = extract_features(graph, reverse_map)
+    save_features(features, args.output)
+    print(f"Saved {len(features)} transactions x {features.shape[1] - 1} features to {args.output}")
@@ -0,0 +1,155 @@
+"""
+Compact property schema for `BitcoinGraph.gt`. The original schema stores
+every tx property as a double and txids, addresses, `prev_type`/`next_type`
+and the edge `tx_type` as strings on every vertex and edge. The compact one
+uses integer types, replaces the categories by small integer codes
+(`graph_builder.TX_TYPES` for `tx_type`, `graph_builder.NODE_TYPES` for
+`node_type`), and keeps txids and addresses in a memory-mapped side table
+indexed by vertex (`VertexStrings`), built from the reverse map.
+
+    python graph_schema.py BitcoinGraph.gt    # converts the graph in place
+"""
+import argparse
+import os
+
+import numpy as np
+
+from graph_builder import NEXT_NODE, PREV_NODE, STANDARD, TX_TYPES, is_compact
+from revmap_index import StringIndex, encode_strings, load_reverse_map
+
+COMPACT_VERTEX_TYPES = {
+    "tx_inputs_count": "int32_t",
+    "tx_inputs_value": "double",
+    "tx_outputs_count": "int32_t",
+    "tx_outputs_value": "double",
+    "tx_block_height": "int32_t",
+    "tx_block_time": "int64_t",
+    "tx_fee": "double",
+    "tx_size": "int32_t",
+    "node_type": "int16_t",
+}
+
+# edge times are block timestamps like tx_block_time, so int64 too (int32 overflows in 2038)
+COMPACT_EDGE_TYPES = {"value": "double", "time": "int64_t", "tx_type": "int16_t"}
+
+# string properties of the original schema that the compact one drops
+LEGACY_STRING_PROPERTIES = ["tx_hash", "address", "prev_type", "next_type"]
+
+
+def add_compact_properties(graph):
+    """
+    Declares the compact schema's properties on an empty graph.
+    """
+    for name, value_type in COMPACT_VERTEX_TYPES.items():
+        graph.vp[name] = graph.new_vertex_property(value_type)
+    for name, value_type in COMPACT_EDGE_TYPES.items():
+        graph.ep[name] = graph.new_edge_property(value_type)
+    graph.gp["schema"] = graph.new_graph_property("string", "compact")
+
+
+def convert_graph(graph):
+    """
+    Converts a graph from the original schema to the compact one, in place.
+    Txids and addresses are dropped from the graph; write them with
+    `save_vertex_strings` if they are needed by vertex.
+    """
+    import graph_tool.all as gt
+
+    if is_compact(graph):
+        return graph
+    for name, value_type in COMPACT_VERTEX_TYPES.items():
+        if name in graph.vp:
+            values = np.asarray(graph.vp[name].a)
+            if value_type != "double":
+                values = np.rint(values).astype(np.int64)
+            graph.vp[name] = graph.new_vertex_property(value_type, vals=values)
+
+    # categories are mapped once per distinct value, not once per vertex or edge
+    is_prev, is_next = graph.new_vertex_property("int16_t"), graph.new_vertex_property("int16_t")
+    gt.map_property_values(graph.vp["prev_type"], is_prev, lambda value: int(value != ""))
+    gt.map_property_values(graph.vp["next_type"], is_next, lambda value: int(value != ""))
+    node_type = graph.new_vertex_property("int16_t")
+    node_type.a = np.where(is_prev.a > 0, PREV_NODE, np.where(is_next.a > 0, NEXT_NODE, 0))
+    graph.vp["node_type"] = node_type
+
+    tx_type = graph.new_edge_property("int16_t")
+    gt.map_property_values(graph.ep["tx_type"], tx_type, lambda value: TX_TYPES.index(value) if value else STANDARD)
+    graph.ep["tx_type"] = tx_type
+    graph.ep["time"] = graph.new_edge_property(COMPACT_EDGE_TYPES["time"], vals=graph.ep["time"].a)
+
+    for name in LEGACY_STRING_PROPERTIES:
+        del graph.vp[name]
+    graph.gp["schema"] = graph.new_graph_property("string", "compact")
+    return graph
+
+
+def strings_path(graph_file):
+    """
+    Folder of the side string table of a graph file, e.g. `BitcoinGraph.strings`.
+    """
+    return os.path.splitext(graph_file)[0] + ".strings"
+
+
+def save_vertex_strings(reverse_map, n_vertices, folder):
+    """
+    Writes the txid or address of every vertex, taken from the reverse map,
+    as an interned string table indexed by vertex (see `revmap_index.encode_strings`).
+
+    Args:
+    - reverse_map (dict or RevmapIndex): The graph's reverse map.
+    - n_vertices (int): Number of vertices of the graph.
+    - folder (str): Output folder.
+    """
+    os.makedirs(folder, exist_ok=True)
+    strings = [""] * n_vertices
+    for name in ("transaction_dict", "account_dict"):
+        mapping = reverse_map[name]
+        keys = list(mapping.keys())
+        if isinstance(mapping, StringIndex):
+            vertices = np.asarray(mapping.values).tolist()
+        else:
+            vertices = list(mapping.values())
+        for key, vertex in zip(keys, vertices):
+            strings[vertex] = key
+    offsets, data = encode_strings(strings)
+    np.save(os.path.join(folder, "offsets.npy"), offsets)
+    np.save(os.path.join(folder, "strings.npy"), data)
+
+
+class VertexStrings:
+    """
+    Memory-mapped vertex -> txid or address table written by `save_vertex_strings`.
+    """
+
+    def __init__(self, folder):
+        self.offsets = np.load(os.path.join(folder, "offsets.npy"), mmap_mode="r")
+        self.strings = np.load(os.path.join(folder, "strings.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, vertex):
+        vertex = int(vertex)
+        return self.strings[self.offsets[vertex]:self.offsets[vertex + 1]].tobytes().decode()
+
+    def many(self, vertices):
+        return [self[vertex] for vertex in vertices]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("graph", nargs="?", default="BitcoinGraph.gt")
+    parser.add_argument("--output", help="write the converted graph here instead of replacing the input")
+    args = parser.parse_args()
+
+    import graph_tool.all as gt
+
+    graph = gt.load_graph(args.graph)
+    reverse_map = load_reverse_map()
+    if reverse_map is None:
+        parser.error("no revmap.pkl or revmap_index/ in the current folder")
+    output = args.output or args.graph
+    convert_graph(graph)
+    save_vertex_strings(reverse_map, graph.num_vertices(), strings_path(output))
+    graph.save(output)
+    print(f"Saved the compact graph to {output} and its txids and addresses to {strings_path(output)}/")
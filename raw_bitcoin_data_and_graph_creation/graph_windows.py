@@ -0,0 +1,310 @@
+import argparse
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from graph_builder import is_compact
+from graph_features import placeholder_vertices, split_edges, transaction_vertices
+from input_resolution import btc_to_satoshi, satoshi_to_btc
+from revmap_index import load_reverse_map
+
+# about one day of blocks
+BLOCKS_PER_DAY = 144
+
+
+def window_start(height, window=BLOCKS_PER_DAY):
+    """
+    First height of the fixed `window`-block partition containing `height`.
+    """
+    return height - height % window
+
+
+class GraphWindows:
+    """
+    Height and time windows over a transaction graph. The per-edge height and
+    endpoint arrays are computed once, after which every window is a pair of
+    boolean masks that `view` hands to `gt.GraphView` without copying the graph.
+
+    Args:
+    - graph (gt.Graph): A graph built by `2_graph_creation.py`.
+    - reverse_map (dict or RevmapIndex): The graph's reverse map.
+    """
+
+    def __init__(self, graph, reverse_map):
+        self.graph = graph
+        _, tx_vertices = transaction_vertices(reverse_map)
+        n_vertices = graph.num_vertices()
+        self.is_tx = np.zeros(n_vertices, dtype=bool)
+        self.is_tx[tx_vertices] = True
+        # the shared "unknown" and "OP_RETURN" nodes are not addresses anyone holds
+        self.is_placeholder = np.zeros(n_vertices, dtype=bool)
+        self.is_placeholder[placeholder_vertices(reverse_map)] = True
+        self.n_addresses = n_vertices - len(tx_vertices) - int(self.is_placeholder.sum())
+        self.vertex_height = np.asarray(graph.vp["tx_block_height"].a, dtype=np.int64)
+        self.vertex_time = np.asarray(graph.vp["tx_block_time"].a, dtype=np.int64)
+
+        self.edge_tx, self.edge_address, self.edge_is_input, columns = split_edges(
+            graph, tx_vertices, [graph.edge_index, graph.ep["value"]])
+        self.edge_index = columns[:, 0].astype(np.int64)
+        self.edge_value = btc_to_satoshi(columns[:, 1])
+        self.edge_height = self.vertex_height[self.edge_tx]
+
+    def heights(self):
+        """
+        Returns the sorted block heights present in the graph.
+        """
+        return np.unique(self.vertex_height[self.is_tx])
+
+    def masks(self, edge_selected):
+        """
+        Vertex and edge filters for the edges selected by a boolean array over
+        `get_edges` order: the selected edges, their transactions and their
+        addresses.
+
+        Returns:
+        - tuple: (vertex mask, edge mask), indexed by vertex and edge index.
+        """
+        vertex_mask = np.zeros(self.graph.num_vertices(), dtype=bool)
+        vertex_mask[self.edge_tx[edge_selected]] = True
+        vertex_mask[self.edge_address[edge_selected]] = True
+        edge_mask = np.zeros(self.graph.edge_index_range, dtype=bool)
+        edge_mask[self.edge_index[edge_selected]] = True
+        return vertex_mask, edge_mask
+
+    def height_masks(self, start_height, end_height):
+        """
+        Masks of the transactions of blocks `start_height` <= height < `end_height`.
+        Transactions without edges are kept as isolated vertices.
+        """
+        vertex_mask, edge_mask = self.masks((self.edge_height >= start_height) & (self.edge_height < end_height))
+        vertex_mask |= self.is_tx & (self.vertex_height >= start_height) & (self.vertex_height < end_height)
+        return vertex_mask, edge_mask
+
+    def time_masks(self, start_time, end_time):
+        """
+        Masks of the transactions with `start_time` <= block time < `end_time` (Unix seconds).
+        """
+        edge_time = self.vertex_time[self.edge_tx]
+        vertex_mask, edge_mask = self.masks((edge_time >= start_time) & (edge_time < end_time))
+        vertex_mask |= self.is_tx & (self.vertex_time >= start_time) & (self.vertex_time < end_time)
+        return vertex_mask, edge_mask
+
+    def view(self, start_height, end_height):
+        """
+        Returns a `gt.GraphView` of the blocks `start_height` <= height < `end_height`.
+        """
+        import graph_tool.all as gt
+
+        vertex_mask, edge_mask = self.height_masks(start_height, end_height)
+        return gt.GraphView(self.graph, vfilt=vertex_mask, efilt=edge_mask)
+
+    def time_view(self, start_time, end_time):
+        """
+        Returns a `gt.GraphView` of the blocks mined in [`start_time`, `end_time`).
+        """
+        import graph_tool.all as gt
+
+        vertex_mask, edge_mask = self.time_masks(start_time, end_time)
+        return gt.GraphView(self.graph, vfilt=vertex_mask, efilt=edge_mask)
+
+    def partition(self, start_height, end_height):
+        """
+        Copies a height window into a standalone graph. Vertex ids are renumbered,
+        so addresses and transactions are identified by their `address` and
+        `tx_hash` properties, or in the compact schema (see graph_schema.py) by
+        a `vertex` property holding the id in the full graph.
+        """
+        import graph_tool.all as gt
+
+        if is_compact(self.graph) and "vertex" not in self.graph.vp:
+            self.graph.vp["vertex"] = self.graph.new_vertex_property("int32_t", vals=np.arange(self.graph.num_vertices()))
+        return gt.Graph(self.view(start_height, end_height), prune=True)
+
+
+def partition_path(folder, start_height):
+    return os.path.join(folder, f"window_{start_height}.gt")
+
+
+def save_partitions(windows, folder, window=BLOCKS_PER_DAY, heights=None):
+    """
+    Writes one graph per fixed `window`-block partition to `folder/window_{start}.gt`.
+
+    Args:
+    - windows (GraphWindows): Windows over the full graph.
+    - folder (str): Output folder.
+    - window (int): Blocks per partition.
+    - heights (iterable of int): Only rewrite the partitions containing these
+      heights (e.g. the heights added or dropped by `update_graph`); partitions
+      left without transactions are deleted. Default: all partitions.
+
+    Returns:
+    - list of int: Start heights of the written partitions.
+    """
+    os.makedirs(folder, exist_ok=True)
+    present = {window_start(height, window) for height in windows.heights().tolist()}
+    starts = present if heights is None else {window_start(height, window) for height in heights}
+    written = []
+    for start in sorted(starts):
+        path = partition_path(folder, start)
+        if start not in present:
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        windows.partition(start, start + window).save(path)
+        written.append(start)
+    return written
+
+
+def load_partition(folder, height, window=BLOCKS_PER_DAY):
+    """
+    Loads the saved partition containing `height`.
+    """
+    import graph_tool.all as gt
+
+    return gt.load_graph(partition_path(folder, window_start(height, window)))
+
+
+def partition_starts(folder):
+    """
+    Returns the sorted start heights of the partitions saved in `folder`.
+    """
+    names = glob.glob(os.path.join(folder, "window_*.gt"))
+    return sorted(int(os.path.basename(name)[len("window_"):-len(".gt")]) for name in names)
+
+
+class SlidingWindowMetrics:
+    """
+    Activity metrics of a window of `window` blocks sliding `step` blocks at a
+    time. Moving the window only removes the edges of the blocks that leave it
+    and adds those of the blocks that enter it: each address's degree in the
+    window and the degree histogram are updated for those edges alone, and
+    counts and volumes come from prefix sums over the height-sorted edges.
+    The "unknown" and "OP_RETURN" placeholder nodes are not counted as addresses.
+
+    Args:
+    - windows (GraphWindows): Windows over the full graph.
+    - window (int): Window length in blocks.
+    - step (int): Blocks the window moves per step.
+    """
+
+    def __init__(self, windows, window=BLOCKS_PER_DAY, step=1):
+        self.window, self.step = window, step
+        order = np.argsort(windows.edge_height, kind="stable")
+        self.edge_height = windows.edge_height[order]
+        self.edge_address = windows.edge_address[order]
+        # only edges of real addresses count towards the degrees; volumes include every output
+        self.edge_counted = ~windows.is_placeholder[self.edge_address]
+        output_value = np.where(windows.edge_is_input[order], 0, windows.edge_value[order])
+        self.volume = np.concatenate(([0], np.cumsum(output_value)))
+
+        tx = np.flatnonzero(windows.is_tx)
+        tx_order = np.argsort(windows.vertex_height[tx], kind="stable")
+        self.tx_height = windows.vertex_height[tx][tx_order]
+        tx_fee = btc_to_satoshi(np.asarray(windows.graph.vp["tx_fee"].a)[tx][tx_order])
+        self.fees = np.concatenate(([0], np.cumsum(tx_fee)))
+
+        self.n_addresses = windows.n_addresses
+        self.degree = np.zeros(windows.graph.num_vertices(), dtype=np.int64)
+        # histogram[d] = addresses with d edges in the window; inactive ones sit at 0
+        self.histogram = np.array([self.n_addresses], dtype=np.int64)
+        self.edges = 0
+        heights = windows.heights()
+        self.first_height = int(heights[0]) if len(heights) else 0
+        self.last_height = int(heights[-1]) if len(heights) else -1
+
+    def _edge_position(self, height):
+        return int(np.searchsorted(self.edge_height, height))
+
+    def _tx_position(self, height):
+        return int(np.searchsorted(self.tx_height, height))
+
+    def _apply(self, lo, hi, sign):
+        """
+        Adds (sign 1) or removes (sign -1) the sorted edges lo:hi from the window.
+        """
+        if hi <= lo:
+            return
+        addresses, counts = np.unique(self.edge_address[lo:hi][self.edge_counted[lo:hi]], return_counts=True)
+        if not len(addresses):
+            return
+        old = self.degree[addresses]
+        new = old + sign * counts
+        self.degree[addresses] = new
+        size = max(len(self.histogram), int(new.max()) + 1)
+        self.histogram = np.pad(self.histogram, (0, size - len(self.histogram)))
+        self.histogram -= np.bincount(old, minlength=size)
+        self.histogram += np.bincount(new, minlength=size)
+        self.edges += sign * int(counts.sum())
+
+    def _record(self, start):
+        end = start + self.window
+        lo, hi = self._tx_position(start), self._tx_position(end)
+        edge_lo, edge_hi = self._edge_position(start), self._edge_position(end)
+        active = self.n_addresses - int(self.histogram[0])
+        nonzero = np.flatnonzero(self.histogram)
+        return {
+            "start_height": start,
+            "end_height": end - 1,
+            "transactions": hi - lo,
+            "active_addresses": active,
+            "volume": satoshi_to_btc(int(self.volume[edge_hi] - self.volume[edge_lo])),
+            "fees": satoshi_to_btc(int(self.fees[hi] - self.fees[lo])),
+            "mean_degree": self.edges / active if active else 0.0,
+            "max_degree": int(nonzero[-1]) if len(nonzero) else 0,
+            "degree_histogram": self.histogram[1:nonzero[-1] + 1].copy() if len(nonzero) else self.histogram[1:1],
+        }
+
+    def __iter__(self):
+        """
+        Yields one dict of metrics per window position, from the first recorded
+        height until the window reaches the last one. `degree_histogram[d - 1]`
+        is the number of addresses with d edges in the window.
+        """
+        start = self.first_height
+        self._apply(self._edge_position(start), self._edge_position(start + self.window), 1)
+        while True:
+            yield self._record(start)
+            if start + self.window > self.last_height:
+                return
+            following = start + self.step
+            # edges of [start, following) leave, edges of [start + window, following + window) enter
+            self._apply(self._edge_position(start), self._edge_position(min(following, start + self.window)), -1)
+            self._apply(self._edge_position(max(start + self.window, following)),
+                        self._edge_position(following + self.window), 1)
+            start = following
+
+
+def sliding_window_metrics(windows, window=BLOCKS_PER_DAY, step=1):
+    """
+    Returns the sliding-window metrics as a DataFrame, one row per window
+    position, without the degree histograms.
+    """
+    rows = [{key: value for key, value in record.items() if key != "degree_histogram"}
+            for record in SlidingWindowMetrics(windows, window, step)]
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split BitcoinGraph.gt into block windows and compute sliding-window metrics.")
+    parser.add_argument("--graph", default="BitcoinGraph.gt")
+    parser.add_argument("--window", type=int, default=BLOCKS_PER_DAY, help="blocks per window")
+    parser.add_argument("--step", type=int, default=1, help="blocks the metrics window moves per step")
+    parser.add_argument("--partitions", metavar="FOLDER", help="also write one graph per window to this folder")
+    parser.add_argument("--metrics", default="window_metrics.csv")
+    args = parser.parse_args()
+
+    import graph_tool.all as gt
+
+    graph = gt.load_graph(args.graph)
+    reverse_map = load_reverse_map()
+    if reverse_map is None:
+        parser.error("no revmap.pkl or revmap_index/ in the current folder")
+    windows = GraphWindows(graph, reverse_map)
+    if args.partitions:
+        written = save_partitions(windows, args.partitions, args.window)
+        print(f"Saved {len(written)} window graphs to {args.partitions}/")
+    metrics = sliding_window_metrics(windows, args.window, args.step)
+    metrics.to_csv(args.metrics, index=False)
+    print(f"Saved metrics of {len(metrics)} windows to {args.metrics}")
@@ -0,0 +1,234 @@
+import argparse
+import csv
+import importlib
+import os
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import dill as pickle
+from tqdm import tqdm
+
+from block_cache import iter_block_files, load_block_columns
+from graph_builder import TX_PROPERTIES, add_parsed_blocks, parse_block_columns, resolve_parsed
+from input_resolution import OutpointResolver
+from instrumentation import recorder
+from outpoint_index import OutpointIndex
+from revmap_index import save_index
+
+# the numbered pipeline scripts are imported by name so their helpers can be reused
+txid_matching = importlib.import_module("3_transact_and_address_matching")
+
+
+class IngestedBlock:
+    """
+    One decoded block shared by all sinks. The flat graph arrays are only
+    computed when a sink asks for them, and then only once.
+    """
+
+    def __init__(self, height, columns, parsed=None):
+        self.height = height
+        self.columns = columns
+        self._parsed = parsed
+
+    @property
+    def parsed(self):
+        if self._parsed is None:
+            self._parsed = parse_block_columns(self.columns)
+        return self._parsed
+
+
+class BlockSink:
+    """
+    Base class of the ingestion outputs. `consume` is called once per block, in
+    height order, and `close` once at the end.
+    """
+    # set to True when the sink reads `block.parsed`, so workers compute it up front
+    needs_parsed = False
+
+    def consume(self, block):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class GraphSink(BlockSink):
+    """
+    Builds `BitcoinGraph.gt`, `revmap.pkl` and `revmap_index/`, like `2_graph_creation.py`.
+    """
+    needs_parsed = True
+
+    def __init__(self, graph_file="BitcoinGraph.gt", revmap_file="revmap.pkl", batch_blocks=64):
+        import graph_tool.all as gt
+        graph_creation = importlib.import_module("2_graph_creation")
+
+        self.graph = gt.Graph(directed=True)
+        graph_creation.add_graph_properties(self.graph)
+        self.reverse_map = defaultdict(dict)
+        self.graph_file, self.revmap_file = graph_file, revmap_file
+        self.batch_blocks = batch_blocks
+        self.pending = []
+
+    def consume(self, block):
+        self.pending.append(block.parsed)
+        if len(self.pending) >= self.batch_blocks:
+            self.flush()
+
+    def flush(self):
+        # its own stage, so add_parsed_blocks' per-block times are not counted in "ingest" twice
+        with recorder.stage("graph_assembly"):
+            add_parsed_blocks(self.graph, self.pending, self.reverse_map)
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        with open(self.revmap_file, "wb") as f:
+            pickle.dump(dict(self.reverse_map), f)
+        save_index(self.reverse_map, os.path.join(os.path.dirname(self.revmap_file), "revmap_index"))
+        self.graph.save(self.graph_file)
+
+
+class TxidAddressSink(BlockSink):
+    """
+    Writes `txid_addresses.csv`, like `3_transact_and_address_matching.py`.
+    """
+
+    def __init__(self, output_file="txid_addresses.csv"):
+        self.file = open(output_file, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(['Transaction ID', 'Address'])
+
+    def consume(self, block):
+        self.writer.writerows(txid_matching.extract_txid_addresses_from_columns(block.columns))
+
+    def close(self):
+        self.file.close()
+
+
+class FeatureSink(BlockSink):
+    """
+    Writes one row per transaction with the properties `add_tx_node` stores on
+    transaction vertices.
+    """
+    needs_parsed = True
+
+    def __init__(self, output_file="transaction_features.csv"):
+        self.file = open(output_file, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(["tx_hash"] + [f"tx_{prop}" for prop in TX_PROPERTIES])
+
+    def consume(self, block):
+        parsed = block.parsed
+        self.writer.writerows([tx_hash] + props for tx_hash, props in zip(parsed["tx_hash"], parsed["tx_props"].tolist()))
+
+    def close(self):
+        self.file.close()
+
+
+class OutpointSink(BlockSink):
+    """
+    Appends the blocks above its tip to the outpoint index (see `outpoint_index.py`).
+    """
+
+    def __init__(self, folder="outpoint_index", batch_blocks=500):
+        self.index = OutpointIndex(folder)
+        self.batch_blocks = batch_blocks
+
+    def consume(self, block):
+        if self.index.tip is None or block.height > self.index.tip:
+            self.index.add_block(block.columns)
+            if len(self.index.pending) >= self.batch_blocks:
+                self.index.flush()
+
+    def close(self):
+        self.index.flush()
+
+
+SINKS = {"graph": GraphSink, "txid": TxidAddressSink, "features": FeatureSink, "outpoints": OutpointSink}
+
+
+def decode_block(height, block_file, parse=False):
+    """
+    Process pool worker: decodes one block file (and optionally its graph arrays).
+    """
+    try:
+        columns = load_block_columns(block_file)
+    except Exception as e:
+        print(f"Error processing file {block_file}: {e}")
+        return None
+    return IngestedBlock(height, columns, parse_block_columns(columns) if parse else None)
+
+
+def iter_ingested_blocks(directory, workers=0, parse=False, window=16):
+    """
+    Decodes each cached block once, in height order.
+
+    Args:
+    - directory (str): The block cache folder.
+    - workers (int): Decoder processes (0 = decode in this process).
+    - parse (bool): Also compute the flat graph arrays in the workers.
+    - window (int): Maximum number of blocks decoded ahead of the sinks.
+
+    Yields:
+    - IngestedBlock: The decoded blocks.
+    """
+    block_files = iter_block_files(directory)
+    if workers <= 0:
+        for height, block_file in block_files:
+            block = decode_block(height, block_file)
+            if block is not None:
+                yield block
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for height, block_file in block_files:
+            if len(pending) >= window:
+                block = pending.popleft().result()
+                if block is not None:
+                    yield block
+            pending.append(executor.submit(decode_block, height, block_file, parse))
+        while pending:
+            block = pending.popleft().result()
+            if block is not None:
+                yield block
+
+
+def ingest(directory, sinks, workers=0):
+    """
+    Feeds every cached block, decoded once, to all sinks.
+
+    Args:
+    - directory (str): The block cache folder.
+    - sinks (list of BlockSink): The outputs to produce.
+    - workers (int): Decoder processes (0 = decode in this process).
+
+    Returns:
+    - int: Number of ingested blocks.
+    """
+    parse = any(sink.needs_parsed for sink in sinks)
+    # inputs are resolved here, once and in height order, so every sink sees the same values
+    resolver = OutpointResolver()
+    count = 0
+    with recorder.stage("ingest"):
+        for block in tqdm(iter_ingested_blocks(directory, workers, parse)):
+            with recorder.block(block.height):
+                if parse:
+                    resolve_parsed(block.parsed, resolver)
+                for sink in sinks:
+                    sink.consume(block)
+            count += 1
+        recorder.count("blocks", count)
+        for sink in sinks:
+            sink.close()
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode every cached block once and write all derived outputs.")
+    parser.add_argument("--sinks", nargs="+", choices=sorted(SINKS), default=sorted(SINKS))
+    parser.add_argument("--workers", type=int, default=0, help="decoder processes (0 = decode in this process)")
+    args = parser.parse_args()
+
+    count = ingest("blocks", [SINKS[name]() for name in args.sinks], args.workers)
+    print(f"Ingested {count} blocks into: {', '.join(args.sinks)}")
@@ -0,0 +1,108 @@
+import numpy as np
+
+from block_cache import iter_block_files, load_block_columns
+
+SATOSHI_PER_BTC = 100_000_000
+
+
+def btc_to_satoshi(values):
+    """
+    Converts BTC amounts, as returned by `getblock`, to integer satoshis in bulk.
+
+    Args:
+    - values (float or sequence of floats): Amounts in BTC.
+
+    Returns:
+    - np.ndarray or np.int64: Amounts in satoshis.
+    """
+    return np.rint(np.asarray(values, dtype=np.float64) * SATOSHI_PER_BTC).astype(np.int64)
+
+
+def satoshi_to_btc(satoshi):
+    return satoshi / SATOSHI_PER_BTC
+
+
+class OutpointResolver:
+    """
+    In-memory map of the outputs created by the blocks processed so far,
+    (txid, n) -> (value in satoshis, address), from which spent outputs are
+    removed. It fills in the value and address of inputs for `getblock`
+    verbosity 2 blocks, which only reference the outpoint they spend.
+
+    Blocks have to be fed in height order; inputs spending outputs created
+    before the first fed block stay unresolved unless the block carries
+    verbosity 3 `prevout` data.
+    """
+
+    def __init__(self):
+        self.outputs = {}
+
+    def __len__(self):
+        return len(self.outputs)
+
+    def add(self, txid, n, value, address):
+        self.outputs[(txid, n)] = (value, address)
+
+    def spend(self, txid, n):
+        """
+        Removes an output from the map and returns its (value, address), or None if it is unknown.
+        """
+        return self.outputs.pop((txid, n), None)
+
+    def prefetch(self, txids, ns):
+        """
+        Hook called with the outpoints a block is about to spend, so resolvers
+        backed by storage can load them in one batch. Nothing to do in memory.
+        """
+
+    def add_block_outputs(self, columns):
+        """
+        Registers all spendable outputs of a block in the columnar cache layout.
+        """
+        values = btc_to_satoshi(columns["vout_value"]).tolist()
+        position = 0
+        for txid, vout_count in zip(columns["txid"], columns["vout_count"]):
+            for j in range(position, position + vout_count):
+                if columns["vout_type"][j] != "nulldata":
+                    address = columns["vout_address"][j]
+                    self.add(txid, columns["vout_n"][j], values[j], address if address is not None else "unknown")
+            position += vout_count
+
+    def resolve_vin(self, vin):
+        """
+        Resolves one non-coinbase input of a `getblock`-shaped transaction.
+
+        Returns:
+        - tuple: (value in satoshis or None if unknown, address)
+        """
+        prevout = vin.get("prevout")
+        if prevout is not None:
+            self.outputs.pop((vin.get("txid"), vin.get("vout")), None)
+            return int(round(prevout["value"] * SATOSHI_PER_BTC)), prevout.get("scriptPubKey", {}).get("address", "unknown")
+        spent = self.spend(vin.get("txid"), vin.get("vout"))
+        if spent is not None:
+            return spent
+        return None, "unknown"
+
+    def add_tx_outputs(self, tx):
+        # a handful of scalars per transaction: plain rounding is cheaper than a numpy round trip
+        for vout in tx["vout"]:
+            script = vout["scriptPubKey"]
+            if script.get("type") != "nulldata":
+                self.add(tx["txid"], vout["n"], int(round(vout["value"] * SATOSHI_PER_BTC)), script.get("address", "unknown"))
+
+
+def warm_up_resolver(resolver, folder_path, below_height):
+    """
+    Replays the cached blocks under `below_height` into the resolver, so blocks
+    added later can spend their outputs. Only outputs and spends are replayed.
+    """
+    for height, file_path in iter_block_files(folder_path):
+        if height >= below_height:
+            break
+        columns = load_block_columns(file_path)
+        # outputs first, so spends of outputs created earlier in the same block are removed too
+        resolver.add_block_outputs(columns)
+        for txid, n in zip(columns["vin_txid"], columns["vin_vout"]):
+            if txid is not None:
+                resolver.spend(txid, n)
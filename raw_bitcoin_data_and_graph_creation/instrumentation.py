@@ -0,0 +1,241 @@
+"""
+Run instrumentation shared by the pipeline scripts. `PIPELINE_REPORT=<folder>`
+writes a JSON run report per script run, `PIPELINE_PROFILE=<folder>` profiles
+the `@profiled` functions with cProfile. Measurements are taken in the process
+doing the work, so pool workers' decoding is not included.
+"""
+import atexit
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPORT_FOLDER = os.environ.get("PIPELINE_REPORT")
+PROFILE_FOLDER = os.environ.get("PIPELINE_PROFILE")
+
+# latency histogram bucket upper bounds in milliseconds; the last bucket is open-ended
+LATENCY_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+
+def peak_rss():
+    """
+    Peak resident set size of this process in bytes, or None where unavailable.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram of durations in milliseconds.
+    """
+
+    def __init__(self, bounds=LATENCY_BOUNDS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count, self.total, self.maximum = 0, 0.0, 0.0
+
+    def add(self, milliseconds):
+        self.counts[bisect_left(self.bounds, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.maximum = max(self.maximum, milliseconds)
+
+    def to_dict(self):
+        return {"bounds_ms": self.bounds, "counts": self.counts, "count": self.count,
+                "mean_ms": self.total / self.count if self.count else 0.0, "max_ms": self.maximum}
+
+
+class Stage:
+    """
+    Wall time, counters and per-block times of one named pipeline stage.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.counters = defaultdict(int)
+        self.block_times = []
+        # peak RSS of the whole process so far when the stage last ended, not of the stage alone
+        self.process_peak_rss_at_end = None
+
+    def to_dict(self):
+        report = {"calls": self.calls, "wall_seconds": self.wall,
+                  "process_peak_rss_bytes_at_end": self.process_peak_rss_at_end,
+                  "counters": dict(self.counters)}
+        if self.wall > 0:
+            report["per_second"] = {name: value / self.wall for name, value in self.counters.items()}
+        if self.block_times:
+            times = sorted(seconds for _, seconds in self.block_times)
+            report["blocks"] = {
+                "count": len(times),
+                "mean_seconds": sum(times) / len(times),
+                "p50_seconds": times[len(times) // 2],
+                "p95_seconds": times[min(len(times) - 1, int(len(times) * 0.95))],
+                "max_seconds": times[-1],
+                "slowest": sorted(self.block_times, key=lambda item: -item[1])[:10],
+            }
+        return report
+
+
+class RunRecorder:
+    """
+    Collects the measurements of one script run. Thread-safe, since the RPC
+    client and the scraper record from worker threads.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages = {}
+        self.active = []
+        self.counters = defaultdict(int)
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times a stage. Counters recorded inside it are attributed to it (and to
+        any enclosing stage).
+        """
+        with self.lock:
+            stage = self.stages.setdefault(name, Stage(name))
+            self.active.append(stage)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            with self.lock:
+                stage.wall += time.perf_counter() - start
+                stage.calls += 1
+                stage.process_peak_rss_at_end = peak_rss()
+                self.active.remove(stage)
+
+    @contextmanager
+    def block(self, height):
+        """
+        Times the processing of one block within the innermost active stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                if self.active:
+                    self.active[-1].block_times.append((height, seconds))
+
+    @contextmanager
+    def timed(self, counter):
+        """
+        Adds the time spent in the block to the `counter` in seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.count(counter, time.perf_counter() - start)
+
+    def count(self, counter, amount=1):
+        with self.lock:
+            self.counters[counter] += amount
+            for stage in self.active:
+                stage.counters[counter] += amount
+
+    def observe(self, histogram, seconds):
+        """
+        Adds a duration to the named latency histogram.
+        """
+        with self.lock:
+            self.histograms.setdefault(histogram, Histogram()).add(seconds * 1000)
+
+    def report(self):
+        """
+        Returns the run report as a JSON-serializable dict.
+        """
+        with self.lock:
+            return {
+                "script": os.path.basename(sys.argv[0]),
+                "argv": sys.argv[1:],
+                "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                "wall_seconds": time.time() - self.started,
+                "peak_rss_bytes": peak_rss(),
+                "counters": dict(self.counters),
+                "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+                "histograms": {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=1)
+
+
+recorder = RunRecorder()
+
+_profiler = cProfile.Profile() if PROFILE_FOLDER else None
+_profile_depth = threading.local()
+_profiled_calls = 0
+
+
+def profiled(function):
+    """
+    Runs `function` under the shared cProfile profiler when `PIPELINE_PROFILE`
+    is set, and returns it unchanged (no overhead) otherwise. Nested profiled
+    calls are measured by the outermost one.
+    """
+    if _profiler is None:
+        return function
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        global _profiled_calls
+        depth = getattr(_profile_depth, "value", 0)
+        # cProfile only follows the thread that enabled it, so other threads are not profiled
+        if depth or threading.current_thread() is not threading.main_thread():
+            return function(*args, **kwargs)
+        _profiled_calls += 1
+        _profile_depth.value = 1
+        _profiler.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _profiler.disable()
+            _profile_depth.value = 0
+
+    return wrapper
+
+
+def _output_path(folder, extension):
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0] or "python"
+    stamp = datetime.fromtimestamp(recorder.started, timezone.utc).strftime("%Y%m%dT%H%M%S")
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{script}_{stamp}.{extension}")
+
+
+@atexit.register
+def _write_outputs():
+    if REPORT_FOLDER and recorder.stages:
+        path = _output_path(REPORT_FOLDER, "json")
+        recorder.save(path)
+        print(f"Run report saved to {path}")
+    # pool worker processes import this module too, but never profile anything
+    if _profiler is not None and _profiled_calls:
+        path = _output_path(PROFILE_FOLDER, "prof")
+        _profiler.dump_stats(path)
+        print(f"Profile saved to {path}")
@@ -0,0 +1,257 @@
+"""
+One deduplicated address -> (category, wallet) index of all scraped
+WalletExplorer CSVs (`labelled_addresses_scraper/scraper/{category}/*.csv`).
+The wallet CSVs are read in parallel, address column only, and the index is
+written as memory-mapped arrays sorted by address, so opening it costs
+nothing and labelling a column of addresses is one vectorized search.
+
+    python label_index.py ../labelled_addresses_scraper/scraper --workers 4
+    python label_index.py --lookup 1DXRoTT67mCbhdHHL1it4J1xsSZHHnFxYR
+"""
+import argparse
+import json
+import os
+import re
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import recorder
+
+# categories in tie-break order: an address listed under several keeps the first
+CATEGORIES = ['Exchanges', 'Pools', 'Services_others', 'Gambling']
+
+# e.g. '"#Wallet Telco214 (0b15c2fab2de6dc0), page 1 from 1, ...', the first line of every scraped CSV
+WALLET_HEADER = re.compile(r'#Wallet (.+?)(?: \([0-9a-f]+\))?,')
+WALLET_FILE_NAME = re.compile(r'walletexplorer-(.+)-addresses-\d+\.csv$')
+
+
+def wallet_name(header, file_name):
+    """
+    Wallet name from the first line of a scraped CSV, or from its file name.
+    """
+    match = WALLET_HEADER.search(header)
+    if match:
+        return match.group(1)
+    match = WALLET_FILE_NAME.search(file_name)
+    return match.group(1) if match else os.path.splitext(file_name)[0]
+
+
+def read_wallet_csv(path, address_column='address'):
+    """
+    Reads the address column of one scraped wallet CSV.
+
+    Args:
+    - path (str): Path of the CSV.
+    - address_column (str): Name of the address column.
+
+    Returns:
+    - tuple: Wallet name, addresses as a bytes array, and an error message or None.
+    """
+    with open(path) as f:
+        header = f.readline()
+        wallet = wallet_name(header, os.path.basename(path))
+        try:
+            addresses = pd.read_csv(f, usecols=[address_column], dtype=str)[address_column].dropna()
+            return wallet, addresses.to_numpy(dtype='S'), None
+        except Exception as e:
+            return wallet, np.array([], dtype='S1'), str(e)
+
+
+def category_order(categories):
+    """
+    `CATEGORIES` that are present first, in their tie-break order, then any other category sorted.
+    """
+    return [c for c in CATEGORIES if c in categories] + sorted(set(categories) - set(CATEGORIES))
+
+
+def list_scraped_csvs(scraper_folder):
+    """
+    Returns:
+    - dict: Category -> sorted CSV paths of its wallets, in `category_order`.
+    """
+    categories = [name for name in os.listdir(scraper_folder) if os.path.isdir(os.path.join(scraper_folder, name))]
+    return {category: sorted(os.path.join(scraper_folder, category, file_name)
+                             for file_name in os.listdir(os.path.join(scraper_folder, category))
+                             if file_name.endswith('.csv'))
+            for category in category_order(categories)}
+
+
+def read_scraped_folder(scraper_folder, workers=0, address_column='address'):
+    """
+    Reads every scraped wallet CSV, in a pool of `workers` processes if given.
+
+    Args:
+    - scraper_folder (str): Folder with one subfolder of wallet CSVs per category.
+    - workers (int): Number of reading processes (0 = serial).
+    - address_column (str): Name of the address column.
+
+    Returns:
+    - dict: Category -> list of (wallet name, addresses as a bytes array).
+    """
+    files = list_scraped_csvs(scraper_folder)
+    paths = [path for category_paths in files.values() for path in category_paths]
+    recorder.count('bytes_read', sum(os.path.getsize(path) for path in paths))
+    columns = [address_column] * len(paths)
+    if workers > 0:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = iter(list(pool.map(read_wallet_csv, paths, columns, chunksize=max(1, len(paths) // (workers * 8)))))
+    else:
+        results = map(read_wallet_csv, paths, columns)
+
+    scraped = {}
+    for category, category_paths in files.items():
+        scraped[category] = []
+        for path in category_paths:
+            wallet, addresses, error = next(results)
+            if error:
+                print(f"Error reading {path}: {error}")
+            scraped[category].append((wallet, addresses))
+    return scraped
+
+
+def build_label_index(scraped):
+    """
+    Merges the scraped wallets into one row per address, sorted by address.
+    An address listed under several categories keeps the first in the order of
+    `scraped`, and under several wallets the first wallet name in sorted order.
+
+    Args:
+    - scraped (dict): Output of `read_scraped_folder`.
+
+    Returns:
+    - dict: `addresses` (bytes array), `category` and `wallet` codes per address,
+      and the `categories` and `wallets` names the codes refer to.
+    """
+    categories = list(scraped)
+    wallets = sorted({wallet for category_wallets in scraped.values() for wallet, _ in category_wallets})
+    wallet_codes = {wallet: code for code, wallet in enumerate(wallets)}
+    parts = [(addresses, code, wallet_codes[wallet])
+             for code, category in enumerate(categories) for wallet, addresses in scraped[category]]
+    sizes = [len(addresses) for addresses, _, _ in parts]
+    if not sum(sizes):
+        return {"addresses": np.array([], dtype='S1'), "category": np.array([], dtype=np.int16),
+                "wallet": np.array([], dtype=np.int32), "categories": categories, "wallets": wallets}
+    addresses = np.concatenate([addresses for addresses, _, _ in parts])
+    category = np.repeat(np.array([code for _, code, _ in parts], dtype=np.int16), sizes)
+    wallet = np.repeat(np.array([code for _, _, code in parts], dtype=np.int32), sizes)
+
+    # sorted by address, then by tie-break order, so the first row of each address wins
+    order = np.lexsort((wallet, category, addresses))
+    addresses, category, wallet = addresses[order], category[order], wallet[order]
+    first = np.ones(len(addresses), dtype=bool)
+    first[1:] = addresses[1:] != addresses[:-1]
+    return {"addresses": addresses[first], "category": category[first], "wallet": wallet[first],
+            "categories": categories, "wallets": wallets}
+
+
+def save_label_index(index, folder="label_index"):
+    """
+    Writes the output of `build_label_index` as a memory-mappable folder.
+    """
+    os.makedirs(folder, exist_ok=True)
+    for name in ("addresses", "category", "wallet"):
+        np.save(os.path.join(folder, f"{name}.npy"), index[name])
+    with open(os.path.join(folder, "names.json"), "w") as f:
+        json.dump({"categories": index["categories"], "wallets": index["wallets"]}, f)
+
+
+class LabelIndex(Mapping):
+    """
+    Read-only address -> (category, wallet) mapping over the memory-mapped
+    arrays written by `save_label_index`.
+    """
+
+    def __init__(self, folder="label_index"):
+        self.addresses = np.load(os.path.join(folder, "addresses.npy"), mmap_mode="r")
+        self.category = np.load(os.path.join(folder, "category.npy"), mmap_mode="r")
+        self.wallet = np.load(os.path.join(folder, "wallet.npy"), mmap_mode="r")
+        with open(os.path.join(folder, "names.json")) as f:
+            names = json.load(f)
+        self.categories, self.wallets = names["categories"], names["wallets"]
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def __iter__(self):
+        for address in self.addresses:
+            yield address.decode()
+
+    def __getitem__(self, address):
+        i = int(self.positions([address])[0])
+        if i < 0:
+            raise KeyError(address)
+        return self.categories[self.category[i]], self.wallets[self.wallet[i]]
+
+    def positions(self, addresses):
+        """
+        Rows of many addresses at once, with one vectorized binary search.
+
+        Args:
+        - addresses (list, np.ndarray or pd.Series of str): Addresses to look up.
+
+        Returns:
+        - np.ndarray: Row of each address, -1 for addresses that are not labelled.
+        """
+        queries = pd.Series(addresses, dtype=object).fillna("").to_numpy(dtype='S')
+        if not len(self.addresses):
+            return np.full(len(queries), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.addresses, queries), len(self.addresses) - 1)
+        return np.where(self.addresses[positions] == queries, positions, -1)
+
+    def labels(self, addresses, wallets=False):
+        """
+        Categories (and wallet names) of a column of addresses.
+
+        Args:
+        - addresses (pd.Series of str): Addresses to label.
+        - wallets (bool): Also return the wallet names.
+
+        Returns:
+        - pd.Series or tuple of pd.Series: Categorical labels aligned with
+          `addresses`, NaN where an address is not labelled.
+        """
+        positions = self.positions(addresses)
+        found = positions >= 0
+        codes = np.where(found, self.category[np.where(found, positions, 0)], -1)
+        labels = pd.Series(pd.Categorical.from_codes(codes, categories=self.categories), index=addresses.index)
+        if not wallets:
+            return labels
+        codes = np.where(found, self.wallet[np.where(found, positions, 0)], -1)
+        return labels, pd.Series(pd.Categorical.from_codes(codes, categories=self.wallets), index=addresses.index)
+
+    def label_table(self):
+        """
+        The index as the address -> label Series of `transaction_labelling.build_address_label_table`.
+        """
+        return pd.Series(pd.Categorical.from_codes(np.asarray(self.category), categories=self.categories),
+                         index=pd.Index(np.char.decode(self.addresses), name='Address'), name='Label')
+
+
+def load_label_index(folder="label_index"):
+    """
+    Opens an index folder written by `save_label_index`.
+    """
+    return LabelIndex(folder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scraper_folder", nargs="?", default="scraper")
+    parser.add_argument("--output", default="label_index")
+    parser.add_argument("--workers", type=int, default=0, help="processes reading the CSVs (0 = serial)")
+    parser.add_argument("--lookup", nargs="+", metavar="ADDRESS", help="print the labels of these addresses instead")
+    args = parser.parse_args()
+
+    if args.lookup:
+        index = load_label_index(args.output)
+        for address in args.lookup:
+            print(address, *index.get(address, ("unlabelled",)))
+    else:
+        with recorder.stage("label_index"):
+            index = build_label_index(read_scraped_folder(args.scraper_folder, args.workers))
+            save_label_index(index, args.output)
+            recorder.count("addresses", len(index["addresses"]))
+        print(f"Saved {len(index['addresses'])} labelled addresses from {len(index['wallets'])} wallets to {args.output}/")
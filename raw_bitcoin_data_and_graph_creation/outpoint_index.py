@@ -0,0 +1,448 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from block_cache import iter_block_files, load_block_columns
+from input_resolution import OutpointResolver, btc_to_satoshi
+from revmap_index import encode_strings
+
+# per-output arrays of a segment, all sorted by `keys`
+SEGMENT_ARRAYS = ("keys", "check", "value", "height", "address", "spent")
+
+# odd 64-bit constant mixing the output index into the key
+_N_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def outpoint_keys(txids, ns):
+    """
+    Sort key and check word of outpoints, taken from the txid bytes (which are
+    hash output, hence uniformly distributed) without hashing them again.
+    Two outpoints only compare equal if 128 bits match.
+
+    Args:
+    - txids (list of str): Hex txids.
+    - ns (sequence of int): Output indexes.
+
+    Returns:
+    - tuple: (keys, check) uint64 arrays.
+    """
+    words = np.frombuffer(bytes.fromhex("".join(txids)), dtype=np.uint64).reshape(-1, 4)
+    keys = words[:, 0] + np.asarray(ns, dtype=np.uint64) * _N_MIX
+    return keys, words[:, 1].copy()
+
+
+class OutpointSegment:
+    """
+    The outputs created by a contiguous range of blocks, as memory-mapped
+    arrays sorted by outpoint key plus an interned table of their addresses.
+    Only `spent` (height of the spending block, -1 while unspent) is ever
+    written after the segment is created.
+    """
+
+    def __init__(self, folder, name):
+        self.name = name
+        path = os.path.join(folder, name)
+        for array in SEGMENT_ARRAYS:
+            setattr(self, array, np.load(f"{path}.{array}.npy", mmap_mode="r+" if array == "spent" else "r"))
+        self.address_offsets = np.load(f"{path}.address_offsets.npy", mmap_mode="r")
+        self.address_strings = np.load(f"{path}.address_strings.npy").tobytes()
+        self._address_ids = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def addresses_at(self, ids=None):
+        """
+        Decodes the addresses with the given ids (all of them by default).
+        """
+        ids = np.arange(len(self.address_offsets) - 1) if ids is None else np.asarray(ids, dtype=np.int64)
+        starts, ends = self.address_offsets[ids].tolist(), self.address_offsets[ids + 1].tolist()
+        return [self.address_strings[start:end].decode() for start, end in zip(starts, ends)]
+
+    def address_ids(self):
+        """
+        address -> id of the addresses in this segment, decoded on first use.
+        """
+        if self._address_ids is None:
+            self._address_ids = {address: i for i, address in enumerate(self.addresses_at())}
+        return self._address_ids
+
+    def find(self, keys, check):
+        """
+        Returns a mask of the outpoints stored in this segment and their positions.
+        """
+        if not len(self.keys):
+            return np.zeros(len(keys), dtype=bool), np.zeros(len(keys), dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        same_key = self.keys[positions] == keys
+        found = same_key & (self.check[positions] == check)
+        # equal keys are adjacent, so a key collision only means checking the next entries
+        for i in np.flatnonzero(same_key & ~found).tolist():
+            j = positions[i] + 1
+            while j < len(self.keys) and self.keys[j] == keys[i]:
+                if self.check[j] == check[i]:
+                    positions[i], found[i] = j, True
+                    break
+                j += 1
+        return found, positions
+
+
+def write_segment(folder, name, arrays, addresses):
+    path = os.path.join(folder, name)
+    for array in SEGMENT_ARRAYS:
+        np.save(f"{path}.{array}.npy", arrays[array])
+    offsets, strings = encode_strings(addresses)
+    np.save(f"{path}.address_offsets.npy", offsets)
+    np.save(f"{path}.address_strings.npy", strings)
+
+
+def remove_segment(folder, name):
+    for array in SEGMENT_ARRAYS + ("address_offsets", "address_strings"):
+        os.remove(os.path.join(folder, f"{name}.{array}.npy"))
+
+
+class OutpointIndex:
+    """
+    On-disk (txid, n) -> (value in satoshis, address, height, spent height)
+    index of every spendable output in the block cache.
+
+    Blocks are appended in height order and buffered; `flush` writes the
+    outputs of the buffered blocks as a new sorted segment and marks the
+    outputs they spend in the older segments. Lookups search every segment
+    with one vectorized binary search each, and `compact` merges all segments
+    into one. `manifest.json` records the segments and the hash of every
+    indexed block, for reorg handling.
+
+    Args:
+    - folder (str): Index folder, created if missing.
+    """
+
+    def __init__(self, folder="outpoint_index"):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        manifest_path = os.path.join(folder, "manifest.json")
+        manifest = {"segments": [], "blocks": {}}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        self.segments = [OutpointSegment(folder, segment["name"]) for segment in manifest["segments"]]
+        self.segment_heights = {segment["name"]: (segment["first_height"], segment["last_height"])
+                                for segment in manifest["segments"]}
+        self.block_hashes = {int(height): block_hash for height, block_hash in manifest["blocks"].items()}
+        self.pending = []
+
+    @property
+    def tip(self):
+        return max(self.block_hashes) if self.block_hashes else None
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    def save_manifest(self):
+        manifest = {
+            "segments": [{"name": segment.name, "first_height": self.segment_heights[segment.name][0],
+                          "last_height": self.segment_heights[segment.name][1], "outputs": len(segment)}
+                         for segment in self.segments],
+            "blocks": self.block_hashes,
+        }
+        path = os.path.join(self.folder, "manifest.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+
+    def add_block(self, columns):
+        """
+        Buffers the outputs and spends of the next block.
+
+        Args:
+        - columns (dict): A block in the columnar layout of `block_cache.block_to_columns`,
+          above every block indexed so far.
+        """
+        height = columns["height"]
+        if self.tip is not None and height <= self.tip:
+            raise ValueError(f"block {height} is not above the index tip {self.tip}")
+
+        spendable = [script_type != "nulldata" for script_type in columns["vout_type"]]
+        txids = [txid for txid, count in zip(columns["txid"], columns["vout_count"]) for _ in range(count)]
+        spends = [(txid, n) for txid, n in zip(columns["vin_txid"], columns["vin_vout"]) if txid is not None]
+        self.pending.append({
+            "height": height,
+            "txid": [txid for txid, keep in zip(txids, spendable) if keep],
+            "n": [n for n, keep in zip(columns["vout_n"], spendable) if keep],
+            "value": btc_to_satoshi(columns["vout_value"]).reshape(-1)[np.array(spendable, dtype=bool)],
+            "address": [address if address is not None else "unknown"
+                        for address, keep in zip(columns["vout_address"], spendable) if keep],
+            "spend_txid": [txid for txid, _ in spends],
+            "spend_n": [n for _, n in spends],
+        })
+        self.block_hashes[height] = columns.get("hash")
+
+    def flush(self):
+        """
+        Writes the buffered blocks as a new segment and marks their spends.
+
+        Returns:
+        - int: Number of spends whose output is not in the index (created before the first indexed block).
+        """
+        if not self.pending:
+            return 0
+        pending, self.pending = self.pending, []
+        txids = [txid for block in pending for txid in block["txid"]]
+        ns = np.array([n for block in pending for n in block["n"]], dtype=np.int64)
+        keys, check = outpoint_keys(txids, ns)
+        order = np.lexsort((check, keys))
+
+        addresses = [address for block in pending for address in block["address"]]
+        address_ids = {}
+        address_column = np.fromiter((address_ids.setdefault(address, len(address_ids)) for address in addresses),
+                                     dtype=np.int64, count=len(addresses))
+        arrays = {
+            "keys": keys[order],
+            "check": check[order],
+            "value": np.concatenate([block["value"] for block in pending])[order],
+            "height": np.repeat([block["height"] for block in pending], [len(block["txid"]) for block in pending])[order],
+            "address": address_column[order],
+            "spent": np.full(len(txids), -1, dtype=np.int64),
+        }
+        spend_txids = [txid for block in pending for txid in block["spend_txid"]]
+        spend_heights = np.repeat([block["height"] for block in pending], [len(block["spend_txid"]) for block in pending])
+        spend_keys, spend_check = outpoint_keys(spend_txids, [n for block in pending for n in block["spend_n"]])
+
+        # outputs spent within the buffered blocks are marked before the segment is written
+        unresolved = np.ones(len(spend_txids), dtype=bool)
+        if len(arrays["keys"]):
+            positions = np.minimum(np.searchsorted(arrays["keys"], spend_keys), len(arrays["keys"]) - 1)
+            found = (arrays["keys"][positions] == spend_keys) & (arrays["check"][positions] == spend_check)
+            arrays["spent"][positions[found]] = spend_heights[found]
+            unresolved &= ~found
+
+        for segment in reversed(self.segments):
+            if not unresolved.any():
+                break
+            remaining = np.flatnonzero(unresolved)
+            found, positions = segment.find(spend_keys[remaining], spend_check[remaining])
+            segment.spent[positions[found]] = spend_heights[remaining[found]]
+            segment.spent.flush()
+            unresolved[remaining[found]] = False
+
+        if len(txids):
+            first_height, last_height = pending[0]["height"], pending[-1]["height"]
+            name = f"segment-{first_height:08d}-{last_height:08d}"
+            write_segment(self.folder, name, arrays, list(address_ids))
+            self.segments.append(OutpointSegment(self.folder, name))
+            self.segment_heights[name] = (first_height, last_height)
+        self.save_manifest()
+        return int(unresolved.sum())
+
+    def lookup(self, txids, ns):
+        """
+        Looks up many outpoints at once (buffered blocks are flushed first).
+
+        Args:
+        - txids (list of str): Hex txids.
+        - ns (sequence of int): Output indexes.
+
+        Returns:
+        - dict: `found` mask and per-outpoint `value` (satoshis), `address` (list, None
+          if not found), `height` and `spent` (spending height, -1 if unspent) arrays.
+        """
+        self.flush()
+        keys, check = outpoint_keys(txids, ns)
+        result = {
+            "found": np.zeros(len(keys), dtype=bool),
+            "value": np.zeros(len(keys), dtype=np.int64),
+            "address": [None] * len(keys),
+            "height": np.full(len(keys), -1, dtype=np.int64),
+            "spent": np.full(len(keys), -1, dtype=np.int64),
+        }
+        for segment in self.segments:
+            remaining = np.flatnonzero(~result["found"])
+            if not len(remaining):
+                break
+            found, positions = segment.find(keys[remaining], check[remaining])
+            hits, positions = remaining[found], positions[found]
+            result["found"][hits] = True
+            for field in ("value", "height", "spent"):
+                result[field][hits] = getattr(segment, field)[positions]
+            # each distinct address is decoded once
+            address_ids, inverse = np.unique(segment.address[positions], return_inverse=True)
+            decoded = segment.addresses_at(address_ids)
+            for i, k in zip(hits.tolist(), inverse.tolist()):
+                result["address"][i] = decoded[k]
+        return result
+
+    def get(self, txid, n):
+        """
+        Returns the (value in satoshis, address) of one outpoint, or None if it is not indexed.
+        """
+        result = self.lookup([txid], [n])
+        return (int(result["value"][0]), result["address"][0]) if result["found"][0] else None
+
+    def balances(self, addresses):
+        """
+        Sums the unspent outputs of the given addresses.
+
+        Args:
+        - addresses (list of str): Addresses to query.
+
+        Returns:
+        - np.ndarray: Unspent satoshis per address.
+        """
+        self.flush()
+        balances = np.zeros(len(addresses), dtype=np.int64)
+        for segment in self.segments:
+            address_ids = segment.address_ids()
+            ids = np.array([address_ids.get(address, -1) for address in addresses], dtype=np.int64)
+            if not (ids >= 0).any():
+                continue
+            # position of each queried address id, -1 for the segment's other addresses
+            slot = np.full(len(address_ids), -1, dtype=np.int64)
+            slot[ids[ids >= 0]] = np.flatnonzero(ids >= 0)
+            output_slots = slot[segment.address]
+            unspent = (segment.spent == -1) & (output_slots >= 0)
+            balances += np.bincount(output_slots[unspent], weights=segment.value[unspent],
+                                    minlength=len(addresses)).astype(np.int64)
+        return balances
+
+    def rollback(self, height):
+        """
+        Removes the blocks from `height` up (e.g. after a reorg): their outputs
+        are dropped and the outputs they spent become unspent again.
+        """
+        self.flush()
+        kept = []
+        for segment in self.segments:
+            first_height, last_height = self.segment_heights.pop(segment.name)
+            segment.spent[segment.spent >= height] = -1
+            segment.spent.flush()
+            if last_height < height:
+                kept.append(segment)
+                self.segment_heights[segment.name] = (first_height, last_height)
+                continue
+            keep = np.asarray(segment.height) < height
+            if keep.any():
+                arrays = {array: np.asarray(getattr(segment, array))[keep] for array in SEGMENT_ARRAYS}
+                addresses = segment.addresses_at()
+                name = f"segment-{first_height:08d}-{height - 1:08d}"
+                write_segment(self.folder, name, arrays, addresses)
+                kept.append(OutpointSegment(self.folder, name))
+                self.segment_heights[name] = (first_height, height - 1)
+        removed = {segment.name for segment in self.segments} - set(self.segment_heights)
+        self.segments = kept
+        for name in removed:
+            remove_segment(self.folder, name)
+        self.block_hashes = {h: block_hash for h, block_hash in self.block_hashes.items() if h < height}
+        self.save_manifest()
+
+    def compact(self):
+        """
+        Merges all segments into a single one, so lookups need one search.
+        """
+        self.flush()
+        if len(self.segments) < 2:
+            return
+        arrays = {array: [] for array in SEGMENT_ARRAYS}
+        addresses, address_ids = [], {}
+        for segment in self.segments:
+            for array in SEGMENT_ARRAYS:
+                if array != "address":
+                    arrays[array].append(np.asarray(getattr(segment, array)))
+            remap = np.array([address_ids.setdefault(address, len(address_ids)) for address in segment.addresses_at()],
+                             dtype=np.int64)
+            arrays["address"].append(remap[segment.address] if len(remap) else np.zeros(0, dtype=np.int64))
+        arrays = {array: np.concatenate(parts) for array, parts in arrays.items()}
+        order = np.lexsort((arrays["check"], arrays["keys"]))
+        arrays = {array: values[order] for array, values in arrays.items()}
+
+        first_height = min(heights[0] for heights in self.segment_heights.values())
+        last_height = max(heights[1] for heights in self.segment_heights.values())
+        name = f"segment-{first_height:08d}-{last_height:08d}-c{len(self.segments)}"
+        write_segment(self.folder, name, arrays, list(address_ids))
+        old = [segment.name for segment in self.segments]
+        self.segments = [OutpointSegment(self.folder, name)]
+        self.segment_heights = {name: (first_height, last_height)}
+        self.save_manifest()
+        for old_name in old:
+            remove_segment(self.folder, old_name)
+
+    def update(self, folder_path, reorg_depth=6, batch_blocks=500):
+        """
+        Brings the index up to date with the block cache, the same way
+        `graph_builder.update_graph` does for the graph: recent blocks whose
+        cached hash changed are rolled back, then every cached block above the
+        tip is added.
+
+        Args:
+        - folder_path (str): The block cache folder.
+        - reorg_depth (int): How many indexed blocks below the tip are checked for reorgs.
+        - batch_blocks (int): Blocks per written segment.
+
+        Returns:
+        - tuple: (list of added heights, list of dropped heights).
+        """
+        files = dict(iter_block_files(folder_path))
+        dropped = []
+        if self.tip is not None:
+            for height in sorted(h for h in self.block_hashes if h >= self.tip - reorg_depth and h in files):
+                if self.block_hashes[height] is not None and load_block_columns(files[height]).get("hash") != self.block_hashes[height]:
+                    dropped = [h for h in sorted(self.block_hashes) if h >= height]
+                    self.rollback(height)
+                    break
+
+        tip = self.tip
+        added = sorted(height for height in files if tip is None or height > tip)
+        for i, height in enumerate(added):
+            self.add_block(load_block_columns(files[height]))
+            if (i + 1) % batch_blocks == 0:
+                self.flush()
+        self.flush()
+        return added, dropped
+
+    def resolver(self):
+        """
+        Returns an `OutpointResolver` that falls back to this index for outputs
+        it has not seen, e.g. those created before the first block being processed.
+        """
+        return IndexedOutpointResolver(self)
+
+
+class IndexedOutpointResolver(OutpointResolver):
+    """
+    `OutpointResolver` backed by an `OutpointIndex`. The index is only read:
+    outputs are resolved whether or not the index already marks them spent.
+    """
+
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+
+    def spend(self, txid, n):
+        spent = super().spend(txid, n)
+        return spent if spent is not None else self.index.get(txid, n)
+
+    def prefetch(self, txids, ns):
+        missing = [i for i, outpoint in enumerate(zip(txids, ns)) if outpoint not in self.outputs]
+        if not missing:
+            return
+        result = self.index.lookup([txids[i] for i in missing], [ns[i] for i in missing])
+        for j in np.flatnonzero(result["found"]).tolist():
+            self.add(txids[missing[j]], ns[missing[j]], int(result["value"][j]), result["address"][j])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the outpoint index of the block cache.")
+    parser.add_argument("blocks", nargs="?", default="blocks", help="block cache folder")
+    parser.add_argument("index", nargs="?", default="outpoint_index", help="index folder")
+    parser.add_argument("--reorg-depth", type=int, default=6)
+    parser.add_argument("--compact", action="store_true", help="merge all segments into one afterwards")
+    args = parser.parse_args()
+
+    index = OutpointIndex(args.index)
+    added, dropped = index.update(args.blocks, args.reorg_depth)
+    if dropped:
+        print(f"Reorg detected: dropped blocks {dropped[0]}-{dropped[-1]}.")
+    if args.compact:
+        index.compact()
+    print(f"Added {len(added)} blocks; {len(index)} outputs in {len(index.segments)} segments, tip {index.tip}.")
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+from collections.abc import Mapping
+
+import dill as pickle
+import numpy as np
+
+# the reverse map dicts stored as string -> vertex id tables
+INDEXED_DICTS = ("transaction_dict", "account_dict")
+
+
+def key_hash(key):
+    """
+    64-bit hash of a txid or address, used as the sort key of the index.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+
+def hash_keys(keys):
+    return np.fromiter((key_hash(key) for key in keys), dtype=np.uint64, count=len(keys))
+
+
+class StringIndex(Mapping):
+    """
+    Read-only string -> vertex id mapping backed by memory-mapped arrays:
+    sorted 64-bit key hashes, the vertex ids in the same order, and an interned
+    string table (offsets + utf-8 bytes) used to confirm matches.
+
+    Opening it only maps the files, so it is ready in milliseconds and pages
+    are read from disk as lookups touch them.
+    """
+
+    def __init__(self, folder, name):
+        self.hashes = np.load(os.path.join(folder, f"{name}.hashes.npy"), mmap_mode="r")
+        self.values = np.load(os.path.join(folder, f"{name}.values.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(folder, f"{name}.offsets.npy"), mmap_mode="r")
+        self.strings = np.load(os.path.join(folder, f"{name}.strings.npy"), mmap_mode="r")
+
+    def key_at(self, i):
+        return self.strings[self.offsets[i]:self.offsets[i + 1]].tobytes().decode()
+
+    def __getitem__(self, key):
+        h = np.uint64(key_hash(key))
+        i = int(np.searchsorted(self.hashes, h, side="left"))
+        # equal hashes are adjacent, so a collision only means checking the next entries
+        while i < len(self.hashes) and self.hashes[i] == h:
+            if self.key_at(i) == key:
+                return int(self.values[i])
+            i += 1
+        raise KeyError(key)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __iter__(self):
+        for i in range(len(self.hashes)):
+            yield self.key_at(i)
+
+    def lookup_many(self, keys, verify=False):
+        """
+        Looks up many keys at once with a single vectorized search.
+
+        Args:
+        - keys (list of str): txids or addresses.
+        - verify (bool): Also compare the stored strings. Without it a key is matched
+          on its 64-bit hash alone, so a missing key is reported as present with
+          probability of about len(self) / 2**64.
+
+        Returns:
+        - np.ndarray: Vertex ids, -1 for keys that are not in the index.
+        """
+        if not len(self.values):
+            return np.full(len(keys), -1, dtype=np.int64)
+        hashes = hash_keys(keys)
+        positions = np.minimum(np.searchsorted(self.hashes, hashes, side="left"), len(self.hashes) - 1)
+        found = self.hashes[positions] == hashes
+        result = np.where(found, self.values[positions], -1)
+        if verify:
+            for i in np.flatnonzero(found):
+                if self.key_at(positions[i]) != keys[i]:
+                    result[i] = self.get(keys[i], -1)
+        return result
+
+
+class RevmapIndex(Mapping):
+    """
+    Memory-mapped replacement for the `revmap.pkl` reverse map, exposing the
+    same `index["transaction_dict"][txid]` and `index["account_dict"][address]`
+    lookups.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.dicts = {name: StringIndex(folder, name) for name in INDEXED_DICTS}
+        with open(os.path.join(folder, "block_dict.json")) as f:
+            self.dicts["block_dict"] = {int(height): block_hash for height, block_hash in json.load(f).items()}
+
+    def __getitem__(self, name):
+        return self.dicts[name]
+
+    def __len__(self):
+        return len(self.dicts)
+
+    def __iter__(self):
+        return iter(self.dicts)
+
+    def to_dict(self):
+        """
+        Materializes the index back into the plain reverse map dicts.
+        """
+        reverse_map = {name: dict(zip(index, index.values.tolist())) for name, index in self.dicts.items()
+                       if name in INDEXED_DICTS}
+        reverse_map["block_dict"] = dict(self.dicts["block_dict"])
+        return reverse_map
+
+
+def encode_strings(strings):
+    """
+    Packs strings into an interned table: offsets (len + 1) and the utf-8 bytes.
+    String i is `strings[offsets[i]:offsets[i + 1]]`.
+    """
+    encoded = [string.encode() for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def save_string_index(mapping, folder, name):
+    keys = list(mapping.keys())
+    hashes = hash_keys(keys)
+    order = np.argsort(hashes, kind="stable")
+    values = np.fromiter(mapping.values(), dtype=np.int64, count=len(keys))[order]
+    offsets, strings = encode_strings([keys[i] for i in order.tolist()])
+
+    np.save(os.path.join(folder, f"{name}.hashes.npy"), hashes[order])
+    np.save(os.path.join(folder, f"{name}.values.npy"), values)
+    np.save(os.path.join(folder, f"{name}.offsets.npy"), offsets)
+    np.save(os.path.join(folder, f"{name}.strings.npy"), strings)
+
+
+def save_index(reverse_map, folder="revmap_index"):
+    """
+    Writes the reverse map as a memory-mappable index folder.
+
+    Args:
+    - reverse_map (dict): The `transaction_dict`/`account_dict`/`block_dict` reverse map.
+    - folder (str): Output folder.
+    """
+    os.makedirs(folder, exist_ok=True)
+    for name in INDEXED_DICTS:
+        save_string_index(reverse_map.get(name, {}), folder, name)
+    with open(os.path.join(folder, "block_dict.json"), "w") as f:
+        json.dump(reverse_map.get("block_dict", {}), f)
+
+
+def load_index(folder="revmap_index"):
+    """
+    Opens an index folder written by `save_index`.
+    """
+    return RevmapIndex(folder)
+
+
+def load_reverse_map(folder=".", materialize=False):
+    """
+    Loads the reverse map saved in `folder` as `revmap.pkl` and/or `revmap_index/`.
+    When both exist the more recently written one is used, so a copy left behind
+    by runs that only wrote the other is never read.
+
+    Args:
+    - folder (str): Folder holding `revmap.pkl` and `revmap_index/`.
+    - materialize (bool): Return plain dicts, which can be updated, instead of
+      the memory-mapped index.
+
+    Returns:
+    - dict or RevmapIndex: The reverse map, or None if neither copy exists.
+    """
+    pickle_file = os.path.join(folder, "revmap.pkl")
+    # block_dict.json is the last file save_index writes
+    index_file = os.path.join(folder, "revmap_index", "block_dict.json")
+    candidates = [path for path in (pickle_file, index_file) if os.path.exists(path)]
+    if not candidates:
+        return None
+    if max(candidates, key=os.path.getmtime) == pickle_file:
+        with open(pickle_file, "rb") as f:
+            return pickle.load(f)
+    index = load_index(os.path.dirname(index_file))
+    return index.to_dict() if materialize else index
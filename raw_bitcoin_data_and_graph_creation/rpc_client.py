@@ -0,0 +1,182 @@
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import recorder
+
+# HTTP status codes that are worth retrying (rate limiting and transient node errors)
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RpcError(Exception):
+    """Raised when the node answers a JSON-RPC call with an error object."""
+
+
+class BatchRpcClient:
+    """
+    JSON-RPC client for a Bitcoin node that reuses one keep-alive session,
+    packs many calls into JSON-RPC batch arrays and keeps a bounded number
+    of batches in flight.
+
+    Args:
+    - rpc_url (str): The node (or QuickNode) endpoint.
+    - batch_size (int): Number of blocks requested per batch POST.
+    - max_workers (int): Number of batches allowed in flight at once.
+    - max_retries (int): Retries per POST on 429/5xx and connection errors.
+    - backoff (float): Base delay in seconds, doubled on every retry.
+    - timeout (float): Per-request timeout in seconds.
+    """
+
+    def __init__(self, rpc_url, batch_size=10, max_workers=4, max_retries=5, backoff=0.5, timeout=30):
+        self.rpc_url = rpc_url
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.pool_size = 0
+        self.resize(max_workers)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+    def resize(self, max_workers):
+        """
+        Sets the number of batches in flight, growing the connection pool to
+        match so no connection is discarded ("Connection pool is full").
+        """
+        self.max_workers = max_workers
+        if max_workers > self.pool_size:
+            adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+            self.pool_size = max_workers
+
+    def close(self):
+        self.session.close()
+
+    def _retry_delay(self, attempt, response=None):
+        if response is not None and response.headers.get('Retry-After'):
+            try:
+                return float(response.headers['Retry-After'])
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt)
+
+    def post(self, payload):
+        """
+        POSTs a single call or a batch array, retrying with exponential backoff.
+
+        Args:
+        - payload (dict or list): JSON-RPC request object or batch array.
+
+        Returns:
+        - dict or list: The decoded JSON response.
+        """
+        data = json.dumps(payload)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                recorder.count("rpc_retries")
+            start = time.perf_counter()
+            try:
+                response = self.session.post(self.rpc_url, data=data, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                recorder.count("rpc_errors")
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                logging.warning(f"RPC connection error ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+
+            recorder.observe("rpc_latency", time.perf_counter() - start)
+            recorder.count("rpc_requests")
+            recorder.count("rpc_bytes_received", len(response.content))
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                delay = self._retry_delay(attempt, response)
+                logging.warning(f"RPC returned HTTP {response.status_code}, retrying in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+
+            response.raise_for_status()
+            return response.json()
+
+    def call(self, method, params=None):
+        """
+        Performs a single JSON-RPC call and returns its result.
+        """
+        reply = self.post({"jsonrpc": "2.0", "id": 0, "method": method, "params": params or []})
+        if reply.get('error'):
+            raise RpcError(f"{method} failed: {reply['error']}")
+        return reply['result']
+
+    def batch(self, method, params_list):
+        """
+        Performs one JSON-RPC batch POST with a call of `method` per params entry.
+
+        Args:
+        - method (str): The RPC method name.
+        - params_list (list of lists): Parameters for each call.
+
+        Returns:
+        - list: The results, in the same order as `params_list`.
+        """
+        if not params_list:
+            return []
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+            for i, params in enumerate(params_list)
+        ]
+        replies = self.post(payload)
+        if not isinstance(replies, list):
+            # e.g. a malformed or oversized batch, rejected as a whole with one error object
+            error = replies.get('error') if isinstance(replies, dict) else replies
+            raise RpcError(f"{method} batch of {len(params_list)} calls failed: {error}")
+        # batch replies may come back in any order, so match them by id
+        results = [None] * len(params_list)
+        for reply in replies:
+            if reply.get('error'):
+                raise RpcError(f"{method} failed for {params_list[reply['id']]}: {reply['error']}")
+            results[reply['id']] = reply['result']
+        return results
+
+    def fetch_block_batch(self, heights, verbosity=2):
+        """
+        Fetches a group of blocks with two batch POSTs: all getblockhash calls, then all getblock calls.
+        """
+        hashes = self.batch("getblockhash", [[height] for height in heights])
+        return self.batch("getblock", [[block_hash, verbosity] for block_hash in hashes])
+
+    def iter_blocks(self, heights, verbosity=2):
+        """
+        Fetches blocks for the given heights, keeping at most `max_workers` batches in flight.
+
+        Args:
+        - heights (iterable of int): Block heights to fetch.
+        - verbosity (int): `getblock` verbosity level.
+
+        Yields:
+        - tuple: (height, block) pairs, in the order of `heights`.
+        """
+        heights = list(heights)
+        chunks = [heights[i:i + self.batch_size] for i in range(0, len(heights), self.batch_size)]
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for chunk in chunks:
+                # bounded window so finished blocks don't pile up in memory faster than they are consumed
+                if len(pending) >= self.max_workers * 2:
+                    yield from self._drain(pending.popleft())
+                pending.append((chunk, executor.submit(self.fetch_block_batch, chunk, verbosity)))
+            while pending:
+                yield from self._drain(pending.popleft())
+
+    @staticmethod
+    def _drain(item):
+        chunk, future = item
+        yield from zip(chunk, future.result())
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the benchmarks' helpers provide the synthetic data, and `common` puts the pipeline modules on sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import common  # noqa: E402,F401
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_clustering import StreamingClusterer, batches
+
+
+def write_features(path, n_rows, n_features=12, seed=0):
+    rng = np.random.default_rng(seed)
+    features = pd.DataFrame(rng.random((n_rows, n_features)), columns=[f"f{i}" for i in range(n_features)])
+    features.insert(0, "tx_hash", [f"{i:064x}" for i in range(n_rows)])
+    features.to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("sizes", [[3, 3, 3], [12, 4], [4, 12, 2, 1], [10, 10, 10], [2]])
+def test_batches_hold_short_chunks(sizes):
+    chunks = [np.ones((size, 2)) * i for i, size in enumerate(sizes)]
+    merged = list(batches(iter(chunks), 10))
+    assert sum(map(len, merged)) == sum(sizes)
+    # only a file smaller than min_rows can give a short batch
+    assert all(len(batch) >= min(10, sum(sizes)) for batch in merged)
+    assert np.array_equal(np.concatenate(merged), np.concatenate(chunks))
+
+
+@pytest.mark.parametrize("n_rows,chunksize", [(25, 7), (23, 10), (13, 3), (5, 2)])
+def test_fit_with_chunks_shorter_than_the_components(tmp_path, n_rows, chunksize):
+    path = write_features(tmp_path / "features.csv", n_rows)
+    clusterer = StreamingClusterer(n_components=10, n_clusters=3, chunksize=chunksize).fit(path)
+    assignments = pd.concat(clusterer.iter_assignments(path))
+    assert len(assignments) == n_rows
+    assert assignments["Cluster"].between(0, 2).all()
@@ -0,0 +1,110 @@
+import time
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from common import load_script
+from synthetic import SyntheticChain
+
+import block_cache
+import graph_builder
+from input_resolution import SATOSHI_PER_BTC, OutpointResolver, btc_to_satoshi
+
+N_BLOCKS, TXS_PER_BLOCK = 6, 200
+
+
+def make_chain(verbosity=2):
+    # no `fee` field, so every fee has to come from resolved inputs
+    chain = SyntheticChain(txs_per_block=TXS_PER_BLOCK, verbosity=verbosity, with_fee=False)
+    return chain, chain.blocks(N_BLOCKS)
+
+
+def write_cache(folder, blocks):
+    cache = block_cache.get_cache(str(folder), "json")
+    for block in blocks:
+        cache.save(block, block["height"])
+    return str(folder)
+
+
+@pytest.mark.parametrize("verbosity", [2, 3])
+def test_serial_resolution_is_satoshi_exact(verbosity):
+    chain, blocks = make_chain(verbosity)
+    resolver = OutpointResolver()
+    totals = {"inputs": 0, "outputs": 0, "fees": 0}
+    for block in blocks:
+        for tx in block["tx"]:
+            inputs = [resolver.resolve_vin(vin) for vin in tx["vin"] if "coinbase" not in vin]
+            assert all(value is not None and address != "unknown" for value, address in inputs)
+            inputs_value = sum(value for value, _ in inputs)
+            outputs_value = sum(int(round(vout["value"] * SATOSHI_PER_BTC)) for vout in tx["vout"])
+            totals["inputs"] += inputs_value
+            totals["outputs"] += outputs_value
+            if inputs:
+                totals["fees"] += inputs_value - outputs_value
+            resolver.add_tx_outputs(tx)
+    assert totals == chain.totals
+
+
+@pytest.mark.parametrize("verbosity", [2, 3])
+def test_bulk_resolution_is_satoshi_exact(verbosity):
+    chain, blocks = make_chain(verbosity)
+    resolver = OutpointResolver()
+    totals = {"inputs": 0, "outputs": 0, "fees": 0}
+    for block in blocks:
+        parsed = graph_builder.parse_block_columns(block_cache.block_to_columns(block))
+        graph_builder.resolve_parsed(parsed, resolver)
+        inputs = parsed["edge_direction"] == graph_builder.INPUT
+        assert "unknown" not in [address for address, is_input in zip(parsed["edge_address"], inputs.tolist()) if is_input]
+        totals["inputs"] += int(parsed["edge_value"][inputs].sum())
+        totals["outputs"] += int(parsed["tx_outputs"].sum())
+        totals["fees"] += int(btc_to_satoshi(parsed["tx_props"][:, 6]).sum())
+    assert totals == chain.totals
+
+
+def test_value_conversion_is_not_slower_than_before():
+    _, blocks = make_chain()
+    values = [vout["value"] for block in blocks for tx in block["tx"] for vout in tx["vout"]]
+    start = time.perf_counter()
+    # the per-value conversion `process_transaction` used before the input resolution
+    [float(Decimal(value) / Decimal(100000000)) for value in values]
+    before = time.perf_counter() - start
+    start = time.perf_counter()
+    [int(round(value * SATOSHI_PER_BTC)) for value in values]
+    after = time.perf_counter() - start
+    assert after <= before
+
+
+def graph_totals(graph, reverse_map):
+    """
+    Exact input, output and fee totals of the transaction vertices, and the
+    number of input edges from the "unknown" placeholder.
+    """
+    tx_vertices = np.fromiter(reverse_map["transaction_dict"].values(), dtype=np.int64)
+    inputs = btc_to_satoshi(np.asarray(graph.vp["tx_inputs_value"].a)[tx_vertices])
+    outputs = btc_to_satoshi(np.asarray(graph.vp["tx_outputs_value"].a)[tx_vertices])
+    fees = btc_to_satoshi(np.asarray(graph.vp["tx_fee"].a)[tx_vertices])
+    has_inputs = inputs > 0
+    assert np.array_equal(inputs[has_inputs] - outputs[has_inputs], fees[has_inputs])
+    unknown = reverse_map["account_dict"].get("unknown")
+    unknown_inputs = 0 if unknown is None else graph.vertex(unknown).out_degree()
+    return {"inputs": int(inputs.sum()), "outputs": int(outputs.sum()), "fees": int(fees.sum())}, unknown_inputs
+
+
+@pytest.mark.parametrize("verbosity", [2, 3])
+def test_graph_builders_are_satoshi_exact(tmp_path, verbosity):
+    gt = pytest.importorskip("graph_tool.all")
+    graph_creation = load_script("raw_bitcoin_data_and_graph_creation/2_graph_creation.py")
+    chain, blocks = make_chain(verbosity)
+    folder = write_cache(tmp_path / "blocks", blocks)
+
+    serial = gt.Graph(directed=True)
+    graph_creation.add_graph_properties(serial)
+    graph_creation.traverse_folder(serial, folder)
+    assert graph_totals(serial, graph_creation.reverse_map) == (chain.totals, 0)
+
+    parallel = gt.Graph(directed=True)
+    graph_creation.add_graph_properties(parallel)
+    reverse_map = {}
+    graph_builder.build_graph_parallel(parallel, folder, reverse_map, workers=2)
+    assert graph_totals(parallel, reverse_map) == (chain.totals, 0)
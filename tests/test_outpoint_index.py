@@ -0,0 +1,37 @@
+from synthetic import SyntheticChain
+
+import block_cache
+from input_resolution import OutpointResolver
+from outpoint_index import OutpointIndex
+
+
+def spent_outpoints(block):
+    # what `2_graph_creation.process_block` prefetches before resolving the block's inputs
+    spent = [(vin.get("txid"), vin.get("vout")) for tx in block["tx"] for vin in tx["vin"] if "coinbase" not in vin]
+    return [txid for txid, _ in spent], [n for _, n in spent]
+
+
+def test_prefetched_block_resolves_without_single_lookups(tmp_path, monkeypatch):
+    blocks = SyntheticChain(txs_per_block=200, with_fee=False).blocks(8)
+    index = OutpointIndex(str(tmp_path / "outpoint_index"))
+    for block in blocks[:5]:
+        index.add_block(block_cache.block_to_columns(block))
+    index.flush()
+
+    expected, indexed = OutpointResolver(), index.resolver()
+    for block in blocks[:5]:
+        for tx in block["tx"]:
+            expected.add_tx_outputs(tx)
+
+    def single_lookup(txid, n):
+        raise AssertionError(f"single index lookup of {txid}:{n}")
+
+    monkeypatch.setattr(index, "get", single_lookup)
+    for block in blocks[5:]:
+        indexed.prefetch(*spent_outpoints(block))
+        for tx in block["tx"]:
+            for vin in tx["vin"]:
+                if "coinbase" not in vin:
+                    assert indexed.resolve_vin(vin) == expected.resolve_vin(vin) != (None, "unknown")
+            indexed.add_tx_outputs(tx)
+            expected.add_tx_outputs(tx)
@@ -0,0 +1,45 @@
+import logging
+
+import pytest
+
+from common import load_script
+from mock_rpc import MockBitcoinNode
+from synthetic import generate_blocks
+
+from rpc_client import BatchRpcClient, RpcError
+
+
+@pytest.fixture
+def mock_node():
+    blocks = generate_blocks(40, txs_per_block=5)
+    server = MockBitcoinNode(blocks, latency=0.01).serve()
+    yield [block["height"] for block in blocks], server.url
+    server.shutdown()
+
+
+def test_reused_client_grows_its_connection_pool(mock_node, caplog, monkeypatch):
+    heights, url = mock_node
+    get_block_data = load_script("raw_bitcoin_data_and_graph_creation/1_get_block_data.py")
+    monkeypatch.setattr(get_block_data, "rpc_url", url)
+    get_block_data.get_client(batch_size=2, max_workers=2)
+    client = get_block_data.get_client(batch_size=2, max_workers=8)
+    assert client.session.get_adapter(url)._pool_maxsize >= 8
+
+    with caplog.at_level(logging.WARNING, logger="urllib3.connectionpool"):
+        blocks = dict(client.iter_blocks(heights))
+    assert len(blocks) == 40
+    assert not [record for record in caplog.records if "Connection pool is full" in record.getMessage()]
+    client.close()
+
+
+def test_batch_rejected_as_a_whole_raises_rpc_error():
+    blocks = generate_blocks(10, txs_per_block=5)
+    server = MockBitcoinNode(blocks, max_batch=4).serve()
+    client = BatchRpcClient(server.url, batch_size=8)
+    try:
+        with pytest.raises(RpcError, match="Batch too large"):
+            client.fetch_block_batch([block["height"] for block in blocks[:8]])
+        assert len(client.fetch_block_batch([block["height"] for block in blocks[:4]])) == 4
+    finally:
+        client.close()
+        server.shutdown()
@@ -0,0 +1,28 @@
+import pytest
+
+from common import load_script
+from mock_walletexplorer import MockWalletExplorer
+
+
+@pytest.fixture
+def site():
+    site = MockWalletExplorer(wallets_per_category=3, addresses_per_wallet=10, latency=0)
+    server = site.serve()
+    yield site, server.url
+    server.shutdown()
+
+
+def test_wallet_without_csv_link_counts_as_failed(site, tmp_path, capsys):
+    site, url = site
+    scraper = load_script("labelled_addresses_scraper/1_walletexplorer_scraper.py")
+    site.without_csv_link.add(site.wallets["Exchanges"][1])
+
+    changed = scraper.scrape(url, str(tmp_path), workers=2, rate=1000.0)
+
+    total = sum(len(names) for names in site.wallets.values())
+    assert sum(len(files) for files in changed.values()) == total - 1
+    assert "1 failed." in capsys.readouterr().out
+    # the other wallets were still recorded, so the next run skips them
+    manifest = scraper.ScrapeManifest(str(tmp_path / "manifest.json"))
+    assert sum(manifest.is_fresh(f"{category}/{name}", 3600)
+               for category, names in site.wallets.items() for name in names) == total - 1
@@ -1,7 +1,15 @@
+import argparse
 import os
+import sys
 import pandas as pd
 from collections import defaultdict
 
+# helper modules such as the run instrumentation and address clustering live with the pipeline scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'raw_bitcoin_data_and_graph_creation'))
+from bloom_filter import load_index_filters, load_label_filters, might_be_labelled
+from instrumentation import recorder
+from label_index import CATEGORIES, LabelIndex, load_label_index
+
 def load_labeled_addresses(csv_folder, labels):
     """
     Load labeled addresses from CSV files for different business sectors.
@@ -17,48 +25,144 @@ def load_labeled_addresses(csv_folder, labels):
 
     for label in labels:
         file_path = os.path.join(csv_folder, f'{label}_addresses.csv')
-        df_addresses = pd.read_csv(file_path)
+        df_addresses = pd.read_csv(file_path, usecols=['address'], dtype=str)
         labeled_addresses[label].update(df_addresses['address'].tolist())
 
     return labeled_addresses
 
-def map_transactions_to_labels(transactions_csv, labeled_addresses):
+def build_address_label_table(labeled_addresses):
     """
-    Map transactions to labels based on the associated addresses.
+    Builds one address -> label lookup table from the per-label address sets.
+
+    An address listed under several labels keeps the first label in the order of
+    `labeled_addresses` (the order of `labels` given to `load_labeled_addresses`),
+    which is the label `map_address_to_label` returns for it.
 
     Args:
-    - transactions_csv (str): File path of the CSV containing transaction-address data.
     - labeled_addresses (dict): Dictionary with labels as keys and sets of addresses as values.
 
     Returns:
-    - pd.DataFrame: DataFrame with transactions and their corresponding labels.
+    - pd.Series: Categorical labels indexed by address.
+    """
+    labels = list(labeled_addresses)
+    frames = [pd.DataFrame({'Address': list(addresses), 'Label': label})
+              for label, addresses in labeled_addresses.items()]
+    if not frames:
+        return pd.Series([], index=pd.Index([], name='Address'), dtype=pd.CategoricalDtype(labels), name='Label')
+    table = pd.concat(frames, ignore_index=True).drop_duplicates('Address', keep='first')
+    return pd.Series(pd.Categorical(table['Label'], categories=labels), index=table['Address'], name='Label')
+
+def build_cluster_label_table(label_table, clusters):
     """
-    df_transactions = pd.read_csv(transactions_csv)
+    Spreads the address labels to the address clusters they fall in.
 
-    labeled_transactions = []
+    A cluster containing addresses of several labels keeps the first label in
+    label order, like `build_address_label_table`.
 
-    for index, row in df_transactions.iterrows():
-        txid = row['Transaction ID']
-        address = row['Address']
-        label = map_address_to_label(address, labeled_addresses)
-        if label:
-            labeled_transactions.append((txid, label))
+    Args:
+    - label_table (pd.Series): Output of `build_address_label_table`.
+    - clusters (AddressClusters): Address -> cluster id mapping from `address_clustering.py`.
+
+    Returns:
+    - pd.Series: Categorical labels indexed by cluster id.
+    """
+    cluster_ids = clusters.lookup_many(label_table.index.tolist())
+    table = pd.DataFrame({'Cluster': cluster_ids, 'Label': label_table.to_numpy()})
+    table = table[table['Cluster'] >= 0].sort_values('Label', kind='stable').drop_duplicates('Cluster', keep='first')
+    return pd.Series(table['Label'].to_numpy(), index=table['Cluster'].to_numpy(), name='Label')
+
+def map_transactions_to_labels(transactions_csv, labeled_addresses, chunksize=5_000_000, clusters=None,
+                               wallets=False, filters=None):
+    """
+    Map transactions to labels based on the associated addresses.
 
-    df_labeled_transactions = pd.DataFrame(labeled_transactions, columns=['tx_hash', 'Label'])
+    The transaction-address CSV is read in chunks and each chunk is labelled with
+    one vectorized lookup against the address -> label table.
+
+    Args:
+    - transactions_csv (str): File path of the CSV containing transaction-address data.
+    - labeled_addresses (dict or LabelIndex): Dictionary with labels as keys and sets of
+      addresses as values, or the address -> (category, wallet) index of `label_index.py`.
+    - chunksize (int): Number of CSV rows labelled at a time.
+    - clusters (AddressClusters): If given, addresses without a label of their own take
+      the label of their address cluster.
+    - wallets (bool): Add a `Wallet` column with the wallet name of each labelled address
+      (requires a LabelIndex; missing for rows labelled through their cluster).
+    - filters (dict): Bloom filters per label, built from the same source as `labeled_addresses`
+      (`bloom_filter.load_label_filters` for the sets, `load_index_filters` for a LabelIndex).
+      Only addresses that one of them may contain are looked up; the labels are unchanged.
+
+    Returns:
+    - pd.DataFrame: DataFrame with transactions and their corresponding labels.
+    """
+    label_index = labeled_addresses if isinstance(labeled_addresses, LabelIndex) else None
+    if wallets and label_index is None:
+        raise ValueError("wallet names need a LabelIndex")
+    if label_index is not None:
+        # the index is only materialized as a Series when cluster labels are derived from it
+        label_table = label_index.label_table() if clusters is not None else None
+        categories = label_index.categories
+    else:
+        label_table = build_address_label_table(labeled_addresses)
+        categories = label_table.cat.categories
+    cluster_label_table = build_cluster_label_table(label_table, clusters) if clusters is not None else None
+    if filters is not None:
+        # a label without a filter would have all its addresses rejected
+        missing = [label for label in categories if label not in filters]
+        if missing:
+            raise ValueError(f"no prefilter for the labels {missing}")
+
+    labeled_chunks = []
+    for chunk in pd.read_csv(transactions_csv, usecols=['Transaction ID', 'Address'], dtype=str, chunksize=chunksize):
+        recorder.count('rows', len(chunk))
+        addresses = chunk['Address']
+        if filters is not None:
+            addresses = addresses[might_be_labelled(filters, addresses)]
+            recorder.count('candidate_rows', len(addresses))
+        if wallets:
+            labels, wallet_names = label_index.labels(addresses, wallets=True)
+            wallet_names = wallet_names.reindex(chunk.index)
+        elif label_index is not None:
+            labels = label_index.labels(addresses)
+        else:
+            labels = addresses.map(label_table)
+        # rows rejected by the filters are unlabelled
+        labels = labels.reindex(chunk.index)
+        if cluster_label_table is not None:
+            unlabeled = labels.isna()
+            cluster_ids = pd.Series(clusters.lookup_many(chunk.loc[unlabeled, 'Address'].tolist()),
+                                    index=labels.index[unlabeled])
+            labels = labels.astype(object)
+            labels[unlabeled] = cluster_ids.map(cluster_label_table)
+        matched = labels.notna()
+        labeled_chunk = pd.DataFrame({'tx_hash': chunk.loc[matched, 'Transaction ID'].to_numpy(),
+                                      'Label': labels[matched].to_numpy()})
+        if wallets:
+            labeled_chunk['Wallet'] = wallet_names[matched].astype(object).to_numpy()
+        labeled_chunks.append(labeled_chunk)
+
+    if not labeled_chunks:
+        return pd.DataFrame(columns=['tx_hash', 'Label'] + (['Wallet'] if wallets else []))
+    df_labeled_transactions = pd.concat(labeled_chunks, ignore_index=True)
+    df_labeled_transactions['Label'] = pd.Categorical(df_labeled_transactions['Label'], categories=categories)
     return df_labeled_transactions
 
-def map_address_to_label(address, labeled_addresses):
+def map_address_to_label(address, labeled_addresses, filters=None):
     """
     Maps a single address to its respective label based on labeled addresses data.
 
     Args:
     - address (str): The address to be labeled.
     - labeled_addresses (dict): A dictionary mapping labels to sets of addresses.
+    - filters (dict): Bloom filters per label; a label whose filter rejects the
+      address is not checked.
 
     Returns:
     - str or None: The label if found, else None.
     """
     for label, addresses in labeled_addresses.items():
+        if filters is not None and address not in filters[label]:
+            continue
         if address in addresses:
             return label
     return None
@@ -75,16 +179,51 @@ def save_labeled_transactions(df, output_file):
     print(f"Labeled transactions saved to {output_file}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Label the transactions of txid_addresses.csv.")
+    parser.add_argument("--prefilter-fp-rate", type=float,
+                        help="put per-label Bloom prefilters with this false positive rate in front of the "
+                             "exact lookup (default: exact lookup only)")
+    args = parser.parse_args()
+
     csv_folder = "2_collecting_scraped_addresses"
     
-    labels = ['Exchanges', 'Pools', 'Services_others', 'Gambling']
+    labels = CATEGORIES
+
+    # written by 2_addresses_collection_from_scraped_csv.py; replaces the per-label CSVs when present
+    label_index_folder = "labelled_addresses_scraper/label_index"
+
+    # false positive rate of the per-label Bloom prefilters, saved next to the label index or the CSVs;
+    # None labels without them
+    prefilter_fp_rate = args.prefilter_fp_rate
 
     transactions_csv = "1_bitcoin_data_fetch_and_graph_creation/txid_addresses.csv"
 
-    output_file = "labeled_transactions.csv"
+    # written by address_clustering.py next to revmap.pkl; labels are spread to whole clusters when present
+    clusters_folder = "raw_bitcoin_data_and_graph_creation/address_clusters"
 
-    labeled_addresses = load_labeled_addresses(csv_folder, labels)
+    output_file = "labeled_transactions.csv"
 
-    df_labeled_transactions = map_transactions_to_labels(transactions_csv, labeled_addresses)
+    with recorder.stage('labelling'):
+        if os.path.isdir(label_index_folder):
+            labeled_addresses = load_label_index(label_index_folder)
+        else:
+            labeled_addresses = load_labeled_addresses(csv_folder, labels)
+
+        clusters = None
+        if os.path.isdir(clusters_folder):
+            from address_clustering import load_clusters
+            clusters = load_clusters(clusters_folder)
+
+        # the filters are built from the same addresses as the exact lookup
+        filters = None
+        if prefilter_fp_rate is not None and isinstance(labeled_addresses, LabelIndex):
+            filters = load_index_filters(label_index_folder, prefilter_fp_rate)
+        elif prefilter_fp_rate is not None:
+            filters = load_label_filters(csv_folder, labels, prefilter_fp_rate)
+
+        df_labeled_transactions = map_transactions_to_labels(transactions_csv, labeled_addresses, clusters=clusters,
+                                                             wallets=isinstance(labeled_addresses, LabelIndex),
+                                                             filters=filters)
+        recorder.count('labeled_rows', len(df_labeled_transactions))
 
     save_labeled_transactions(df_labeled_transactions, output_file)